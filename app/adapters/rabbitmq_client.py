@@ -1,7 +1,7 @@
 """RabbitMQ client adapter for connection and queue operations."""
 import pika
 import pika.exceptions
-from typing import Optional
+from typing import Any, Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -67,14 +67,16 @@ class RabbitMQClient:
         queue_name: str,
         durable: bool = True,
         exclusive: bool = False,
-        auto_delete: bool = False
+        auto_delete: bool = False,
+        arguments: Optional[Dict[str, Any]] = None
     ) -> None:
         channel = self.get_channel()
         channel.queue_declare(
             queue=queue_name,
             durable=durable,
             exclusive=exclusive,
-            auto_delete=auto_delete
+            auto_delete=auto_delete,
+            arguments=arguments
         )
         logger.info(f"Queue '{queue_name}' declared")
     
@@ -107,13 +109,16 @@ class RabbitMQClient:
         logger.info(f"Queue '{queue_name}' bound to exchange '{exchange_name}' with routing key '{routing_key}'")
     
     def close(self) -> None:
-        if self._channel and not self._channel.is_closed:
-            self._channel.close()
-            self._channel = None
-        
-        if self._connection and not self._connection.is_closed:
-            self._connection.close()
-            self._connection = None
+        # References are dropped even if closing fails (e.g. the connection
+        # already broke), so the next get_channel() reconnects from scratch.
+        channel, self._channel = self._channel, None
+        connection, self._connection = self._connection, None
+        try:
+            if channel and not channel.is_closed:
+                channel.close()
+        finally:
+            if connection and not connection.is_closed:
+                connection.close()
         
         logger.info("RabbitMQ connection closed")
 
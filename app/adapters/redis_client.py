@@ -1,6 +1,15 @@
 """Redis client adapter for connection and operations"""
+import hashlib
+from functools import lru_cache
 import redis.asyncio as aioredis
-from typing import Optional
+from redis.exceptions import NoScriptError
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+@lru_cache(maxsize=None)
+def script_sha(script: str) -> str:
+    """SHA1 digest Redis caches a Lua script under"""
+    return hashlib.sha1(script.encode("utf-8")).hexdigest()
 
 
 class RedisClient:
@@ -99,6 +108,377 @@ class RedisClient:
         client = await self._get_client()
         return await client.delete(key)
     
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        """
+        Get all fields of a hash
+        
+        Args:
+            key: Redis key
+            
+        Returns:
+            Field to value mapping (empty if the key does not exist)
+        """
+        client = await self._get_client()
+        return await client.hgetall(key)
+    
+    async def hset(
+        self,
+        key: str,
+        mapping: Dict[str, Any],
+        expire: Optional[int] = None
+    ) -> None:
+        """
+        Set several hash fields, optionally refreshing the key's expiry
+        
+        Args:
+            key: Redis key
+            mapping: Fields and values to set
+            expire: Optional expiration time in seconds
+        """
+        client = await self._get_client()
+        pipe = client.pipeline(transaction=True)
+        pipe.hset(key, mapping=mapping)
+        if expire:
+            pipe.expire(key, expire)
+        await pipe.execute()
+    
+    async def zrangebyscore(
+        self,
+        key: str,
+        min_score: Any,
+        max_score: Any,
+        start: Optional[int] = None,
+        num: Optional[int] = None
+    ) -> List[str]:
+        """
+        Get sorted set members with scores in a range, lowest first
+        
+        Args:
+            key: Redis key of the sorted set
+            min_score: Lower bound (inclusive, or "-inf")
+            max_score: Upper bound (inclusive, or "+inf")
+            start: Optional offset for paging (requires num)
+            num: Optional maximum number of members
+            
+        Returns:
+            Matching members
+        """
+        client = await self._get_client()
+        return await client.zrangebyscore(key, min_score, max_score, start=start, num=num)
+    
+    async def sadd(
+        self,
+        key: str,
+        members: Sequence[str],
+        expire: Optional[int] = None
+    ) -> int:
+        """
+        Add members to a set, optionally refreshing the key's expiry
+        
+        Args:
+            key: Redis key of the set
+            members: Members to add
+            expire: Optional expiration time in seconds
+            
+        Returns:
+            Number of members that were not already in the set
+        """
+        client = await self._get_client()
+        pipe = client.pipeline(transaction=True)
+        pipe.sadd(key, *members)
+        if expire:
+            pipe.expire(key, expire)
+        return (await pipe.execute())[0]
+    
+    async def smismember(self, key: str, members: Sequence[str]) -> List[bool]:
+        """
+        Check which members belong to a set
+        
+        Args:
+            key: Redis key of the set
+            members: Members to check
+            
+        Returns:
+            Whether each member is in the set, in order
+        """
+        client = await self._get_client()
+        return [bool(found) for found in await client.smismember(key, members)]
+    
+    async def srem(self, key: str, members: Sequence[str]) -> int:
+        """
+        Remove members from a set
+        
+        Args:
+            key: Redis key of the set
+            members: Members to remove
+            
+        Returns:
+            Number of members that were removed
+        """
+        client = await self._get_client()
+        return await client.srem(key, *members)
+    
+    async def sscan(
+        self,
+        key: str,
+        cursor: int = 0,
+        count: Optional[int] = None
+    ) -> Tuple[int, List[str]]:
+        """
+        Run one incremental SSCAN step over a set
+        
+        Args:
+            key: Redis key of the set
+            cursor: Cursor returned by the previous step (0 to start)
+            count: Hint for how many members to return in this step
+            
+        Returns:
+            The next cursor (0 when the iteration is complete) and the members found
+        """
+        client = await self._get_client()
+        return await client.sscan(key, cursor=cursor, count=count)
+    
+    async def scan(
+        self,
+        cursor: int = 0,
+        match: Optional[str] = None,
+        count: Optional[int] = None
+    ) -> Tuple[int, List[str]]:
+        """
+        Run one incremental SCAN step
+        
+        Args:
+            cursor: Cursor returned by the previous step (0 to start)
+            match: Optional glob pattern keys must match
+            count: Hint for how many keys to examine in this step
+            
+        Returns:
+            The next cursor (0 when the iteration is complete) and the keys found
+        """
+        client = await self._get_client()
+        return await client.scan(cursor=cursor, match=match, count=count)
+    
+    async def eval_script(
+        self,
+        script: str,
+        keys: Sequence[str],
+        args: Sequence[Any]
+    ) -> Any:
+        """
+        Run a Lua script atomically on the server
+        
+        Only the script's SHA1 is sent (EVALSHA); the source is loaded
+        once if the server does not have it cached.
+        
+        Args:
+            script: Lua source
+            keys: Keys the script touches (KEYS)
+            args: Extra script arguments (ARGV)
+            
+        Returns:
+            The script's return value
+        """
+        return (await self.eval_script_many(script, [(keys, args)]))[0]
+    
+    async def eval_script_many(
+        self,
+        script: str,
+        calls: Sequence[Tuple[Sequence[str], Sequence[Any]]]
+    ) -> List[Any]:
+        """
+        Run a Lua script once per call, pipelined in one round trip
+        
+        Every call sends only the script's SHA1 (EVALSHA). If the server
+        does not have the script cached, none of the calls ran: the source
+        is loaded and the batch sent again.
+        
+        Args:
+            script: Lua source
+            calls: (keys, args) of each run
+            
+        Returns:
+            Each run's return value, in order
+        """
+        client = await self._get_client()
+        sha = script_sha(script)
+        for attempt in range(2):
+            pipe = client.pipeline(transaction=False)
+            for keys, args in calls:
+                pipe.evalsha(sha, len(keys), *keys, *args)
+            try:
+                return await pipe.execute()
+            except NoScriptError:
+                if attempt:
+                    raise
+                await client.script_load(script)
+    
+    async def load_scripts(self, scripts: Sequence[str]) -> List[str]:
+        """
+        Load Lua scripts into the server's script cache in one round trip
+        
+        Later EVALs of the same source skip compiling them.
+        
+        Args:
+            scripts: Lua sources
+            
+        Returns:
+            The scripts' SHA1 digests, in order
+        """
+        client = await self._get_client()
+        pipe = client.pipeline(transaction=False)
+        for script in scripts:
+            pipe.script_load(script)
+        return await pipe.execute()
+    
+    async def xadd(
+        self,
+        stream: str,
+        fields: Dict[str, str],
+        maxlen: Optional[int] = None
+    ) -> str:
+        """
+        Append an entry to a stream
+        
+        Args:
+            stream: Stream key
+            fields: Entry fields
+            maxlen: Approximate length to trim the stream to (MAXLEN ~)
+            
+        Returns:
+            The new entry's id
+        """
+        client = await self._get_client()
+        return await client.xadd(stream, fields, maxlen=maxlen, approximate=True)
+    
+    async def xgroup_create(self, stream: str, group: str, start_id: str = "$") -> bool:
+        """
+        Create a consumer group (and the stream, if missing)
+        
+        Args:
+            stream: Stream key
+            group: Consumer group name
+            start_id: First entry the group delivers ("$" for new entries only)
+            
+        Returns:
+            True if the group was created, False if it already existed
+        """
+        client = await self._get_client()
+        try:
+            await client.xgroup_create(stream, group, id=start_id, mkstream=True)
+        except aioredis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+            return False
+        return True
+    
+    async def xreadgroup(
+        self,
+        stream: str,
+        group: str,
+        consumer: str,
+        count: int,
+        block_ms: Optional[int] = None
+    ) -> List[Tuple[str, Dict[str, str]]]:
+        """
+        Read entries never delivered to the group
+        
+        Args:
+            stream: Stream key
+            group: Consumer group name
+            consumer: This consumer's name within the group
+            count: Maximum number of entries to read
+            block_ms: How long to wait for entries when there are none
+            
+        Returns:
+            (entry id, fields) pairs
+        """
+        client = await self._get_client()
+        response = await client.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block_ms)
+        return response[0][1] if response else []
+    
+    async def xautoclaim(
+        self,
+        stream: str,
+        group: str,
+        consumer: str,
+        min_idle_ms: int,
+        start_id: str = "0-0",
+        count: Optional[int] = None
+    ) -> Tuple[str, List[Tuple[str, Optional[Dict[str, str]]]]]:
+        """
+        Take over entries pending in the group for longer than `min_idle_ms`
+        
+        Args:
+            stream: Stream key
+            group: Consumer group name
+            consumer: Consumer that takes the entries over
+            min_idle_ms: Minimum time since the entries were last delivered
+            start_id: Id to resume scanning the pending list from
+            count: Maximum number of entries to claim
+            
+        Returns:
+            The id to continue from ("0-0" when the scan is complete) and the
+            claimed (entry id, fields) pairs; fields are None for entries
+            trimmed from the stream meanwhile
+        """
+        client = await self._get_client()
+        response = await client.xautoclaim(
+            stream, group, consumer, min_idle_ms, start_id=start_id, count=count
+        )
+        return response[0], response[1]
+    
+    async def xpending_range(
+        self,
+        stream: str,
+        group: str,
+        min_id: str,
+        max_id: str,
+        count: int,
+        consumer: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        List pending entries with their delivery counts
+        
+        Args:
+            stream: Stream key
+            group: Consumer group name
+            min_id: Smallest entry id to include
+            max_id: Largest entry id to include
+            count: Maximum number of entries to return
+            consumer: Only entries pending for this consumer
+            
+        Returns:
+            Dicts with message_id, consumer, time_since_delivered and
+            times_delivered
+        """
+        client = await self._get_client()
+        return await client.xpending_range(
+            stream, group, min=min_id, max=max_id, count=count, consumername=consumer
+        )
+    
+    async def pipeline(self, transaction: bool = False) -> aioredis.client.Pipeline:
+        """
+        Create a pipeline for batching several commands in one round trip
+        
+        Args:
+            transaction: Wrap the batch in MULTI/EXEC
+            
+        Returns:
+            A pipeline bound to this client
+        """
+        client = await self._get_client()
+        return client.pipeline(transaction=transaction)
+    
+    async def pubsub(self) -> aioredis.client.PubSub:
+        """
+        Create a Pub/Sub connection for subscribing to channels
+        
+        Returns:
+            A PubSub object; close it with aclose() when done
+        """
+        client = await self._get_client()
+        return client.pubsub()
+    
     async def close(self):
         """Close Redis connection"""
         if self._client:
@@ -0,0 +1,170 @@
+"""HTTP webhook gateway on a shared, pooled `httpx.AsyncClient`."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Mapping, Optional, Sequence
+from urllib.parse import quote
+
+import httpx
+
+from app.core.gateway import (
+    Gateway,
+    GatewayThrottledError,
+    GatewayUnavailableError,
+    Notification,
+)
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_response(response: httpx.Response) -> bool:
+    """Map an HTTP response onto the `Gateway` contract.
+
+    2xx is a delivery. 429/503 raise `GatewayThrottledError` and other 5xx
+    and 408 raise `GatewayUnavailableError`, both worth retrying. Any other
+    status is a permanent rejection of the payload and returns False.
+    """
+    status = response.status_code
+    if 200 <= status < 300:
+        return True
+    if status in THROTTLE_STATUS_CODES:
+        raise GatewayThrottledError(
+            f"Webhook throttled with HTTP {status}",
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+    if status >= 500 or status == 408:
+        raise GatewayUnavailableError(f"Webhook unavailable: HTTP {status}")
+    logger.warning(
+        "Webhook rejected notification: HTTP %d %s",
+        status,
+        response.text[:200],
+        extra={"event": "webhook.rejected", "status": status}
+    )
+    return False
+
+
+class WebhookGateway(Gateway):
+    """POST notifications as JSON to a webhook.
+
+    Every send goes through one `httpx.AsyncClient`, so connections (and
+    their TLS sessions) are reused from a bounded keep-alive pool and, with
+    `http2`, many sends share one multiplexed connection per host.
+    `max_per_host` caps concurrent requests to any single host so one slow
+    endpoint cannot take the whole pool.
+
+    `url` may contain `{user_id}` and `{notification_type}` placeholders.
+    The client is created on first use, so it binds to the event loop the
+    gateway is used from.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        batch_url: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry_seconds: float = 30.0,
+        max_per_host: int = 20,
+        timeout_seconds: float = 5.0,
+        connect_timeout_seconds: float = 2.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.url = url
+        self.batch_url = batch_url
+        self.max_per_host = max_per_host
+        self._client_options = dict(
+            headers=dict(headers or {}),
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds),
+            transport=transport,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(**self._client_options)
+        return self._client
+
+    @staticmethod
+    def payload(notification: Notification) -> dict:
+        return {
+            "user_id": notification.user_id,
+            "type": notification.notification_type,
+            "message": notification.message,
+        }
+
+    async def _post(self, url: str, json: object) -> httpx.Response:
+        host = httpx.URL(url).host
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        async with slots:
+            try:
+                return await self.client.post(url, json=json)
+            except httpx.TransportError as e:
+                # Timeouts, refused connections, protocol errors: all transient.
+                raise GatewayUnavailableError(f"Webhook request failed: {e!r}") from e
+
+    async def send(self, notification: Notification) -> bool:
+        # Escaped so an id cannot add path segments, a query or another host.
+        url = self.url.format(
+            user_id=quote(notification.user_id, safe=""),
+            notification_type=quote(notification.notification_type, safe=""),
+        )
+        response = await self._post(url, self.payload(notification))
+        return classify_response(response)
+
+    async def send_batch(self, notifications: Sequence[Notification]) -> List[bool]:
+        """POST several notifications as one JSON array to `batch_url`.
+
+        The endpoint may answer with {"results": [bool, ...]} to report
+        per-notification outcomes; otherwise a 2xx counts for all of them.
+        """
+        if self.batch_url is None:
+            raise ValueError("send_batch needs a batch_url")
+        if not notifications:
+            return []
+
+        response = await self._post(self.batch_url, [self.payload(n) for n in notifications])
+        if not classify_response(response):
+            return [False] * len(notifications)
+        try:
+            results = response.json().get("results")
+        except (ValueError, AttributeError):
+            results = None
+        if isinstance(results, list) and len(results) == len(notifications):
+            return [bool(result) for result in results]
+        return [True] * len(notifications)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -15,6 +15,168 @@ class Settings(BaseSettings):
     RABBITMQ_USER: str = "admin"
     RABBITMQ_PASS: str = "admin"
     
+    # Rate limiting: when Redis errors or is slower than the latency budget,
+    # each instance enforces 1/RATE_LIMIT_INSTANCE_COUNT of every rule locally
+    # and probes Redis every REDIS_PROBE_INTERVAL_SECONDS to switch back
+    RATE_LIMIT_INSTANCE_COUNT: int = 1
+    REDIS_LATENCY_BUDGET_MS: int = 50
+    REDIS_PROBE_INTERVAL_SECONDS: float = 5.0
+    
+    # Tenants: messages with a tenant_id are limited under that tenant's rule
+    # set, the default rules with TENANT_RULES[tenant] applied (a type maps to
+    # {"max_count": ..., "time_window_seconds": ...} or to null to lift its
+    # limit). A tenant's Redis keys are prefixed with "{tenant}:" so Redis
+    # Cluster keeps them in one slot
+    TENANT_RULES: Dict[str, Dict[str, Optional[Dict[str, Any]]]] = {}
+    
+    # Quota introspection: how long per-user quotas are cached locally and
+    # how many users a batch request may ask for
+    QUOTA_CACHE_TTL_SECONDS: float = 1.0
+    QUOTA_BATCH_MAX_USERS: int = 1000
+    
+    # Bulk limiter resets: keys per SCAN/UNLINK batch and pause between
+    # batches, so maintenance never monopolises Redis
+    RATE_LIMIT_RESET_BATCH_SIZE: int = 500
+    RATE_LIMIT_RESET_PAUSE_SECONDS: float = 0.01
+    
+    # Digests: notification types whose over-limit messages are buffered
+    # (up to DIGEST_MAX_MESSAGES each) and sent as one combined notification
+    # when the window reopens
+    RATE_LIMIT_DIGEST_TYPES: List[str] = []
+    DIGEST_MAX_MESSAGES: int = 20
+    DIGEST_FLUSH_INTERVAL_SECONDS: float = 5.0
+    # Failed digest deliveries are retried after DIGEST_FLUSH_INTERVAL_SECONDS,
+    # doubling per attempt up to DIGEST_MAX_BACKOFF_SECONDS, and dropped
+    # after DIGEST_MAX_ATTEMPTS
+    DIGEST_MAX_ATTEMPTS: int = 5
+    DIGEST_MAX_BACKOFF_SECONDS: float = 3600.0
+    
+    # Delivery channels: NOTIFICATION_ROUTES maps a notification type to the
+    # channels it is sent on (e.g. {"status": ["webhook"], "news": ["mock", "webhook"]});
+    # types without a route go to DEFAULT_CHANNELS
+    NOTIFICATION_ROUTES: Dict[str, List[str]] = {}
+    DEFAULT_CHANNELS: List[str] = ["mock"]
+    
+    # Webhook channel: notifications are POSTed as JSON to WEBHOOK_URL
+    # (may contain {user_id}/{notification_type}) over one pooled HTTP/2
+    # client; WEBHOOK_MAX_PER_HOST caps concurrent requests to one host
+    WEBHOOK_URL: Optional[str] = None
+    WEBHOOK_BATCH_URL: Optional[str] = None
+    WEBHOOK_HTTP2: bool = True
+    WEBHOOK_MAX_CONNECTIONS: int = 100
+    WEBHOOK_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    WEBHOOK_MAX_PER_HOST: int = 20
+    WEBHOOK_TIMEOUT_SECONDS: float = 5.0
+    WEBHOOK_CONNECT_TIMEOUT_SECONDS: float = 2.0
+    
+    # Gateway send-rate control (per channel): when enabled, sends are paced at a rate
+    # (per second) that grows by GATEWAY_RATE_INCREASE per second of
+    # successful sends and is multiplied by GATEWAY_RATE_DECREASE_FACTOR
+    # whenever the provider throttles us
+    GATEWAY_RATE_CONTROL: bool = False
+    GATEWAY_INITIAL_RATE: float = 50.0
+    GATEWAY_MIN_RATE: float = 1.0
+    GATEWAY_MAX_RATE: float = 1000.0
+    GATEWAY_RATE_INCREASE: float = 1.0
+    GATEWAY_RATE_DECREASE_FACTOR: float = 0.5
+    
+    # Fan-out messages: recipients expanded per chunk, and how long progress
+    # checkpoints are kept for resuming a redelivered fan-out
+    FANOUT_CHUNK_SIZE: int = 500
+    FANOUT_CHECKPOINT_TTL_SECONDS: int = 86400
+    
+    # Retry configuration: backoff tiers (seconds) for transient failures and
+    # how many retries a message gets before it is dead-lettered
+    RETRY_DELAYS_SECONDS: List[int] = [5, 30, 300]
+    MAX_RETRIES: int = 5
+    
+    # Ingress transport: "rabbitmq", "redis-streams" or "in-process". The
+    # in-process transport takes notifications from POST /notifications into
+    # a queue of INPROCESS_QUEUE_SIZE (submitters wait up to
+    # INPROCESS_SUBMIT_TIMEOUT_SECONDS for room) served by
+    # INPROCESS_CONCURRENCY workers; it is not durable. The stream consumer
+    # reads STREAM_BATCH_SIZE entries at a time through a consumer group;
+    # entries left unacknowledged for STREAM_CLAIM_IDLE_MS are claimed and
+    # retried, and dead-lettered after MAX_RETRIES retries. Producers trim
+    # the stream to about STREAM_MAX_LEN entries
+    CONSUMER_TRANSPORT: str = "rabbitmq"
+    STREAM_NAME: str = "notifications"
+    STREAM_GROUP: str = "notification-service"
+    STREAM_BATCH_SIZE: int = 100
+    STREAM_BLOCK_MS: int = 1000
+    STREAM_CLAIM_IDLE_MS: int = 60000
+    STREAM_MAX_LEN: int = 100000
+    INPROCESS_QUEUE_SIZE: int = 10000
+    INPROCESS_CONCURRENCY: int = 100
+    INPROCESS_SUBMIT_TIMEOUT_SECONDS: float = 1.0
+    
+    # Consumer prefetch (= concurrent messages per consumer): "fixed" uses
+    # PREFETCH_COUNT; "adaptive" starts there and tunes it within
+    # PREFETCH_MIN..PREFETCH_MAX every PREFETCH_ADJUST_INTERVAL_SECONDS
+    PREFETCH_MODE: str = "fixed"
+    PREFETCH_COUNT: int = 1
+    PREFETCH_MIN: int = 1
+    PREFETCH_MAX: int = 64
+    PREFETCH_ADJUST_INTERVAL_SECONDS: float = 5.0
+    
+    # Consumer supervision: reconnect backoff after a broker/network failure
+    # (full jitter, doubling from the initial delay up to the maximum)
+    CONSUMER_RECONNECT_INITIAL_BACKOFF_SECONDS: float = 1.0
+    CONSUMER_RECONNECT_MAX_BACKOFF_SECONDS: float = 60.0
+    
+    # Startup: after the app starts serving, Redis connections are opened and
+    # Lua scripts loaded, and the transport connects; each step gets up to
+    # WARMUP_TIMEOUT_SECONDS. GET /health/ready answers 503 until then
+    WARMUP_TIMEOUT_SECONDS: float = 10.0
+    
+    # Shutdown: how long in-flight messages may keep running after a stop is
+    # requested before they are cancelled and requeued
+    SHUTDOWN_DRAIN_TIMEOUT_SECONDS: float = 20.0
+    
+    # User preferences: opt-outs per user and type (Redis hashes prefs:<user_id>)
+    # are checked before the limiter; lookups are cached for
+    # PREFERENCES_CACHE_TTL_SECONDS and evicted at once via pub/sub on updates
+    PREFERENCES_ENABLED: bool = True
+    PREFERENCES_CACHE_TTL_SECONDS: float = 60.0
+    PREFERENCES_CACHE_MAX_ENTRIES: int = 100000
+    
+    # Heavy hitters: when enabled, send attempts per (user, type) are counted
+    # in a fixed-size count-min sketch (HEAVY_HITTERS_WIDTH x HEAVY_HITTERS_DEPTH
+    # counters) per HEAVY_HITTERS_WINDOW_SECONDS window, merged across
+    # instances through Redis every HEAVY_HITTERS_SYNC_INTERVAL_SECONDS, and the
+    # top HEAVY_HITTERS_TOP_K served at GET /heavy-hitters. With
+    # HEAVY_HITTERS_REJECT_FACTOR set, users sending more than that many times
+    # what a rule allows are refused before the rate limiter is consulted
+    HEAVY_HITTERS_ENABLED: bool = False
+    HEAVY_HITTERS_WIDTH: int = 8192
+    HEAVY_HITTERS_DEPTH: int = 4
+    HEAVY_HITTERS_TOP_K: int = 50
+    HEAVY_HITTERS_WINDOW_SECONDS: int = 60
+    HEAVY_HITTERS_SYNC_INTERVAL_SECONDS: float = 5.0
+    HEAVY_HITTERS_REJECT_FACTOR: Optional[float] = None
+    
+    # Decision audit log: when AUDIT_LOG_DIR is set, every send decision is
+    # buffered (up to AUDIT_LOG_BUFFER_SIZE rows; more are dropped and counted)
+    # and written by a background thread every AUDIT_LOG_FLUSH_INTERVAL_SECONDS
+    # or AUDIT_LOG_BATCH_SIZE rows to gzip'd MessagePack files, rotated by size
+    # and age, keeping the newest AUDIT_LOG_MAX_FILES
+    AUDIT_LOG_DIR: Optional[str] = None
+    AUDIT_LOG_BUFFER_SIZE: int = 100000
+    AUDIT_LOG_BATCH_SIZE: int = 5000
+    AUDIT_LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+    AUDIT_LOG_ROTATE_BYTES: int = 64 * 1024 * 1024
+    AUDIT_LOG_ROTATE_SECONDS: float = 3600.0
+    AUDIT_LOG_MAX_FILES: int = 168
+    
+    # Logging configuration: per-event sampling rates (0.0-1.0) for
+    # high-volume INFO/DEBUG events; warnings and errors are never sampled
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    LOG_SAMPLE_RATES: Dict[str, float] = {
+        "message.received": 0.01,
+        "notification.sent": 0.01,
+    }
+    
     class ConfigDict:
         env_file = ".env"
         case_sensitive = True
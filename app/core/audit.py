@@ -0,0 +1,248 @@
+"""Audit log of notification decisions, written off the hot path.
+
+`AuditLog.record` appends a row to an in-memory buffer and returns; it
+never touches the disk. A background thread swaps the buffer out every
+`flush_interval_seconds` (sooner once `batch_size` rows are waiting) and
+appends the batch to the current file as one gzip member of MessagePack
+arrays, one array per decision with the columns in `FIELDS`.
+
+Files are named `audit-<UTC start>-<pid>-<seq>.msgpack.gz` and rotated by
+size and age; the oldest are deleted beyond `max_files`. The buffer holds
+at most `max_buffered` rows: when the writer cannot keep up, new rows are
+dropped and counted rather than letting memory grow or callers wait.
+`read_records` turns a file back into dicts. `source` tells deliveries of
+buffered digests (`SOURCE_DIGEST`) apart from sends requested directly.
+"""
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    "ts",
+    "user_id",
+    "type",
+    "rule",
+    "outcome",
+    "remaining",
+    "limiter_ms",
+    "gateway_ms",
+    "error",
+    "tenant_id",
+    "source",
+)
+
+SOURCE_DIGEST = "digest"
+
+FILE_PREFIX = "audit-"
+FILE_SUFFIX = ".msgpack.gz"
+
+Row = Tuple[Any, ...]
+
+
+def read_records(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Decisions stored in an audit file, oldest first."""
+    import msgpack
+
+    with gzip.open(path, "rb") as f:
+        for row in msgpack.Unpacker(f, raw=False):
+            # Rows written before a column was added are shorter.
+            record = dict.fromkeys(FIELDS)
+            record.update(zip(FIELDS, row))
+            yield record
+
+
+class AuditLog:
+    """Bounded buffer of decisions drained to rotating files by a writer thread."""
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        max_buffered: int = 100_000,
+        batch_size: int = 5_000,
+        flush_interval_seconds: float = 1.0,
+        rotate_bytes: int = 64 * 1024 * 1024,
+        rotate_seconds: float = 3600.0,
+        max_files: Optional[int] = 168,
+        compress_level: int = 6,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if max_buffered <= 0 or batch_size <= 0:
+            raise ValueError("max_buffered and batch_size must be positive")
+        import msgpack
+
+        self.directory = Path(directory)
+        self.max_buffered = max_buffered
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.max_files = max_files
+        self.compress_level = compress_level
+        self.clock = clock
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.lost = 0
+        self.write_errors = 0
+        self.files_opened = 0
+        self._packer = msgpack.Packer(use_bin_type=True)
+        self._buffer: List[Row] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._path: Optional[Path] = None
+        self._opened_at = 0.0
+
+    def record(
+        self,
+        user_id: str,
+        notification_type: str,
+        outcome: str,
+        rule: Optional[str] = None,
+        remaining: Optional[int] = None,
+        limiter_seconds: Optional[float] = None,
+        gateway_seconds: Optional[float] = None,
+        error: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        source: Optional[str] = None,
+    ) -> bool:
+        """Buffer one decision; returns False if it was dropped."""
+        row = (
+            self.clock(),
+            user_id,
+            notification_type,
+            rule,
+            outcome,
+            remaining,
+            None if limiter_seconds is None else round(limiter_seconds * 1000, 3),
+            None if gateway_seconds is None else round(gateway_seconds * 1000, 3),
+            error,
+            tenant_id,
+            source,
+        )
+        with self._lock:
+            if len(self._buffer) >= self.max_buffered:
+                self.dropped += 1
+                return False
+            self._buffer.append(row)
+            self.recorded += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+        return True
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Write what is buffered and close the current file."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Audit writer did not finish within %.1fs", timeout)
+                return
+            self._thread = None
+        self.flush()
+        with self._write_lock:
+            self._close_file()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.flush_interval_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Write the buffered rows now; returns how many were written."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+
+        with self._write_lock:
+            try:
+                chunk = b"".join(self._packer.pack(row) for row in batch)
+                f = self._current_file()
+                f.write(gzip.compress(chunk, compresslevel=self.compress_level))
+                f.flush()
+            except Exception as e:
+                self.write_errors += 1
+                self.lost += len(batch)
+                logger.error(
+                    "Failed to write %d audit record(s): %s",
+                    len(batch),
+                    e,
+                    extra={"event": "audit.write_failed"}
+                )
+                self._close_file()
+                return 0
+        self.written += len(batch)
+        return len(batch)
+
+    def _current_file(self):
+        now = self.clock()
+        if self._file is not None and (
+            self._file.tell() >= self.rotate_bytes or now - self._opened_at >= self.rotate_seconds
+        ):
+            self._close_file()
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            started = datetime.fromtimestamp(now, tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            self._path = self.directory / (
+                f"{FILE_PREFIX}{started}-{os.getpid()}-{self.files_opened:04d}{FILE_SUFFIX}"
+            )
+            self._file = open(self._path, "ab")
+            self._opened_at = now
+            self.files_opened += 1
+            self._prune()
+        return self._file
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _prune(self) -> None:
+        if not self.max_files:
+            return
+        # Names start with the UTC start time, so they sort oldest first.
+        files = sorted(self.directory.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"))
+        for path in files[:max(len(files) - self.max_files, 0)]:
+            if path != self._path:
+                path.unlink(missing_ok=True)
+
+    def status(self) -> dict:
+        return {
+            "buffered": self.buffered,
+            "capacity": self.max_buffered,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "lost": self.lost,
+            "write_errors": self.write_errors,
+            "current_file": str(self._path) if self._file is not None else None,
+        }
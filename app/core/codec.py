@@ -0,0 +1,125 @@
+"""Encoding of message bodies: JSON or MessagePack, optionally compressed.
+
+The format travels with the message (the AMQP `content_type` and
+`content_encoding` properties), so producers can switch formats without
+coordinating with consumers. A body without a content type is JSON.
+
+`msgpack` and `zstandard` are imported on first use; a deployment that
+only sees JSON does not need them.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+CONTENT_TYPES = (JSON, MSGPACK)
+COMPRESSIONS = (GZIP, ZSTD)
+
+# Bodies smaller than this are sent uncompressed; compression costs more
+# than it saves on a short notification.
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+_CONTENT_TYPE_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "text/json": JSON,
+}
+
+
+class MessageDecodeError(ValueError):
+    """The body could not be decoded; retrying will not help."""
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise MessageDecodeError("MessagePack bodies need the 'msgpack' package") from e
+    return msgpack
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise MessageDecodeError("zstd bodies need the 'zstandard' package") from e
+    return zstandard
+
+
+def normalize_content_type(content_type: Optional[str]) -> str:
+    if not content_type:
+        return JSON
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return _CONTENT_TYPE_ALIASES.get(media_type, media_type)
+
+
+def encode(
+    payload: Dict[str, Any],
+    content_type: str = JSON,
+    compression: Optional[str] = None,
+    compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+) -> Tuple[bytes, str, Optional[str]]:
+    """Serialize a payload; returns (body, content_type, content_encoding)."""
+    content_type = normalize_content_type(content_type)
+    if content_type == JSON:
+        body = json.dumps(payload).encode("utf-8")
+    elif content_type == MSGPACK:
+        body = _msgpack().packb(payload, use_bin_type=True)
+    else:
+        raise ValueError(f"content_type must be one of {CONTENT_TYPES}, got {content_type!r}")
+
+    if compression is None or len(body) < compression_threshold:
+        return body, content_type, None
+    if compression == GZIP:
+        return gzip.compress(body), content_type, GZIP
+    if compression == ZSTD:
+        return _zstd().ZstdCompressor().compress(body), content_type, ZSTD
+    raise ValueError(f"compression must be one of {COMPRESSIONS}, got {compression!r}")
+
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    encoding = (content_encoding or "").strip().lower()
+    try:
+        if encoding in ("", "identity", "utf-8", "utf8"):
+            return body
+        if encoding == GZIP:
+            return gzip.decompress(body)
+        if encoding == ZSTD:
+            # decompressobj also handles frames written without a content size.
+            return _zstd().ZstdDecompressor().decompressobj().decompress(body)
+    except MessageDecodeError:
+        raise
+    except Exception as e:
+        raise MessageDecodeError(f"Invalid {encoding} body: {e}") from e
+    raise MessageDecodeError(f"Unsupported content_encoding {content_encoding!r}")
+
+
+def decode(
+    body: bytes,
+    content_type: Optional[str] = None,
+    content_encoding: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Deserialize a message body according to its content type and encoding."""
+    raw = decompress(body, content_encoding)
+    media_type = normalize_content_type(content_type)
+    try:
+        if media_type == JSON:
+            data = json.loads(raw.decode("utf-8"))
+        elif media_type == MSGPACK:
+            data = _msgpack().unpackb(raw, raw=False)
+        else:
+            raise MessageDecodeError(f"Unsupported content_type {content_type!r}")
+    except MessageDecodeError:
+        raise
+    except Exception as e:
+        raise MessageDecodeError(f"Invalid {media_type} body: {e}") from e
+
+    if not isinstance(data, dict):
+        raise MessageDecodeError(f"Message body must be an object, got {type(data).__name__}")
+    return data
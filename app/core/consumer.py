@@ -1,26 +1,90 @@
 """RabbitMQ consumer for processing notification messages."""
-import json
+import asyncio
 import logging
-from typing import Optional
+import threading
+import time
+from typing import Any, Coroutine, Dict, Optional, Sequence, Tuple
 import pika
+from app.core import codec
+from app.core.fanout import FanoutProcessor
+from app.core.messages import (
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RETRY_DELAYS_SECONDS,
+    PERMANENT_ERRORS,
+    MessageProcessor,
+)
+from app.core.prefetch import PrefetchTuner
 from app.core.notification_service import NotificationService
 from app.adapters.rabbitmq_client import RabbitMQClient
 
 logger = logging.getLogger(__name__)
 
+EXCHANGE_NAME = "notifications"
+ROUTING_KEY = "notification.send"
+
+# Header carrying how many times a message has already been retried.
+RETRY_COUNT_HEADER = "x-retry-count"
+
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 20.0
+DEFAULT_PREFETCH_COUNT = 1
+
+# How long one pass of the consume loop waits on the broker when idle, and
+# on in-flight work otherwise, before checking the other side again.
+IDLE_POLL_SECONDS = 0.5
+INFLIGHT_POLL_SECONDS = 0.005
+
+# (channel, method, properties, body) of a delivery being processed.
+Delivery = Tuple[pika.channel.Channel, pika.spec.Basic.Deliver, pika.spec.BasicProperties, bytes]
+
 
 class NotificationConsumer:    
     def __init__(
         self,
         service: NotificationService,
         queue_name: str = "notifications",
-        rabbitmq_client: Optional[RabbitMQClient] = None
+        rabbitmq_client: Optional[RabbitMQClient] = None,
+        retry_delays_seconds: Sequence[int] = DEFAULT_RETRY_DELAYS_SECONDS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        fanout_processor: Optional[FanoutProcessor] = None,
+        drain_timeout_seconds: float = DEFAULT_DRAIN_TIMEOUT_SECONDS,
+        prefetch_count: int = DEFAULT_PREFETCH_COUNT,
+        prefetch_tuner: Optional[PrefetchTuner] = None,
+        processor: Optional[MessageProcessor] = None
     ):
+        if not retry_delays_seconds:
+            raise ValueError("retry_delays_seconds must contain at least one delay")
         self.service = service
         self.queue_name = queue_name
         self.rabbitmq_client = rabbitmq_client
+        self.retry_delays_seconds = tuple(retry_delays_seconds)
+        self.max_retries = max_retries
+        self.fanout_processor = fanout_processor
+        self.processor = processor or MessageProcessor(service, fanout_processor)
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.prefetch_tuner = prefetch_tuner
+        self.prefetch_count = prefetch_tuner.prefetch if prefetch_tuner else prefetch_count
+        self.last_drain_seconds: Optional[float] = None
+        self.consuming_since: Optional[float] = None
+        self.sessions = 0
         self._channel: Optional[pika.channel.Channel] = None
         self._connection: Optional[pika.BlockingConnection] = None
+        self._consumer_tag: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[asyncio.Task, Delivery] = {}
+        self._started_at: Dict[asyncio.Task, float] = {}
+        self._stop_requested = threading.Event()
+    
+    @property
+    def dead_letter_queue(self) -> str:
+        return f"{self.queue_name}.dead"
+    
+    def retry_queue(self, delay_seconds: int) -> str:
+        return f"{self.queue_name}.retry.{delay_seconds}s"
+    
+    def _retry_delay(self, retry_count: int) -> int:
+        """Backoff tier for the given retry; the last tier repeats once exhausted."""
+        index = min(retry_count, len(self.retry_delays_seconds) - 1)
+        return self.retry_delays_seconds[index]
     
     def _get_rabbitmq_client(self) -> RabbitMQClient:
         if self.rabbitmq_client is None:
@@ -38,41 +102,103 @@ class NotificationConsumer:
         return self.rabbitmq_client
     
     async def _process_message(self, message_body: str) -> None:
-        try:
-            data = json.loads(message_body)
-          
-            user_id = data["user_id"]
-            notification_type = data["type"]
-            message = data["message"]
-            
-            result = await self.service.send(
-                user_id=user_id,
-                notification_type=notification_type,
-                message=message
+        await self.processor.process(message_body)
+    
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """The consumer's own event loop.
+        
+        The loop lives as long as the consumer so async clients used by the
+        service (e.g. Redis connection pools) stay bound to a single loop.
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+    
+    def _run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        return self._get_loop().run_until_complete(coro)
+    
+    def close(self) -> None:
+        """Close the processor's clients on the consumer's loop, once it has stopped."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._run(self.processor.close())
+    
+    def _declare_topology(self, client: RabbitMQClient) -> None:
+        client.declare_exchange(EXCHANGE_NAME, exchange_type="direct")
+        
+        client.declare_queue(self.queue_name)
+        client.bind_queue(self.queue_name, EXCHANGE_NAME, ROUTING_KEY)
+        
+        # Each retry tier is a consumer-less queue whose TTL expiry dead-letters
+        # the message back to the main exchange, so backoff happens in the
+        # broker rather than in the consumer.
+        for delay in sorted(set(self.retry_delays_seconds)):
+            client.declare_queue(
+                self.retry_queue(delay),
+                arguments={
+                    "x-message-ttl": delay * 1000,
+                    "x-dead-letter-exchange": EXCHANGE_NAME,
+                    "x-dead-letter-routing-key": ROUTING_KEY,
+                }
             )
-            
-            if result:
-                logger.info(
-                    f"Notification sent successfully: user_id={user_id}, "
-                    f"type={notification_type}"
-                )
-            else:
-                logger.warning(
-                    f"Notification sending failed: user_id={user_id}, "
-                    f"type={notification_type}"
-                )
         
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in message: {e}")
-            raise
+        client.declare_queue(self.dead_letter_queue)
+    
+    def _republish(
+        self,
+        channel: pika.channel.Channel,
+        queue: str,
+        properties: pika.spec.BasicProperties,
+        body: bytes,
+        headers: dict
+    ) -> None:
+        channel.basic_publish(
+            exchange="",
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=properties.content_type,
+                content_encoding=properties.content_encoding,
+                message_id=properties.message_id,
+                delivery_mode=2,
+                headers=headers
+            )
+        )
+    
+    def _handle_failure(
+        self,
+        channel: pika.channel.Channel,
+        method: pika.spec.Basic.Deliver,
+        properties: pika.spec.BasicProperties,
+        body: bytes,
+        error: Exception
+    ) -> None:
+        headers = dict(properties.headers or {})
+        retry_count = int(headers.get(RETRY_COUNT_HEADER, 0))
+        headers["x-last-error"] = f"{type(error).__name__}: {error}"[:255]
         
-        except KeyError as e:
-            logger.error(f"Missing required field in message: {e}")
-            raise
+        if isinstance(error, PERMANENT_ERRORS) or retry_count >= self.max_retries:
+            target = self.dead_letter_queue
+        else:
+            target = self.retry_queue(self._retry_delay(retry_count))
+            headers[RETRY_COUNT_HEADER] = retry_count + 1
         
+        try:
+            self._republish(channel, target, properties, body, headers)
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            raise
+            # Could not park the message anywhere; give it back to the broker
+            # rather than dropping it.
+            logger.error("Failed to route message to '%s': %s", target, e, extra={"event": "message.reroute_failed"})
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        
+        logger.warning(
+            "Message routed to '%s' after %d retries: %s",
+            target,
+            retry_count,
+            error,
+            extra={"event": "message.rerouted", "target": target}
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
     
     def _on_message(
         self,
@@ -81,69 +207,200 @@ class NotificationConsumer:
         properties: pika.spec.BasicProperties,
         body: bytes
     ) -> None:
+        if self._stop_requested.is_set():
+            # Draining: hand the delivery back untouched for another consumer.
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
     
         try:
-            message_body = body.decode('utf-8')
-            logger.info(f"Received message: {message_body}")
-            
-            import asyncio
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_closed():
-                    asyncio.run(self._process_message(message_body))
-                else:
-                    loop.run_until_complete(self._process_message(message_body))
-            except RuntimeError:
-                asyncio.run(self._process_message(message_body))
-            
-            channel.basic_ack(delivery_tag=method.delivery_tag)
+            data = codec.decode(body, properties.content_type, properties.content_encoding)
+        except codec.MessageDecodeError as e:
+            logger.error("Error decoding message: %s", e, extra={"event": "message.invalid"})
+            self._handle_failure(channel, method, properties, body, e)
+            return
         
-        except Exception as e:
-            logger.error(f"Error handling message: {e}")
-            
-            channel.basic_nack(
-                delivery_tag=method.delivery_tag,
-                requeue=False
-            )
-    
-    def start_consuming(self) -> None:
+        logger.debug(
+            "Received message: %s",
+            data,
+            extra={"event": "message.received"}
+        )
         
-        client = self._get_rabbitmq_client()
+        # Plain JSON bodies keep identifying fan-outs by their text.
+        plain_json = (
+            codec.normalize_content_type(properties.content_type) == codec.JSON
+            and not properties.content_encoding
+        )
+        message_body = body.decode("utf-8") if plain_json else None
+        task = self._get_loop().create_task(self.processor.handle(data, message_body))
+        self._inflight[task] = (channel, method, properties, body)
+        self._started_at[task] = time.monotonic()
+    
+    def _settle(self, task: "asyncio.Task") -> None:
+        """Ack, reroute or requeue the delivery behind a finished task."""
+        channel, method, properties, body = self._inflight.pop(task)
+        started_at = self._started_at.pop(task, None)
+        if self.prefetch_tuner is not None and started_at is not None and not task.cancelled():
+            self.prefetch_tuner.record(time.monotonic() - started_at)
         
-        exchange_name = "notifications"
-        client.declare_exchange(exchange_name, exchange_type="direct")
+        if task.cancelled():
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
         
-        client.declare_queue(self.queue_name)
+        error = task.exception()
+        if error is None:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        else:
+            logger.error("Error handling message: %s", error, extra={"event": "message.error"})
+            self._handle_failure(channel, method, properties, body, error)
+    
+    def _settle_completed(self, timeout: Optional[float]) -> None:
+        """Run in-flight work until something finishes (or `timeout`), then settle it."""
+        if not self._inflight:
+            return
+        done, _ = self._run(asyncio.wait(
+            list(self._inflight),
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED
+        ))
+        for task in done:
+            self._settle(task)
     
-        routing_key = "notification.send"
-        client.bind_queue(self.queue_name, exchange_name, routing_key)
+    def start_consuming(self) -> None:
+        """Consume until `stop_consuming` is called, then drain and disconnect.
+        
+        Broker I/O and message processing are interleaved on this thread, so
+        every pika call (acks included) happens on the connection's owning
+        thread while up to `prefetch_count` messages are processed at once.
+        """
+        client = self._get_rabbitmq_client()
+        self._declare_topology(client)
         
         self._channel = client.get_channel()
         self._connection = client._connection
         
-        self._channel.basic_qos(prefetch_count=1)
+        self._channel.basic_qos(prefetch_count=self.prefetch_count)
+        if self.sessions == 0:
+            # Clients bind to this thread's loop, so they are warmed up here.
+            self._run(self.processor.warmup())
         
-        self._channel.basic_consume(
+        self._consumer_tag = self._channel.basic_consume(
             queue=self.queue_name,
             on_message_callback=self._on_message
         )
         
+        self.consuming_since = time.time()
+        self.sessions += 1
         logger.info(
             f"Started consuming from queue '{self.queue_name}' "
-            f"bound to exchange 'notifications' with routing key 'notification.send'"
+            f"bound to exchange '{EXCHANGE_NAME}' with routing key '{ROUTING_KEY}'"
         )
         
         try:
-            self._channel.start_consuming()
+            while not self._stop_requested.is_set():
+                self._connection.process_data_events(
+                    time_limit=0 if self._inflight else IDLE_POLL_SECONDS
+                )
+                self._settle_completed(timeout=INFLIGHT_POLL_SECONDS)
+                self._tune_prefetch()
         except KeyboardInterrupt:
             logger.info("Stopping consumer...")
-            self.stop_consuming()
+        except Exception:
+            # The channel is gone, so nothing can be acked; the broker will
+            # redeliver everything that was in flight.
+            self._abandon_inflight()
+            self._disconnect()
+            raise
+        finally:
+            self.consuming_since = None
+        
+        self._drain()
     
-    def stop_consuming(self) -> None:
-        if self._channel and not self._channel.is_closed:
-            self._channel.stop_consuming()
-            logger.info("Stopped consuming messages")
+    def _tune_prefetch(self) -> None:
+        """Apply the tuner's prefetch; runs on the consumer thread like every pika call."""
+        if self.prefetch_tuner is None:
+            return
+        self.prefetch_tuner.observe(len(self._inflight))
+        prefetch = self.prefetch_tuner.adjust()
+        if prefetch is None:
+            return
+        
+        self._channel.basic_qos(prefetch_count=prefetch)
+        previous, self.prefetch_count = self.prefetch_count, prefetch
+        sample = self.prefetch_tuner.last_sample
+        logger.info(
+            "Prefetch changed from %d to %d (%.1f msg/s, utilisation %.0f%%, latency %s)",
+            previous,
+            prefetch,
+            sample.throughput,
+            sample.utilisation * 100,
+            "n/a" if self.prefetch_tuner.latency_seconds is None
+            else f"{self.prefetch_tuner.latency_seconds * 1000:.0f}ms",
+            extra={"event": "consumer.prefetch_changed", "prefetch": prefetch}
+        )
+    
+    def _disconnect(self) -> None:
+        """Drop a possibly broken connection so the next start reconnects."""
+        if self.rabbitmq_client is None:
+            return
+        try:
+            self.rabbitmq_client.close()
+        except Exception as e:
+            logger.debug("Ignoring error while closing broken connection: %s", e)
+    
+    def _abandon_inflight(self) -> None:
+        for task in self._inflight:
+            task.cancel()
+        if self._inflight:
+            self._run(asyncio.wait(list(self._inflight)))
+        self._inflight.clear()
+        self._started_at.clear()
+    
+    def _drain(self) -> None:
+        """Stop deliveries, finish in-flight work up to the deadline, disconnect."""
+        started = time.monotonic()
+        deadline = started + self.drain_timeout_seconds
+        
+        # Cancelling the consumer also nacks (requeues) deliveries pika has
+        # buffered but not yet handed to `_on_message`.
+        if self._channel and self._channel.is_open and self._consumer_tag:
+            self._channel.basic_cancel(self._consumer_tag)
+        
+        while self._inflight and time.monotonic() < deadline:
+            self._settle_completed(timeout=min(INFLIGHT_POLL_SECONDS * 10, deadline - time.monotonic()))
+            if self._connection and self._connection.is_open:
+                self._connection.process_data_events(time_limit=0)
+        
+        abandoned = len(self._inflight)
+        if abandoned:
+            for task in self._inflight:
+                task.cancel()
+            self._run(asyncio.wait(list(self._inflight)))
+            for task in list(self._inflight):
+                self._settle(task)
         
         if self.rabbitmq_client:
             self.rabbitmq_client.close()
-
+        
+        self.last_drain_seconds = time.monotonic() - started
+        logger.info(
+            "Consumer drained in %.3fs, %d in-flight message(s) requeued",
+            self.last_drain_seconds,
+            abandoned,
+            extra={"event": "consumer.drained"}
+        )
+    
+    @property
+    def is_consuming(self) -> bool:
+        return self.consuming_since is not None
+    
+    @property
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+    
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_requested.is_set()
+    
+    def stop_consuming(self) -> None:
+        """Ask the consumer to drain and stop. Safe to call from any thread."""
+        self._stop_requested.set()
@@ -0,0 +1,255 @@
+"""Digest coalescing for notifications over a `digest` rule's limit.
+
+Over-limit messages are appended to a capped per-user list in Redis and
+the (type, user) pair is scheduled in a sorted set at the time its window
+reopens. A flusher claims due digests and sends each as one combined
+notification through the `NotificationService`, so it is counted against
+the new window, skipped for opted-out users and audited like any other
+send.
+
+A digest the gateway failed to deliver is requeued with its attempt count
+(kept in the `digest:attempts` hash) and retried with exponential backoff;
+after `max_attempts` it is dropped and logged as `digest.dead_lettered`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from app.adapters.redis_client import RedisClient
+from app.core.notification_service import NotificationService, SendOutcome
+
+logger = logging.getLogger(__name__)
+
+
+class DigestBuffer:
+    """Redis storage for pending digests."""
+
+    # Claim a due digest exactly once across instances: only the caller
+    # whose ZREM succeeds gets the buffered messages, preceded by the
+    # number of failed deliveries so far.
+    _CLAIM_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return {}
+end
+local messages = redis.call('LRANGE', KEYS[2], 0, -1)
+local attempts = redis.call('HGET', KEYS[3], ARGV[1]) or '0'
+redis.call('DEL', KEYS[2])
+redis.call('HDEL', KEYS[3], ARGV[1])
+table.insert(messages, 1, attempts)
+return messages
+"""
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        max_messages: int = 20,
+        retention_seconds: int = 86400,
+        key_prefix: str = "digest",
+    ) -> None:
+        if max_messages <= 0:
+            raise ValueError(f"max_messages must be positive, got {max_messages}")
+        self.redis_client = redis_client
+        self.max_messages = max_messages
+        self.retention_seconds = retention_seconds
+        self.key_prefix = key_prefix
+
+    async def warmup(self) -> None:
+        await self.redis_client.load_scripts([self._CLAIM_SCRIPT])
+
+    @property
+    def due_key(self) -> str:
+        return f"{self.key_prefix}:due"
+
+    @property
+    def attempts_key(self) -> str:
+        return f"{self.key_prefix}:attempts"
+
+    def buffer_key(self, user_id: str, notification_type: str) -> str:
+        return f"{self.key_prefix}:{notification_type}:{user_id}"
+
+    @staticmethod
+    def _member(user_id: str, notification_type: str) -> str:
+        return f"{notification_type}:{user_id}"
+
+    async def add_many(
+        self,
+        user_ids: Sequence[str],
+        notification_type: str,
+        message: str,
+        due_at: int,
+    ) -> None:
+        """Buffer `message` for each user, due no later than `due_at`."""
+        pipe = await self.redis_client.pipeline(transaction=True)
+        for user_id in user_ids:
+            key = self.buffer_key(user_id, notification_type)
+            pipe.rpush(key, message)
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, max(due_at - int(time.time()), 0) + self.retention_seconds)
+            # NX keeps the earliest due time if the digest is already scheduled.
+            pipe.zadd(self.due_key, {self._member(user_id, notification_type): due_at}, nx=True)
+        await pipe.execute()
+
+    async def add(self, user_id: str, notification_type: str, message: str, due_at: int) -> None:
+        await self.add_many([user_id], notification_type, message, due_at)
+
+    async def requeue(
+        self,
+        user_id: str,
+        notification_type: str,
+        messages: List[str],
+        due_at: int,
+        attempts: int = 0,
+    ) -> None:
+        """Put claimed messages back in front of anything buffered since.
+
+        `attempts` is the number of failed deliveries, handed back by the
+        next `claim_due`.
+        """
+        key = self.buffer_key(user_id, notification_type)
+        member = self._member(user_id, notification_type)
+        pipe = await self.redis_client.pipeline(transaction=True)
+        pipe.lpush(key, *reversed(messages))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, max(due_at - int(time.time()), 0) + self.retention_seconds)
+        pipe.zadd(self.due_key, {member: due_at})
+        if attempts:
+            pipe.hset(self.attempts_key, member, attempts)
+        await pipe.execute()
+
+    async def claim_due(
+        self,
+        now: float,
+        limit: int = 100,
+    ) -> List[Tuple[str, str, List[str], int]]:
+        """Claim up to `limit` due digests as (user_id, type, messages, attempts)."""
+        members = await self.redis_client.zrangebyscore(
+            self.due_key, "-inf", now, start=0, num=limit
+        )
+        if not members:
+            return []
+
+        pairs = [member.split(":", 1) for member in members]
+        results = await self.redis_client.eval_script_many(
+            self._CLAIM_SCRIPT,
+            [
+                ([self.due_key, self.buffer_key(user_id, notification_type), self.attempts_key], [member])
+                for member, (notification_type, user_id) in zip(members, pairs)
+            ],
+        )
+        return [
+            (user_id, notification_type, list(claimed[1:]), int(claimed[0]))
+            for (notification_type, user_id), claimed in zip(pairs, results)
+            if len(claimed) > 1
+        ]
+
+
+def combine(messages: Sequence[str]) -> str:
+    """Render buffered messages as a single digest body."""
+    lines = "\n".join(f"- {message}" for message in messages)
+    return f"You have {len(messages)} new notifications:\n{lines}"
+
+
+class DigestFlusher:
+    """Deliver due digests through the notification service."""
+
+    def __init__(
+        self,
+        buffer: DigestBuffer,
+        service: NotificationService,
+        interval_seconds: float = 5.0,
+        batch_size: int = 100,
+        max_attempts: int = 5,
+        max_backoff_seconds: float = 3600.0,
+    ) -> None:
+        if max_attempts <= 0:
+            raise ValueError(f"max_attempts must be positive, got {max_attempts}")
+        self.buffer = buffer
+        self.service = service
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def backoff_seconds(self, attempts: int) -> float:
+        """Delay before retrying a digest that failed `attempts` times."""
+        return min(self.interval_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+
+    async def flush_due(self, now: Optional[float] = None) -> int:
+        """Send every digest that is due; returns how many were sent."""
+        now = time.time() if now is None else now
+        sent = 0
+        for user_id, notification_type, messages, attempts in await self.buffer.claim_due(now, self.batch_size):
+            try:
+                outcome, due_at = await self._deliver(user_id, notification_type, messages, now)
+            except Exception as e:
+                logger.warning("Digest send failed for user_id=%s: %s", user_id, e)
+                outcome, due_at = SendOutcome.FAILED, None
+
+            if outcome in (SendOutcome.THROTTLED, SendOutcome.FAILED):
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.error(
+                        "Dropping digest after %d failed attempts: user_id=%s, type=%s, messages=%d",
+                        attempts,
+                        user_id,
+                        notification_type,
+                        len(messages),
+                        extra={"event": "digest.dead_lettered"},
+                    )
+                    continue
+                due_at = int(now + self.backoff_seconds(attempts))
+            if due_at is not None:
+                await self.buffer.requeue(user_id, notification_type, messages, due_at, attempts)
+            elif outcome == SendOutcome.SENT:
+                sent += 1
+        return sent
+
+    async def _deliver(
+        self,
+        user_id: str,
+        notification_type: str,
+        messages: List[str],
+        now: float,
+    ) -> Tuple[SendOutcome, Optional[int]]:
+        """Send one digest; returns its outcome and, if the limiter deferred it, when to retry."""
+        outcome, reset_at = await self.service.send_digest(
+            user_id, notification_type, combine(messages), now
+        )
+        if outcome == SendOutcome.DIGESTED:
+            # Other sends already used the new window; wait for the next.
+            return outcome, reset_at
+        if outcome in (SendOutcome.THROTTLED, SendOutcome.FAILED):
+            return outcome, None
+
+        if outcome == SendOutcome.OPTED_OUT:
+            logger.info(
+                "Digest dropped, user opted out: user_id=%s, type=%s, messages=%d",
+                user_id,
+                notification_type,
+                len(messages),
+                extra={"event": "digest.opted_out"},
+            )
+        else:
+            logger.info(
+                "Digest sent: user_id=%s, type=%s, messages=%d",
+                user_id,
+                notification_type,
+                len(messages),
+                extra={"event": "digest.sent"},
+            )
+        return outcome, None
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Flush periodically until `stop` is set."""
+        while not stop.is_set():
+            try:
+                await self.flush_due()
+            except Exception as e:
+                logger.error("Digest flush failed: %s", e)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,255 @@
+"""Fan-out of one notification to many users.
+
+A fan-out message carries either an explicit `user_ids` list or a
+`segment` name (a Redis set `segment:<name>`). Recipients are expanded in
+fixed-size chunks; each chunk gets one batched rate-limit call and
+concurrent gateway sends. Progress is checkpointed in Redis after every
+chunk, so a redelivered fan-out resumes where it stopped. A chunk that
+was in flight during a crash may be sent again.
+
+Recipients whose send was throttled or failed are added to a pending set
+(`fanout:<id>:pending`) before the checkpoint moves past them. Once every
+chunk is expanded, a fan-out with pending recipients raises a retryable
+error instead of completing, and its redelivery sends only to the pending
+set until it is empty.
+
+Every recipient a chunk was sent to is added to a seen set
+(`fanout:<id>:seen`) after the chunk, and skipped if a later chunk lists
+it again, e.g. when SSCAN returns a member twice.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from app.adapters.redis_client import RedisClient
+from app.core.gateway import GatewayThrottledError, GatewayUnavailableError
+from app.core.notification_service import NotificationService, SendOutcome
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FanoutProgress:
+    """Checkpointed state of a fan-out.
+
+    `position` is an offset into `user_ids`, or the SSCAN cursor for a
+    segment. Sends held for a digest are counted as digested. `pending`
+    is the number of throttled or failed recipients still to be retried;
+    `expanded` is set once every chunk has been sent.
+    """
+
+    position: int = 0
+    chunks: int = 0
+    sent: int = 0
+    opted_out: int = 0
+    rate_limited: int = 0
+    digested: int = 0
+    pending: int = 0
+    expanded: bool = False
+    done: bool = False
+
+
+class FanoutProcessor:
+    """Expand and deliver fan-out notifications chunk by chunk."""
+
+    def __init__(
+        self,
+        service: NotificationService,
+        redis_client: RedisClient,
+        chunk_size: int = 500,
+        checkpoint_ttl_seconds: int = 86400,
+        key_prefix: str = "fanout",
+        segment_prefix: str = "segment",
+    ) -> None:
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        self.service = service
+        self.redis_client = redis_client
+        self.chunk_size = chunk_size
+        self.checkpoint_ttl_seconds = checkpoint_ttl_seconds
+        self.key_prefix = key_prefix
+        self.segment_prefix = segment_prefix
+
+    def _checkpoint_key(self, fanout_id: str) -> str:
+        return f"{self.key_prefix}:{fanout_id}"
+
+    def _pending_key(self, fanout_id: str) -> str:
+        return f"{self.key_prefix}:{fanout_id}:pending"
+
+    def _seen_key(self, fanout_id: str) -> str:
+        return f"{self.key_prefix}:{fanout_id}:seen"
+
+    async def process(
+        self,
+        fanout_id: str,
+        notification_type: str,
+        message: str,
+        user_ids: Optional[Sequence[str]] = None,
+        segment: Optional[str] = None,
+    ) -> FanoutProgress:
+        if (user_ids is None) == (segment is None):
+            raise ValueError("A fan-out needs exactly one of user_ids or segment")
+
+        progress = await self._load(fanout_id)
+        if progress.done:
+            logger.info("Fan-out %s already completed, skipping", fanout_id)
+            return progress
+
+        throttled = False
+        if not progress.expanded:
+            if user_ids is not None:
+                chunks = self._list_chunks(user_ids, progress.position)
+            else:
+                chunks = self._segment_chunks(segment, progress.position)
+
+            async for next_position, chunk in chunks:
+                if chunk:
+                    seen = await self.redis_client.smismember(self._seen_key(fanout_id), chunk)
+                    chunk = [user_id for user_id, was_seen in zip(chunk, seen) if not was_seen]
+                if chunk:
+                    outcomes = await self.service.send_many(chunk, notification_type, message)
+                    undelivered = self._count(progress, outcomes)
+                    if undelivered:
+                        throttled |= SendOutcome.THROTTLED in outcomes.values()
+                        progress.pending += await self.redis_client.sadd(
+                            self._pending_key(fanout_id),
+                            undelivered,
+                            expire=self.checkpoint_ttl_seconds,
+                        )
+                    await self.redis_client.sadd(
+                        self._seen_key(fanout_id), chunk, expire=self.checkpoint_ttl_seconds
+                    )
+                progress.position = next_position
+                progress.chunks += 1
+                await self._save(fanout_id, progress)
+            progress.expanded = True
+        elif progress.pending:
+            throttled = await self._retry_pending(fanout_id, progress, notification_type, message)
+
+        if progress.pending:
+            await self._save(fanout_id, progress)
+            logger.warning(
+                "Fan-out %s has %d undelivered recipients, retrying later",
+                fanout_id,
+                progress.pending,
+                extra={"event": "fanout.pending"},
+            )
+            error = GatewayThrottledError if throttled else GatewayUnavailableError
+            raise error(f"Fan-out {fanout_id} has {progress.pending} undelivered recipients")
+
+        progress.done = True
+        await self._save(fanout_id, progress)
+        logger.info(
+            "Fan-out %s completed: sent=%d opted_out=%d rate_limited=%d digested=%d chunks=%d",
+            fanout_id,
+            progress.sent,
+            progress.opted_out,
+            progress.rate_limited,
+            progress.digested,
+            progress.chunks,
+            extra={"event": "fanout.completed"},
+        )
+        return progress
+
+    @staticmethod
+    def _count(progress: FanoutProgress, outcomes: Dict[str, SendOutcome]) -> List[str]:
+        """Add delivered outcomes to `progress`; returns the users to retry."""
+        undelivered = []
+        for user_id, outcome in outcomes.items():
+            if outcome == SendOutcome.SENT:
+                progress.sent += 1
+            elif outcome == SendOutcome.OPTED_OUT:
+                progress.opted_out += 1
+            elif outcome == SendOutcome.RATE_LIMITED:
+                progress.rate_limited += 1
+            elif outcome == SendOutcome.DIGESTED:
+                progress.digested += 1
+            else:
+                undelivered.append(user_id)
+        return undelivered
+
+    async def _retry_pending(
+        self,
+        fanout_id: str,
+        progress: FanoutProgress,
+        notification_type: str,
+        message: str,
+    ) -> bool:
+        """Send again to the pending set; returns whether any send was throttled."""
+        key = self._pending_key(fanout_id)
+        pending: List[str] = []
+        cursor = 0
+        while True:
+            cursor, members = await self.redis_client.sscan(key, cursor=cursor, count=self.chunk_size)
+            pending.extend(members)
+            if cursor == 0:
+                break
+        pending = list(dict.fromkeys(pending))
+
+        throttled = False
+        progress.pending = len(pending)
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start:start + self.chunk_size]
+            outcomes = await self.service.send_many(chunk, notification_type, message)
+            undelivered = set(self._count(progress, outcomes))
+            throttled |= SendOutcome.THROTTLED in outcomes.values()
+            delivered = [user_id for user_id in chunk if user_id not in undelivered]
+            if delivered:
+                await self.redis_client.srem(key, delivered)
+                progress.pending -= len(delivered)
+                await self._save(fanout_id, progress)
+        return throttled
+
+    async def _list_chunks(
+        self, user_ids: Sequence[str], offset: int
+    ) -> AsyncIterator[Tuple[int, List[str]]]:
+        for start in range(offset, len(user_ids), self.chunk_size):
+            end = min(start + self.chunk_size, len(user_ids))
+            yield end, list(dict.fromkeys(user_ids[start:end]))
+
+    async def _segment_chunks(
+        self, segment: str, cursor: int
+    ) -> AsyncIterator[Tuple[int, List[str]]]:
+        key = f"{self.segment_prefix}:{segment}"
+        while True:
+            cursor, members = await self.redis_client.sscan(
+                key, cursor=cursor, count=self.chunk_size
+            )
+            yield cursor, list(dict.fromkeys(members))
+            if cursor == 0:
+                return
+
+    async def _load(self, fanout_id: str) -> FanoutProgress:
+        stored = await self.redis_client.hgetall(self._checkpoint_key(fanout_id))
+        if not stored:
+            return FanoutProgress()
+        return FanoutProgress(
+            position=int(stored.get("position", 0)),
+            chunks=int(stored.get("chunks", 0)),
+            sent=int(stored.get("sent", 0)),
+            opted_out=int(stored.get("opted_out", 0)),
+            rate_limited=int(stored.get("rate_limited", 0)),
+            digested=int(stored.get("digested", 0)),
+            pending=int(stored.get("pending", 0)),
+            expanded=stored.get("expanded") == "1",
+            done=stored.get("done") == "1",
+        )
+
+    async def _save(self, fanout_id: str, progress: FanoutProgress) -> None:
+        await self.redis_client.hset(
+            self._checkpoint_key(fanout_id),
+            mapping={
+                "position": progress.position,
+                "chunks": progress.chunks,
+                "sent": progress.sent,
+                "opted_out": progress.opted_out,
+                "rate_limited": progress.rate_limited,
+                "digested": progress.digested,
+                "pending": progress.pending,
+                "expanded": int(progress.expanded),
+                "done": int(progress.done),
+            },
+            expire=self.checkpoint_ttl_seconds,
+        )
@@ -8,7 +8,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
 
 @dataclass
@@ -20,6 +20,30 @@ class Notification:
     message: str
 
 
+class GatewayUnavailableError(Exception):
+    """The provider could not take the send right now (5xx, timeout, network).
+
+    Unlike a send that returns False, retrying later may succeed.
+    """
+
+
+class DeliveryFailedError(Exception):
+    """The gateway reported a send as failed; raised so the message is retried."""
+
+
+class GatewayThrottledError(GatewayUnavailableError):
+    """The provider refused a send because we are sending too fast.
+
+    Raised for signals like HTTP 429 or SMTP 421/450/451, as opposed to
+    returning False for a send that failed. `retry_after` is the provider's
+    requested pause in seconds, when it gives one.
+    """
+
+    def __init__(self, message: str = "Provider throttled the request", retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class Gateway(ABC):
     """Abstract base class for notification gateways."""
 
@@ -29,8 +53,15 @@ class Gateway(ABC):
 
         Returns:
             True if sending was successful, False otherwise.
+
+        Raises:
+            GatewayThrottledError: if the provider is throttling us.
+            GatewayUnavailableError: if the provider is temporarily unavailable.
         """
 
+    async def close(self) -> None:
+        """Release pooled connections; a no-op for gateways without any."""
+
 
 class MockGateway(Gateway):
     """Mock gateway implementation used for testing."""
@@ -54,5 +85,3 @@ class EmailGateway(Gateway):
     async def send(self, notification: Notification) -> bool:
         # TODO: Implement real email sending logic.
         raise NotImplementedError("EmailGateway.send is not implemented yet")
-
-
@@ -0,0 +1,340 @@
+"""Streaming detection of the users sending the most notifications.
+
+Every send attempt is counted per (user, type) in a count-min sketch: a
+fixed `depth` x `width` grid of counters, each key mapping to one cell
+per row and estimated as the minimum of its cells. Estimates never
+undercount, and memory does not grow with the number of users; with
+probability 1 - e^-depth they overcount by at most e * total / width.
+Counting uses conservative update (only cells below the new estimate are
+raised), which keeps overcounts well under that bound on skewed traffic.
+A top-K table keeps the keys with the highest estimates.
+
+Counts cover fixed windows of `window_seconds` aligned to the epoch.
+With a Redis client, `sync` periodically adds this instance's new counts
+cell by cell (HINCRBY) to a shared hash per window and reads back the
+merged sketch, so every instance sees fleet-wide estimates; the keys in
+each instance's top-K are registered the same way as candidates for the
+global top-K.
+
+With a `reject_factor`, `observe` reports users sending a type more than
+`reject_factor` times what its rule could ever allow within a window,
+even after subtracting the sketch's error bound, so the caller can
+refuse them before touching the rate limiter. Types without a rule, or
+whose over-limit notifications are digested, are never rejected. With
+`tenants`, attempts are counted per (tenant, user, type) and judged
+against the tenant's rules.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.adapters.redis_client import RedisClient
+from app.core.notification_rules import ON_LIMIT_REJECT, RateLimitConfig, RateLimitRule
+from app.core.tenants import TenantRuleSets
+
+logger = logging.getLogger(__name__)
+
+# Separates tenant, user id and type in sketch keys; unlikely to occur in any.
+_KEY_SEPARATOR = "\x1f"
+# Field of the shared sketch hash holding the number of counted attempts.
+_TOTAL_FIELD = "total"
+
+
+class CountMinSketch:
+    """Fixed-size frequency estimates that may overcount but never undercount."""
+
+    def __init__(self, width: int = 8192, depth: int = 4) -> None:
+        if width <= 0 or depth <= 0:
+            raise ValueError("width and depth must be positive")
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [array("q", bytes(8 * width)) for _ in range(depth)]
+
+    def indexes(self, key: str) -> List[int]:
+        # Two independent 64-bit hashes combine into `depth` row hashes.
+        # blake2b is stable across processes, which merging relies on.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, indexes: List[int], count: int = 1) -> int:
+        """Count the key at `indexes` (conservative update); returns its new estimate."""
+        self.total += count
+        rows = self.rows
+        estimate = min([row[index] for row, index in zip(rows, indexes)]) + count
+        for row, index in zip(rows, indexes):
+            if row[index] < estimate:
+                row[index] = estimate
+        return estimate
+
+    def estimate(self, indexes: List[int]) -> int:
+        return min([row[index] for row, index in zip(self.rows, indexes)])
+
+    def merge(self, other: "CountMinSketch") -> None:
+        """Add `other`'s counts cell by cell; estimates stay upper bounds."""
+        for row, column, count in other.cells():
+            self.rows[row][column] += count
+        self.total += other.total
+
+    def cells(self) -> Iterator[Tuple[int, int, int]]:
+        """Non-zero cells as (row, column, count)."""
+        for r, row in enumerate(self.rows):
+            for c, value in enumerate(row):
+                if value:
+                    yield r, c, value
+
+
+class TopK:
+    """The `k` keys with the highest counts offered so far."""
+
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self._min_key: Optional[str] = None
+
+    def offer(self, key: str, count: int) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] = count
+            if key == self._min_key:
+                self._min_key = min(counts, key=counts.__getitem__)
+        elif len(counts) < self.k:
+            counts[key] = count
+            if self._min_key is None or count < counts[self._min_key]:
+                self._min_key = key
+        elif count > counts[self._min_key]:
+            del counts[self._min_key]
+            counts[key] = count
+            self._min_key = min(counts, key=counts.__getitem__)
+
+    def items(self) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+
+
+@dataclass(frozen=True)
+class HeavyHitter:
+    user_id: str
+    notification_type: str
+    count: int
+    # Most sends the type's rule allows in one tracker window; None without a rule.
+    limit: Optional[int]
+    tenant_id: Optional[str] = None
+
+
+class HeavyHitterTracker:
+    """Count-min sketch and top-K of send attempts, optionally merged through Redis.
+
+    `observe` runs on the consumer's thread and `sync` on the application's
+    event loop; a lock guards the swap between them.
+    """
+
+    def __init__(
+        self,
+        config: RateLimitConfig,
+        redis_client: Optional[RedisClient] = None,
+        width: int = 8192,
+        depth: int = 4,
+        top_k: int = 50,
+        window_seconds: int = 60,
+        reject_factor: Optional[float] = None,
+        sync_interval_seconds: float = 5.0,
+        key_prefix: str = "heavy_hitters",
+        clock: Callable[[], float] = time.time,
+        tenants: Optional[TenantRuleSets] = None,
+    ) -> None:
+        if reject_factor is not None and reject_factor < 1:
+            raise ValueError(f"reject_factor must be at least 1, got {reject_factor}")
+        self.config = config
+        self.redis_client = redis_client
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.window_seconds = window_seconds
+        self.reject_factor = reject_factor
+        self.sync_interval_seconds = sync_interval_seconds
+        self.key_prefix = key_prefix
+        self.clock = clock
+        self.tenants = tenants
+        self.rejected = 0
+        self.synced_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._window = self._window_of(clock())
+        self._merged = CountMinSketch(width, depth)
+        self._delta = CountMinSketch(width, depth)
+        self._top = TopK(top_k)
+        self._merged_top: List[Tuple[str, int]] = []
+        # (window, delta, candidate keys) from windows that closed before a sync
+        self._closed: List[Tuple[int, CountMinSketch, List[str]]] = []
+
+    def _window_of(self, now: float) -> int:
+        return int(now) // self.window_seconds
+
+    def _rule(self, notification_type: str, tenant_id: Optional[str]) -> Optional[RateLimitRule]:
+        if self.tenants is not None:
+            return self.tenants.get_rule(tenant_id, notification_type)
+        return self.config.get_rule(notification_type)
+
+    def limit(self, notification_type: str, tenant_id: Optional[str] = None) -> Optional[int]:
+        """Most sends of this type one user can be allowed in a tracker window."""
+        rule = self._rule(notification_type, tenant_id)
+        if rule is None:
+            return None
+        # A tracker window overlaps at most this many of the rule's windows.
+        return rule.max_count * (math.ceil(self.window_seconds / rule.time_window_seconds) + 1)
+
+    def _roll(self, now: float) -> None:
+        window = self._window_of(now)
+        if window == self._window:
+            return
+        if self._delta.total:
+            self._closed.append((self._window, self._delta, list(self._top.counts)))
+        self._window = window
+        self._merged = CountMinSketch(self.width, self.depth)
+        self._delta = CountMinSketch(self.width, self.depth)
+        self._top = TopK(self.top_k)
+        self._merged_top = []
+
+    def _count(self, key: str) -> int:
+        indexes = self._delta.indexes(key)
+        return self._delta.estimate(indexes) + self._merged.estimate(indexes)
+
+    @property
+    def error_bound(self) -> int:
+        """How far estimates in this window may overcount (with high probability)."""
+        return math.ceil(math.e * (self._merged.total + self._delta.total) / self.width)
+
+    def observe(self, user_id: str, notification_type: str, tenant_id: Optional[str] = None) -> bool:
+        """Count one send attempt; True if it should be rejected outright."""
+        key = f"{user_id}{_KEY_SEPARATOR}{notification_type}"
+        if tenant_id is not None:
+            key = f"{tenant_id}{_KEY_SEPARATOR}{key}"
+        with self._lock:
+            self._roll(self.clock())
+            indexes = self._delta.indexes(key)
+            count = self._delta.add(indexes) + self._merged.estimate(indexes)
+            self._top.offer(key, count)
+            if self.reject_factor is None:
+                return False
+            lower_bound = count - self.error_bound
+        rule = self._rule(notification_type, tenant_id)
+        if rule is None or rule.on_limit != ON_LIMIT_REJECT:
+            return False
+        if lower_bound > self.reject_factor * self.limit(notification_type, tenant_id):
+            with self._lock:
+                self.rejected += 1
+            return True
+        return False
+
+    def _redis_keys(self, window: int) -> Tuple[str, str]:
+        prefix = f"{self.key_prefix}:{window}"
+        return f"{prefix}:cms", f"{prefix}:keys"
+
+    async def sync(self) -> None:
+        """Push counts since the last sync to Redis and pull the merged view."""
+        if self.redis_client is None:
+            return
+        with self._lock:
+            self._roll(self.clock())
+            window = self._window
+            pending = self._closed + [(window, self._delta, list(self._top.counts))]
+            self._closed = []
+            # Until the merged view comes back, count the outgoing delta locally.
+            self._merged.merge(self._delta)
+            self._delta = CountMinSketch(self.width, self.depth)
+
+        pipe = await self.redis_client.pipeline(transaction=False)
+        for pending_window, delta, candidates in pending:
+            if not delta.total:
+                continue
+            cells_key, keys_key = self._redis_keys(pending_window)
+            for row, column, count in delta.cells():
+                pipe.hincrby(cells_key, f"{row}:{column}", count)
+            pipe.hincrby(cells_key, _TOTAL_FIELD, delta.total)
+            for key in candidates:
+                pipe.hincrby(keys_key, key, delta.estimate(delta.indexes(key)))
+            for redis_key in (cells_key, keys_key):
+                pipe.expire(redis_key, self.window_seconds * 3)
+        cells_key, keys_key = self._redis_keys(window)
+        pipe.hgetall(cells_key)
+        pipe.hgetall(keys_key)
+        try:
+            *_, cells, candidates = await pipe.execute()
+        except Exception:
+            # Queue the counts again for the next sync; until then the
+            # current window's are counted twice, which only overestimates.
+            with self._lock:
+                for pending_window, delta, keys in pending:
+                    if pending_window == self._window:
+                        self._delta.merge(delta)
+                    else:
+                        self._closed.append((pending_window, delta, keys))
+            raise
+
+        merged = CountMinSketch(self.width, self.depth)
+        merged.total = int(cells.pop(_TOTAL_FIELD, 0))
+        for cell, value in cells.items():
+            row, column = map(int, cell.split(":"))
+            if row < self.depth and column < self.width:
+                merged.rows[row][column] = int(value)
+        top = TopK(self.top_k)
+        for key in candidates:
+            top.offer(key, merged.estimate(merged.indexes(key)))
+
+        with self._lock:
+            if self._window != window:
+                return
+            self._merged = merged
+            self._merged_top = top.items()
+            self.synced_at = self.clock()
+
+    def top(self, n: Optional[int] = None) -> List[HeavyHitter]:
+        """Highest counts in the current window, fleet-wide once synced."""
+        with self._lock:
+            self._roll(self.clock())
+            counts = dict(self._merged_top)
+            for key in self._top.counts:
+                counts[key] = max(counts.get(key, 0), self._count(key))
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:n or self.top_k]
+        hitters = []
+        for key, count in ranked:
+            parts = key.split(_KEY_SEPARATOR)
+            tenant_id = parts.pop(0) if len(parts) == 3 else None
+            user_id, notification_type = parts
+            hitters.append(HeavyHitter(
+                user_id,
+                notification_type,
+                count,
+                self.limit(notification_type, tenant_id),
+                tenant_id,
+            ))
+        return hitters
+
+    @property
+    def window_start(self) -> int:
+        return self._window * self.window_seconds
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Sync every `sync_interval_seconds` until `stop` is set."""
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.sync_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("Heavy-hitter sync failed: %s", e, extra={"event": "heavy_hitters.sync_failed"})
+
+    async def close(self) -> None:
+        if self.redis_client is not None:
+            await self.redis_client.close()
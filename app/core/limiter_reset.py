@@ -0,0 +1,111 @@
+"""Bulk reset of rate limiter state without blocking Redis.
+
+Keys are found with incremental SCAN and removed with pipelined UNLINK
+(or HDEL for a single type), one bounded batch at a time with a pause in
+between, so a purge of millions of users never holds up the limiter.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from app.adapters.redis_client import RedisClient
+from app.core.rate_limiter import RedisRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ResetProgress:
+    """Running totals of a reset, reported after every batch."""
+
+    scanned: int = 0
+    removed: int = 0
+    batches: int = 0
+    done: bool = False
+
+
+class LimiterStateReset:
+    """Clear limiter state for a user, a notification type or a key pattern.
+
+    Resets cover the keys and rules of `limiter`; pass a tenant's limiter
+    (keys under `tenant_key_prefix`) to reset only that tenant.
+    """
+
+    def __init__(
+        self,
+        limiter: RedisRateLimiter,
+        batch_size: int = 500,
+        pause_seconds: float = 0.01,
+        on_progress: Optional[Callable[[ResetProgress], None]] = None,
+    ) -> None:
+        if batch_size <= 0:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+        self.limiter = limiter
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.on_progress = on_progress
+
+    @property
+    def redis_client(self) -> RedisClient:
+        return self.limiter.redis_client
+
+    async def reset_user(self, user_id: str) -> ResetProgress:
+        """Forget every counter of one user (a single key)."""
+        pipe = await self.redis_client.pipeline()
+        pipe.unlink(self.limiter.key(user_id))
+        (removed,) = await pipe.execute()
+        progress = ResetProgress(scanned=1, removed=removed, batches=1, done=True)
+        self._report(progress)
+        return progress
+
+    async def reset_type(self, notification_type: str) -> ResetProgress:
+        """Forget one notification type's counter for every user."""
+        if self.limiter.config.get_rule(notification_type) is None:
+            raise ValueError(f"No rate limit rule for type '{notification_type}'")
+        return await self._scan(
+            f"{self.limiter.key_prefix}:*",
+            lambda pipe, key: pipe.hdel(key, notification_type),
+        )
+
+    async def reset_pattern(self, pattern: str) -> ResetProgress:
+        """Forget every user whose id matches a glob pattern ('*' for everyone)."""
+        return await self._scan(
+            self.limiter.key(pattern),
+            lambda pipe, key: pipe.unlink(key),
+        )
+
+    async def _scan(self, match: str, remove: Callable) -> ResetProgress:
+        progress = ResetProgress()
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis_client.scan(
+                cursor=cursor, match=match, count=self.batch_size
+            )
+            if keys:
+                pipe = await self.redis_client.pipeline()
+                for key in keys:
+                    remove(pipe, key)
+                results = await pipe.execute()
+                progress.scanned += len(keys)
+                progress.removed += sum(results)
+            progress.batches += 1
+            progress.done = cursor == 0
+            self._report(progress)
+            if progress.done:
+                return progress
+            await asyncio.sleep(self.pause_seconds)
+
+    def _report(self, progress: ResetProgress) -> None:
+        logger.info(
+            "Limiter reset progress: scanned=%d removed=%d batches=%d done=%s",
+            progress.scanned,
+            progress.removed,
+            progress.batches,
+            progress.done,
+            extra={"event": "ratelimit.reset"},
+        )
+        if self.on_progress is not None:
+            self.on_progress(progress)
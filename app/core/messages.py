@@ -0,0 +1,146 @@
+"""Decoding and dispatch of notification messages, shared by every transport."""
+import json
+import logging
+from typing import Mapping, Optional
+
+from app.core.fanout import FanoutProcessor
+from app.core.notification_service import NotificationService
+
+logger = logging.getLogger(__name__)
+
+# Errors that will fail again no matter how often the message is retried
+# (malformed payloads), so they go straight to the dead-letter queue.
+PERMANENT_ERRORS = (ValueError, KeyError, TypeError)
+
+# Retry policy defaults shared by the transports.
+DEFAULT_RETRY_DELAYS_SECONDS = (5, 30, 300)
+DEFAULT_MAX_RETRIES = 5
+
+
+class MessageProcessor:
+    """Turn a JSON message body into notification sends.
+
+    A body is either a single notification (`user_id`, `type`, `message`)
+    or a fan-out (`user_ids` or `segment` instead of `user_id`, plus a
+    `fanout_id` unique to each publish, which its checkpoint is kept
+    under). Errors propagate so the transport can retry or dead-letter the message.
+
+    A message with a `tenant_id` other than this processor's is handed to
+    that tenant's processor in `tenants`, which limits it under the
+    tenant's rules and keys; an unknown tenant is a permanent error.
+    """
+
+    def __init__(
+        self,
+        service: NotificationService,
+        fanout_processor: Optional[FanoutProcessor] = None,
+        tenant_id: Optional[str] = None,
+        tenants: Optional[Mapping[str, "MessageProcessor"]] = None,
+    ) -> None:
+        self.service = service
+        self.fanout_processor = fanout_processor
+        self.tenant_id = tenant_id
+        self.tenants = dict(tenants or {})
+
+    async def warmup(self) -> bool:
+        """Connect and load scripts for every tenant before the first message.
+
+        Runs on the transport's event loop, which its clients bind to.
+        Failures are logged and leave the clients to connect on first use;
+        returns whether everything warmed up.
+        """
+        ok = True
+        for processor in (self, *self.tenants.values()):
+            try:
+                await processor.service.warmup()
+            except Exception as e:
+                ok = False
+                logger.warning(
+                    "Warmup failed for tenant %s: %s",
+                    processor.tenant_id or "default",
+                    e,
+                    extra={"event": "startup.warmup_failed"}
+                )
+        return ok
+
+    async def close(self) -> None:
+        """Close every tenant's gateway; call on the transport's event loop."""
+        gateways = {id(p.service.gateway): p.service.gateway for p in (self, *self.tenants.values())}
+        for gateway in gateways.values():
+            await gateway.close()
+
+    async def process(self, message_body: str) -> None:
+        """Handle a serialized message, as received from a broker."""
+        try:
+            data = json.loads(message_body)
+        except json.JSONDecodeError as e:
+            logger.error("Invalid JSON in message: %s", e, extra={"event": "message.invalid"})
+            raise
+        await self.handle(data, message_body)
+
+    async def handle(self, data: dict, message_body: Optional[str] = None) -> None:
+        """Handle an already-decoded message."""
+        tenant_id = data.get("tenant_id")
+        if tenant_id != self.tenant_id:
+            tenant = self.tenants.get(tenant_id)
+            if tenant is None:
+                logger.error("Unknown tenant in message: %r", tenant_id, extra={"event": "message.invalid"})
+                raise ValueError(f"Unknown tenant {tenant_id!r}")
+            await tenant.handle(data, message_body)
+            return
+        try:
+            if "user_ids" in data or "segment" in data:
+                await self._process_fanout(data)
+                return
+
+            user_id = data["user_id"]
+            notification_type = data["type"]
+            message = data["message"]
+
+            result = await self.service.send(
+                user_id=user_id,
+                notification_type=notification_type,
+                message=message
+            )
+
+            # Undelivered sends raise, so they are retried; False means the
+            # notification was deliberately not sent (limited, opted out, digested).
+            if result:
+                logger.info(
+                    "Notification sent: user_id=%s, type=%s",
+                    user_id,
+                    notification_type,
+                    extra={"event": "notification.sent", "user_id": user_id, "type": notification_type}
+                )
+            else:
+                logger.info(
+                    "Notification not sent: user_id=%s, type=%s",
+                    user_id,
+                    notification_type,
+                    extra={"event": "notification.not_sent", "user_id": user_id, "type": notification_type}
+                )
+
+        except KeyError as e:
+            logger.error("Missing required field in message: %s", e, extra={"event": "message.invalid"})
+            raise
+
+        except Exception as e:
+            logger.error("Error processing message: %s", e, extra={"event": "message.error"})
+            raise
+
+    async def _process_fanout(self, data: dict) -> None:
+        if self.fanout_processor is None:
+            raise ValueError("Fan-out messages are not supported by this consumer")
+
+        # Not derived from the content: sending the same broadcast again
+        # must start a new fan-out rather than find the old one completed.
+        fanout_id = data.get("fanout_id")
+        if not fanout_id:
+            raise ValueError("Fan-out messages need a fanout_id")
+        await self.fanout_processor.process(
+            fanout_id=fanout_id,
+            notification_type=data["type"],
+            message=data["message"],
+            user_ids=data.get("user_ids"),
+            segment=data.get("segment")
+        )
@@ -2,6 +2,12 @@
 from dataclasses import dataclass, field
 from typing import Dict, Optional
 
+# What happens to a notification over its rule's limit: it is dropped, or
+# buffered and delivered as one combined digest once the window reopens.
+ON_LIMIT_REJECT = "reject"
+ON_LIMIT_DIGEST = "digest"
+ON_LIMIT_BEHAVIORS = (ON_LIMIT_REJECT, ON_LIMIT_DIGEST)
+
 
 @dataclass
 class RateLimitRule:
@@ -9,6 +15,7 @@ class RateLimitRule:
     type: str
     max_count: int
     time_window_seconds: int
+    on_limit: str = ON_LIMIT_REJECT
     
     def __post_init__(self):
         if self.max_count <= 0:
@@ -18,6 +25,11 @@ class RateLimitRule:
             raise ValueError(
                 f"time_window_seconds must be positive, got {self.time_window_seconds}"
             )
+        
+        if self.on_limit not in ON_LIMIT_BEHAVIORS:
+            raise ValueError(
+                f"on_limit must be one of {ON_LIMIT_BEHAVIORS}, got {self.on_limit!r}"
+            )
 
 
 class RateLimitConfig:
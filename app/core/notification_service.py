@@ -1,13 +1,197 @@
 from __future__ import annotations
 
-from app.core.gateway import Gateway, Notification
+import asyncio
+import logging
+import time
+from enum import Enum
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Set, Tuple, Union
+
+from app.core.audit import SOURCE_DIGEST, AuditLog
+from app.core.gateway import DeliveryFailedError, Gateway, GatewayThrottledError, Notification
+from app.core.heavy_hitters import HeavyHitterTracker
+from app.core.notification_rules import ON_LIMIT_DIGEST
+from app.core.preferences import PreferenceStore
+from app.core.rate_limiter import RateLimiter
+from app.core.routing import GatewayRegistry
+
+if TYPE_CHECKING:
+    # Annotation only: the digest flusher delivers through this service.
+    from app.core.digest import DigestBuffer
+
+logger = logging.getLogger(__name__)
+
+# Audit reason for sends refused by the heavy-hitter tracker.
+HEAVY_HITTER = "heavy_hitter"
+
+
+class SendOutcome(str, Enum):
+    """What happened to a single notification."""
+
+    SENT = "sent"
+    OPTED_OUT = "opted_out"
+    RATE_LIMITED = "rate_limited"
+    DIGESTED = "digested"
+    THROTTLED = "throttled"
+    FAILED = "failed"
 
 
 class NotificationService:
-    """Service for sending notifications through a gateway."""
+    """Service for sending notifications through a gateway.
+
+    With an `audit_log`, every decision is recorded there; recording only
+    buffers the row, the log's own thread does the writing. With
+    `heavy_hitters`, every attempt is counted there first, and users it
+    flags as far over every limit are refused without asking the limiter.
+    With `preferences`, users who opted out of a type are skipped before
+    the limiter and the gateway; if preferences cannot be read, sends go
+    ahead rather than stall. A send the gateway did not deliver is
+    refunded to the limiter, so retrying it is not charged twice. A
+    `tenant_id` tags what the service records in the shared audit log and
+    heavy-hitter tracker; its limiter and preference store already hold
+    that tenant's rules and keys.
+    """
 
-    def __init__(self, gateway: Gateway) -> None:
+    def __init__(
+        self,
+        gateway: Gateway,
+        rate_limiter: Optional[RateLimiter] = None,
+        digest_buffer: Optional[DigestBuffer] = None,
+        audit_log: Optional[AuditLog] = None,
+        heavy_hitters: Optional[HeavyHitterTracker] = None,
+        preferences: Optional[PreferenceStore] = None,
+        tenant_id: Optional[str] = None,
+    ) -> None:
         self.gateway = gateway
+        self.rate_limiter = rate_limiter
+        self.digest_buffer = digest_buffer
+        self.audit_log = audit_log
+        self.heavy_hitters = heavy_hitters
+        self.preferences = preferences
+        self.tenant_id = tenant_id
+
+    async def warmup(self) -> None:
+        """Connect the service's Redis clients and load their scripts."""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.warmup()
+        if self.digest_buffer is not None:
+            await self.digest_buffer.warmup()
+        if self.preferences is not None:
+            await self.preferences.redis_client.ping()
+
+    def _digests(self, notification_type: str) -> bool:
+        """Whether over-limit notifications of this type are buffered."""
+        if self.digest_buffer is None or self.rate_limiter is None:
+            return False
+        rule = self.rate_limiter.config.get_rule(notification_type)
+        return rule is not None and rule.on_limit == ON_LIMIT_DIGEST
+
+    def _rule_label(self, notification_type: str) -> Optional[str]:
+        if self.rate_limiter is None:
+            return None
+        rule = self.rate_limiter.config.get_rule(notification_type)
+        if rule is None:
+            return None
+        return f"{rule.max_count}/{rule.time_window_seconds}s"
+
+    def _audit(
+        self,
+        user_id: str,
+        notification_type: str,
+        outcome: SendOutcome,
+        remaining: Optional[int] = None,
+        limiter_seconds: Optional[float] = None,
+        gateway_seconds: Optional[float] = None,
+        error: Optional[Union[BaseException, str]] = None,
+        source: Optional[str] = None,
+    ) -> None:
+        if self.audit_log is None:
+            return
+        if isinstance(error, BaseException):
+            error = f"{type(error).__name__}: {error}"
+        self.audit_log.record(
+            user_id,
+            notification_type,
+            outcome.value,
+            rule=self._rule_label(notification_type),
+            remaining=remaining,
+            limiter_seconds=limiter_seconds,
+            gateway_seconds=gateway_seconds,
+            error=None if error is None else error[:255],
+            tenant_id=self.tenant_id,
+            source=source,
+        )
+
+    async def _timed_send(
+        self, notification: Notification
+    ) -> Tuple[Optional[Exception], float, Optional[str]]:
+        """Send once; returns the error (None if delivered), the time taken,
+        and which channels failed when a registry delivered only partially.
+
+        A partial delivery counts as delivered: retrying it would resend
+        on the channels that already delivered.
+        """
+        started = time.perf_counter()
+        error = partial = None
+        try:
+            if isinstance(self.gateway, GatewayRegistry):
+                failed = (await self.gateway.deliver(notification)).failed
+                if failed:
+                    partial = "partial delivery, failed channels: " + ", ".join(r.channel for r in failed)
+            elif await self.gateway.send(notification) is not True:
+                error = DeliveryFailedError(
+                    f"Gateway did not deliver the notification for user {notification.user_id}"
+                )
+        except Exception as e:
+            error = e
+        return error, time.perf_counter() - started, partial
+
+    async def _refund(self, user_ids: Sequence[str], notification_type: str, reset_at: Optional[int]) -> None:
+        if self.rate_limiter is None or reset_at is None or not user_ids:
+            return
+        try:
+            await self.rate_limiter.refund_many(user_ids, notification_type, reset_at)
+        except Exception as e:
+            logger.warning(
+                "Could not refund %d undelivered send(s) of type %s: %s",
+                len(user_ids),
+                notification_type,
+                e,
+                extra={"event": "ratelimit.refund_failed"},
+            )
+
+    def _rejected_early(self, user_id: str, notification_type: str) -> bool:
+        if self.heavy_hitters is None or not self.heavy_hitters.observe(
+            user_id, notification_type, self.tenant_id
+        ):
+            return False
+        self._audit(user_id, notification_type, SendOutcome.RATE_LIMITED, remaining=0, error=HEAVY_HITTER)
+        logger.info(
+            "Notification rejected for heavy hitter: user_id=%s, type=%s",
+            user_id,
+            notification_type,
+            extra={"event": "notification.rate_limited", "reason": HEAVY_HITTER},
+        )
+        return True
+
+    async def _opted_out(self, user_ids: Sequence[str], notification_type: str) -> Set[str]:
+        """Users who do not want this type; audited as OPTED_OUT."""
+        if self.preferences is None:
+            return set()
+        try:
+            preferences = await self.preferences.get_many(user_ids)
+        except Exception as e:
+            logger.warning(
+                "Preference lookup failed, sending anyway: %s",
+                e,
+                extra={"event": "preferences.unavailable"},
+            )
+            return set()
+        opted_out = {
+            user_id for user_id in user_ids if not preferences[user_id].allows(notification_type)
+        }
+        for user_id in opted_out:
+            self._audit(user_id, notification_type, SendOutcome.OPTED_OUT)
+        return opted_out
 
     async def send(
         self,
@@ -15,10 +199,204 @@ class NotificationService:
         notification_type: str,
         message: str,
     ) -> bool:
+        if self._rejected_early(user_id, notification_type):
+            return False
+        if await self._opted_out([user_id], notification_type):
+            logger.info(
+                "Notification skipped, user opted out: user_id=%s, type=%s",
+                user_id,
+                notification_type,
+                extra={"event": "notification.opted_out"},
+            )
+            return False
+
+        remaining = limiter_seconds = reset_at = None
+        if self.rate_limiter is not None:
+            started = time.perf_counter()
+            decision = await self.rate_limiter.hit(user_id, notification_type)
+            limiter_seconds = time.perf_counter() - started
+            remaining = decision.remaining
+            reset_at = decision.reset_at
+            if not decision.allowed and self._digests(notification_type):
+                await self.digest_buffer.add(user_id, notification_type, message, decision.reset_at)
+                self._audit(
+                    user_id, notification_type, SendOutcome.DIGESTED, remaining, limiter_seconds
+                )
+                logger.info(
+                    "Notification added to digest: user_id=%s, type=%s",
+                    user_id,
+                    notification_type,
+                    extra={"event": "notification.digested"},
+                )
+                return False
+            if not decision.allowed:
+                self._audit(
+                    user_id, notification_type, SendOutcome.RATE_LIMITED, remaining, limiter_seconds
+                )
+                logger.info(
+                    "Notification rate limited: user_id=%s, type=%s",
+                    user_id,
+                    notification_type,
+                    extra={"event": "notification.rate_limited"},
+                )
+                return False
+
         notification = Notification(
             user_id=user_id,
             notification_type=notification_type,
             message=message,
         )
-        
-        return await self.gateway.send(notification)
+
+        error, gateway_seconds, partial = await self._timed_send(notification)
+        if error is None:
+            self._audit(
+                user_id, notification_type, SendOutcome.SENT, remaining, limiter_seconds, gateway_seconds, partial
+            )
+            return True
+        outcome = SendOutcome.THROTTLED if isinstance(error, GatewayThrottledError) else SendOutcome.FAILED
+        self._audit(
+            user_id, notification_type, outcome, remaining, limiter_seconds, gateway_seconds, error
+        )
+        await self._refund([user_id], notification_type, reset_at)
+        raise error
+
+    async def send_digest(
+        self,
+        user_id: str,
+        notification_type: str,
+        message: str,
+        now: Optional[float] = None,
+    ) -> Tuple[SendOutcome, Optional[int]]:
+        """Deliver a digest that came due as one notification.
+
+        Opt-outs and audit apply as for `send`, but a digest over the new
+        window's limit is kept (DIGESTED) instead of dropped, and a failed
+        delivery is reported rather than raised. Returns the outcome and
+        when the limiter window resets, if it was consulted.
+        """
+        if await self._opted_out([user_id], notification_type):
+            return SendOutcome.OPTED_OUT, None
+
+        remaining = limiter_seconds = reset_at = None
+        if self.rate_limiter is not None:
+            started = time.perf_counter()
+            decision = await self.rate_limiter.hit(user_id, notification_type, now)
+            limiter_seconds = time.perf_counter() - started
+            remaining = decision.remaining
+            reset_at = decision.reset_at
+            if not decision.allowed:
+                self._audit(
+                    user_id, notification_type, SendOutcome.DIGESTED, remaining, limiter_seconds,
+                    source=SOURCE_DIGEST,
+                )
+                return SendOutcome.DIGESTED, reset_at
+
+        error, gateway_seconds, partial = await self._timed_send(Notification(
+            user_id=user_id,
+            notification_type=notification_type,
+            message=message,
+        ))
+        if error is None:
+            outcome = SendOutcome.SENT
+        else:
+            outcome = SendOutcome.THROTTLED if isinstance(error, GatewayThrottledError) else SendOutcome.FAILED
+            await self._refund([user_id], notification_type, reset_at)
+        self._audit(
+            user_id, notification_type, outcome, remaining, limiter_seconds, gateway_seconds, error or partial,
+            source=SOURCE_DIGEST,
+        )
+        return outcome, reset_at
+
+    async def send_many(
+        self,
+        user_ids: Sequence[str],
+        notification_type: str,
+        message: str,
+    ) -> Dict[str, SendOutcome]:
+        """Send the same notification to several users.
+
+        Limits are checked in one batched call and the allowed sends run
+        concurrently. A gateway error fails only that user's send; a
+        provider throttle is reported as THROTTLED so it can be retried.
+        THROTTLED and FAILED sends are refunded to the limiter.
+        """
+        outcomes: Dict[str, SendOutcome] = {}
+        if self.heavy_hitters is not None:
+            for user_id in user_ids:
+                if self._rejected_early(user_id, notification_type):
+                    outcomes[user_id] = SendOutcome.RATE_LIMITED
+            if outcomes:
+                user_ids = [user_id for user_id in user_ids if user_id not in outcomes]
+        if user_ids and self.preferences is not None:
+            opted_out = await self._opted_out(user_ids, notification_type)
+            if opted_out:
+                outcomes.update(dict.fromkeys(opted_out, SendOutcome.OPTED_OUT))
+                user_ids = [user_id for user_id in user_ids if user_id not in opted_out]
+        allowed = list(user_ids)
+        remaining: Dict[str, Optional[int]] = {}
+        limiter_seconds = window_reset_at = None
+        if self.rate_limiter is not None:
+            started = time.perf_counter()
+            decisions = await self.rate_limiter.hit_many(user_ids, notification_type)
+            # One batched call: each user is charged the whole call's latency.
+            limiter_seconds = time.perf_counter() - started
+            allowed = []
+            denied = []
+            for user_id, decision in zip(user_ids, decisions):
+                remaining[user_id] = decision.remaining
+                window_reset_at = decision.reset_at
+                if decision.allowed:
+                    allowed.append(user_id)
+                else:
+                    denied.append(user_id)
+                    # Windows are aligned, so every denied user's reopens together.
+                    reset_at = decision.reset_at
+            if denied and self._digests(notification_type):
+                await self.digest_buffer.add_many(denied, notification_type, message, reset_at)
+                outcomes.update(dict.fromkeys(denied, SendOutcome.DIGESTED))
+            else:
+                outcomes.update(dict.fromkeys(denied, SendOutcome.RATE_LIMITED))
+            for user_id in denied:
+                self._audit(
+                    user_id, notification_type, outcomes[user_id], remaining[user_id], limiter_seconds
+                )
+
+        results = await asyncio.gather(
+            *(
+                self._timed_send(Notification(
+                    user_id=user_id,
+                    notification_type=notification_type,
+                    message=message,
+                ))
+                for user_id in allowed
+            )
+        )
+        for user_id, (error, gateway_seconds, partial) in zip(allowed, results):
+            if error is None:
+                outcomes[user_id] = SendOutcome.SENT
+            elif isinstance(error, GatewayThrottledError):
+                outcomes[user_id] = SendOutcome.THROTTLED
+            else:
+                logger.warning(
+                    "Notification sending failed: user_id=%s, type=%s: %s",
+                    user_id,
+                    notification_type,
+                    error,
+                    extra={"event": "notification.failed"},
+                )
+                outcomes[user_id] = SendOutcome.FAILED
+            self._audit(
+                user_id,
+                notification_type,
+                outcomes[user_id],
+                remaining.get(user_id),
+                limiter_seconds,
+                gateway_seconds,
+                error or partial,
+            )
+        undelivered = [
+            user_id for user_id in allowed
+            if outcomes[user_id] in (SendOutcome.THROTTLED, SendOutcome.FAILED)
+        ]
+        await self._refund(undelivered, notification_type, window_reset_at)
+        return outcomes
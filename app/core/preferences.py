@@ -0,0 +1,250 @@
+"""Per-user notification preferences and opt-outs.
+
+A user's preferences live in the Redis hash `prefs:<user_id>`: a field
+per notification type set to "0" (opted out) or "1", and the field "*"
+set to "0" when the user opted out of everything. Users without a hash
+receive every type.
+
+`PreferenceStore` answers lookups from a local LRU cache with a TTL,
+batching the misses of a chunk into one pipelined round trip. Every
+update is published on a Redis channel; `PreferenceListener` subscribes
+to it and evicts the user from each store's cache at once, so the TTL
+only bounds staleness when a message is missed (e.g. while the listener
+reconnects, after which it clears the caches).
+
+A tenant's store prefixes both its keys and its invalidation channel with
+the tenant's hash tag, as the limiter does (`{shop}:prefs:<user_id>`), so
+tenants sharing a user id neither share opt-outs nor evict each other's
+cache entries.
+
+Invalidations bump a generation counter. A value read from Redis is only
+cached if its user was not invalidated (and the cache not cleared) while
+the read was in flight; otherwise it could be older than the update that
+invalidated it and outlive it until the TTL.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Mapping, Optional, Sequence
+
+from app.adapters.redis_client import RedisClient
+from app.core.cache import TTLCache
+from app.core.tenants import tenant_key_prefix
+
+logger = logging.getLogger(__name__)
+
+ALL_TYPES = "*"
+DEFAULT_CHANNEL = "prefs:invalidate"
+
+# Published instead of a user id to drop every cached entry.
+_CLEAR_ALL = "*"
+
+# Pause before resubscribing after the listener lost its connection.
+RECONNECT_PAUSE_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class Preferences:
+    """What a user agreed to receive."""
+
+    opted_out: bool = False
+    disabled_types: FrozenSet[str] = field(default_factory=frozenset)
+
+    def allows(self, notification_type: str) -> bool:
+        return not self.opted_out and notification_type not in self.disabled_types
+
+    @classmethod
+    def from_hash(cls, fields: Mapping[str, str]) -> "Preferences":
+        return cls(
+            opted_out=fields.get(ALL_TYPES) == "0",
+            disabled_types=frozenset(
+                name for name, value in fields.items() if name != ALL_TYPES and value == "0"
+            ),
+        )
+
+    def to_dict(self) -> dict:
+        return {"opted_out": self.opted_out, "disabled_types": sorted(self.disabled_types)}
+
+
+EVERYTHING = Preferences()
+
+
+class PreferenceStore:
+    """Cached preference lookups and updates of one tenant's users.
+
+    Lookups run on the event loop owning `redis_client`; `invalidate` and
+    `clear_cache` may be called from any thread.
+    """
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        cache_ttl_seconds: float = 60.0,
+        max_cache_entries: int = 100_000,
+        key_prefix: str = "prefs",
+        channel: str = DEFAULT_CHANNEL,
+        tenant_id: Optional[str] = None,
+    ) -> None:
+        self.redis_client = redis_client
+        self.tenant_id = tenant_id
+        self.key_prefix = tenant_key_prefix(key_prefix, tenant_id)
+        self.channel = tenant_key_prefix(channel, tenant_id)
+        self.hits = 0
+        self.misses = 0
+        self._cache: TTLCache[Preferences] = TTLCache(
+            ttl_seconds=cache_ttl_seconds,
+            max_entries=max_cache_entries,
+        )
+        self._lock = threading.Lock()
+        # Guarded by _lock: the generation of the latest invalidation, per
+        # user and for clear_cache, kept while any read is in flight.
+        self._generation = 0
+        self._cleared_at = 0
+        self._invalidated_at: Dict[str, int] = {}
+        self._reads = 0
+
+    def _begin_read(self) -> int:
+        with self._lock:
+            self._reads += 1
+            return self._generation
+
+    def _end_read(self, started_at: int, values: Mapping[str, Preferences]) -> None:
+        """Cache what was read, except users invalidated since `started_at`."""
+        with self._lock:
+            self._reads -= 1
+            if self._cleared_at <= started_at:
+                for user_id, value in values.items():
+                    if self._invalidated_at.get(user_id, 0) <= started_at:
+                        self._cache.set(user_id, value)
+            if not self._reads:
+                self._invalidated_at.clear()
+
+    def key(self, user_id: str) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    async def get(self, user_id: str) -> Preferences:
+        return (await self.get_many([user_id]))[user_id]
+
+    async def get_many(self, user_ids: Sequence[str]) -> Dict[str, Preferences]:
+        """Preferences per user; cache misses are fetched in one round trip."""
+        preferences: Dict[str, Preferences] = {}
+        missing = []
+        with self._lock:
+            for user_id in dict.fromkeys(user_ids):
+                cached = self._cache.get(user_id)
+                if cached is None:
+                    missing.append(user_id)
+                else:
+                    preferences[user_id] = cached
+        self.hits += len(preferences)
+        if not missing:
+            return preferences
+
+        self.misses += len(missing)
+        started_at = self._begin_read()
+        fetched: Dict[str, Preferences] = {}
+        try:
+            if len(missing) == 1:
+                hashes = [await self.redis_client.hgetall(self.key(missing[0]))]
+            else:
+                pipe = await self.redis_client.pipeline()
+                for user_id in missing:
+                    pipe.hgetall(self.key(user_id))
+                hashes = await pipe.execute()
+            for user_id, fields in zip(missing, hashes):
+                fetched[user_id] = Preferences.from_hash(fields) if fields else EVERYTHING
+        finally:
+            self._end_read(started_at, fetched)
+        preferences.update(fetched)
+        return preferences
+
+    async def allows(self, user_id: str, notification_type: str) -> bool:
+        return (await self.get(user_id)).allows(notification_type)
+
+    async def update(self, user_id: str, changes: Mapping[str, bool]) -> Preferences:
+        """Enable or disable types (or `ALL_TYPES`) and notify every instance."""
+        pipe = await self.redis_client.pipeline(transaction=True)
+        if changes:
+            pipe.hset(self.key(user_id), mapping={name: int(enabled) for name, enabled in changes.items()})
+        pipe.hgetall(self.key(user_id))
+        pipe.publish(self.channel, user_id)
+        started_at = self._begin_read()
+        preferences = None
+        try:
+            results = await pipe.execute()
+            preferences = Preferences.from_hash(results[-2])
+        finally:
+            self._end_read(started_at, {user_id: preferences} if preferences is not None else {})
+        return preferences
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            if self._reads:
+                self._invalidated_at[user_id] = self._generation
+            self._cache.invalidate(user_id)
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cleared_at = self._generation
+            self._cache.clear()
+
+
+class PreferenceListener:
+    """Evict updated users from the stores' caches as updates are published.
+
+    Subscribes to every store's channel; a message only reaches the stores
+    of the tenant it was published for.
+    """
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        stores: Sequence[PreferenceStore],
+    ) -> None:
+        self.redis_client = redis_client
+        self.stores = list(stores)
+        self.channels = sorted({store.channel for store in self.stores})
+
+    def _handle(self, user_id: str, channel: Optional[str] = None) -> None:
+        for store in self.stores:
+            if channel is not None and store.channel != channel:
+                continue
+            if user_id == _CLEAR_ALL:
+                store.clear_cache()
+            else:
+                store.invalidate(user_id)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            pubsub = await self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(*self.channels)
+                # Updates published while we were not subscribed are lost.
+                self._handle(_CLEAR_ALL)
+                while not stop.is_set():
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._handle(message["data"], message["channel"])
+            except Exception as e:
+                logger.warning(
+                    "Preference listener error: %s",
+                    e,
+                    extra={"event": "preferences.listener_error"}
+                )
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=RECONNECT_PAUSE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        await self.redis_client.close()
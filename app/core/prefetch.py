@@ -0,0 +1,151 @@
+"""Adaptive prefetch for the RabbitMQ consumer.
+
+Every delivery the broker hands over is processed concurrently, so the
+channel's prefetch count is also the consumer's concurrency. Too low and
+the gateway's latency leaves workers idle; too high and this instance
+hoards messages another consumer could be processing.
+
+`PrefetchTuner` probes for the smallest prefetch that still gains
+throughput. While the consumer is saturated (in-flight work close to the
+prefetch) it doubles the prefetch and keeps the step only if throughput
+improved; a step that did not pay off is reverted and held for a while
+before probing again. When in-flight work stays well below the prefetch,
+messages are arriving slower than they are processed, so it halves.
+"""
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Average in-flight / prefetch at or above which the consumer counts as
+# saturated, and below which the prefetch is oversized.
+SATURATED_UTILISATION = 0.8
+IDLE_UTILISATION = 0.4
+
+# Weight of the newest interval in the latency average.
+LATENCY_SMOOTHING = 0.3
+
+
+@dataclass(frozen=True)
+class PrefetchSample:
+    """Measurements over one tuning interval."""
+
+    prefetch: int
+    throughput: float
+    utilisation: float
+    latency_seconds: Optional[float]
+
+
+class PrefetchTuner:
+    """Adjust the prefetch count from observed throughput and utilisation."""
+
+    def __init__(
+        self,
+        min_prefetch: int = 1,
+        max_prefetch: int = 64,
+        initial_prefetch: Optional[int] = None,
+        interval_seconds: float = 5.0,
+        min_gain: float = 0.05,
+        hold_intervals: int = 6,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not 1 <= min_prefetch <= max_prefetch:
+            raise ValueError(
+                f"Need 1 <= min_prefetch <= max_prefetch, got {min_prefetch} and {max_prefetch}"
+            )
+        self.min_prefetch = min_prefetch
+        self.max_prefetch = max_prefetch
+        self.interval_seconds = interval_seconds
+        self.min_gain = min_gain
+        self.hold_intervals = hold_intervals
+        self._clock = clock
+        self.prefetch = self._clamp(initial_prefetch or min_prefetch)
+        self.latency_seconds: Optional[float] = None
+        self.last_sample: Optional[PrefetchSample] = None
+        # Throughput measured at the prefetch before the last increase.
+        self._baseline: Optional[PrefetchSample] = None
+        self._hold = 0
+        self._reset_interval(self._clock())
+
+    def _clamp(self, prefetch: int) -> int:
+        return max(self.min_prefetch, min(self.max_prefetch, prefetch))
+
+    def _reset_interval(self, now: float) -> None:
+        self._interval_start = now
+        self._last_observed = now
+        self._inflight = 0
+        self._inflight_area = 0.0
+        self._completed = 0
+        self._latency_total = 0.0
+
+    def observe(self, inflight: int, now: Optional[float] = None) -> None:
+        """Record the current in-flight count; call once per consume-loop pass."""
+        now = self._clock() if now is None else now
+        # Time-weighted, so busy passes (which are frequent and short) don't
+        # outweigh idle ones.
+        self._inflight_area += self._inflight * (now - self._last_observed)
+        self._inflight = inflight
+        self._last_observed = now
+
+    def record(self, latency_seconds: float) -> None:
+        """Record one finished message and how long it took to process."""
+        self._completed += 1
+        self._latency_total += latency_seconds
+
+    def adjust(self, now: Optional[float] = None) -> Optional[int]:
+        """Close the interval if it has elapsed; returns a new prefetch or None."""
+        now = self._clock() if now is None else now
+        elapsed = now - self._interval_start
+        if elapsed < self.interval_seconds:
+            return None
+
+        self.observe(self._inflight, now)
+        sample = PrefetchSample(
+            prefetch=self.prefetch,
+            throughput=self._completed / elapsed,
+            utilisation=self._inflight_area / elapsed / self.prefetch,
+            latency_seconds=self._latency_total / self._completed if self._completed else None,
+        )
+        if sample.latency_seconds is not None:
+            self.latency_seconds = (
+                sample.latency_seconds if self.latency_seconds is None
+                else LATENCY_SMOOTHING * sample.latency_seconds
+                + (1 - LATENCY_SMOOTHING) * self.latency_seconds
+            )
+        self.last_sample = sample
+        inflight = self._inflight
+        self._reset_interval(now)
+        self._inflight = inflight
+
+        target = self._target(sample)
+        if target == self.prefetch:
+            return None
+        self.prefetch = target
+        return target
+
+    def _target(self, sample: PrefetchSample) -> int:
+        if self._hold:
+            self._hold -= 1
+
+        if sample.utilisation < IDLE_UTILISATION:
+            # Supply-bound: the extra prefetch is only hoarding messages.
+            self._baseline = None
+            return self._clamp(math.ceil(self.prefetch / 2))
+
+        if sample.utilisation < SATURATED_UTILISATION:
+            return self.prefetch
+
+        baseline, self._baseline = self._baseline, None
+        if baseline is not None and baseline.prefetch < sample.prefetch:
+            if sample.throughput < baseline.throughput * (1 + self.min_gain):
+                # More concurrency didn't buy throughput (the gateway is the
+                # bottleneck); go back and stay there for a while.
+                self._hold = self.hold_intervals
+                return baseline.prefetch
+
+        if self._hold or self.prefetch >= self.max_prefetch:
+            return self.prefetch
+        self._baseline = sample
+        return self._clamp(self.prefetch * 2)
@@ -0,0 +1,86 @@
+"""Read-only view of how much of each rate limit a user has left."""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+from app.core.cache import TTLCache
+from app.core.rate_limiter import RedisRateLimiter, window_start
+
+
+@dataclass(frozen=True)
+class Quota:
+    """Remaining budget for one notification type in the current window."""
+
+    notification_type: str
+    limit: int
+    window_seconds: int
+    remaining: int
+    reset_at: int
+
+
+class QuotaService:
+    """Compute per-type quotas from the limiter's stored counters.
+
+    Results are cached per user for `cache_ttl_seconds`, so callers polling
+    the same users repeatedly do not reach Redis every time. A cached quota
+    can overstate what is left by at most what was sent during the TTL.
+    """
+
+    def __init__(
+        self,
+        limiter: RedisRateLimiter,
+        cache_ttl_seconds: float = 1.0,
+        max_cache_entries: int = 10_000,
+    ) -> None:
+        self.limiter = limiter
+        self._cache: TTLCache[Dict[str, Quota]] = TTLCache(
+            ttl_seconds=cache_ttl_seconds,
+            max_entries=max_cache_entries,
+        )
+
+    async def get_quotas(
+        self,
+        user_ids: Sequence[str],
+        now: Optional[float] = None,
+    ) -> Dict[str, Dict[str, Quota]]:
+        """Quotas for every configured type, keyed by user then type."""
+        now = time.time() if now is None else now
+        quotas: Dict[str, Dict[str, Quota]] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self._cache.get(user_id)
+            if cached is None:
+                missing.append(user_id)
+            else:
+                quotas[user_id] = cached
+
+        if missing:
+            usages = await self.limiter.usage_many(missing)
+            for user_id in missing:
+                user_quotas = self._compute(usages.get(user_id, {}), now)
+                self._cache.set(user_id, user_quotas)
+                quotas[user_id] = user_quotas
+
+        return quotas
+
+    def clear_cache(self) -> None:
+        """Drop cached quotas, e.g. after limiter state was reset."""
+        self._cache.clear()
+
+    def _compute(self, usage: Dict[str, tuple], now: float) -> Dict[str, Quota]:
+        result = {}
+        for notification_type, rule in self.limiter.config.rules.items():
+            start = window_start(now, rule.time_window_seconds)
+            stored_start, count = usage.get(notification_type, (start, 0))
+            if stored_start != start:
+                count = 0
+            result[notification_type] = Quota(
+                notification_type=notification_type,
+                limit=rule.max_count,
+                window_seconds=rule.time_window_seconds,
+                remaining=max(rule.max_count - count, 0),
+                reset_at=start + rule.time_window_seconds,
+            )
+        return result
@@ -0,0 +1,111 @@
+"""Adaptive send-rate control against provider throttling.
+
+Providers rarely publish their real limits, and those limits move. An
+`AIMDController` discovers them the way TCP finds link capacity: every
+successful send raises the allowed rate a little (additive increase),
+every throttle cuts it by a factor (multiplicative decrease). The rate
+settles just under the provider's capacity, backs off quickly when it
+shrinks, and climbs back when it recovers.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from app.core.gateway import Gateway, GatewayThrottledError, Notification
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDController:
+    """Pace sends to an additive-increase/multiplicative-decrease rate.
+
+    `rate` is in sends per second. Each success adds `increase / rate`, so
+    a second's worth of successes adds about `increase`. A throttle
+    multiplies the rate by `decrease_factor` once per congestion event:
+    sends that were already in flight when the rate was cut do not cut it
+    again. A `retry_after` from the provider pauses all sends until then.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = 10.0,
+        min_rate: float = 1.0,
+        max_rate: float = 1000.0,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        if not 0 < min_rate <= max_rate:
+            raise ValueError(f"Need 0 < min_rate <= max_rate, got {min_rate} and {max_rate}")
+        if not 0 < decrease_factor < 1:
+            raise ValueError(f"decrease_factor must be between 0 and 1, got {decrease_factor}")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._clock = clock
+        self._sleep = sleep
+        self.rate = max(min_rate, min(max_rate, initial_rate))
+        self.throttles = 0
+        self._next_slot = clock()
+        self._last_decrease = float("-inf")
+
+    async def acquire(self) -> float:
+        """Wait for the next send slot; returns when the send started."""
+        now = self._clock()
+        # Slots are reserved before sleeping, so concurrent callers queue up
+        # one interval apart instead of all waking at once.
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await self._sleep(slot - now)
+        return slot
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self, started_at: float, retry_after: Optional[float] = None) -> None:
+        """Record a throttle for a send that started at `started_at`."""
+        self.throttles += 1
+        now = self._clock()
+        if retry_after:
+            self._next_slot = max(self._next_slot, now + retry_after)
+        if started_at < self._last_decrease:
+            return
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._last_decrease = now
+        logger.warning(
+            "Provider throttled sends; rate lowered to %.1f/s",
+            self.rate,
+            extra={"event": "gateway.throttled", "rate": self.rate}
+        )
+
+
+class PacedGateway(Gateway):
+    """Send through `gateway` at the rate its `AIMDController` allows.
+
+    Throttles are fed to the controller and re-raised, so the caller can
+    retry the notification later instead of counting it as failed.
+    """
+
+    def __init__(self, gateway: Gateway, controller: Optional[AIMDController] = None) -> None:
+        self.gateway = gateway
+        self.controller = controller or AIMDController()
+
+    async def send(self, notification: Notification) -> bool:
+        started_at = await self.controller.acquire()
+        try:
+            result = await self.gateway.send(notification)
+        except GatewayThrottledError as e:
+            self.controller.on_throttle(started_at, e.retry_after)
+            raise
+        if result:
+            self.controller.on_success()
+        return result
+
+    async def close(self) -> None:
+        await self.gateway.close()
@@ -0,0 +1,524 @@
+"""Rate limiters enforcing `RateLimitRule`s per user and notification type.
+
+All limiters use fixed windows aligned to the epoch: a rule with a 60s
+window counts sends in [0, 60), [60, 120), ... so every instance agrees on
+where a window starts and resets without coordinating.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.adapters.redis_client import RedisClient
+from app.core.notification_rules import RateLimitConfig, RateLimitRule
+
+logger = logging.getLogger(__name__)
+
+# (user_id, notification_type, window_start)
+CounterKey = Tuple[str, str, int]
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    """Outcome of counting one send against a user's budget.
+
+    `remaining` and `reset_at` are None for types without a rule.
+    """
+
+    allowed: bool
+    remaining: Optional[int] = None
+    reset_at: Optional[int] = None
+
+
+UNLIMITED = RateLimitDecision(allowed=True)
+
+
+def window_start(now: float, window_seconds: int) -> int:
+    """Start (epoch seconds) of the fixed window containing `now`."""
+    return int(now) - int(now) % window_seconds
+
+
+def decide(rule: RateLimitRule, count: int, start: int, allowed: bool) -> RateLimitDecision:
+    """Build a decision from the post-hit count of a window."""
+    return RateLimitDecision(
+        allowed=allowed,
+        remaining=max(rule.max_count - count, 0),
+        reset_at=start + rule.time_window_seconds,
+    )
+
+
+class RateLimiter(ABC):
+    """Abstract base class for rate limiters."""
+
+    def __init__(self, config: RateLimitConfig) -> None:
+        self.config = config
+
+    @abstractmethod
+    async def hit(
+        self,
+        user_id: str,
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> RateLimitDecision:
+        """Count one send if the user still has budget for it.
+
+        Denied sends are not counted.
+        """
+
+    async def hit_many(
+        self,
+        user_ids: Sequence[str],
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> List[RateLimitDecision]:
+        """`hit` for several users, in order. Subclasses may batch the calls."""
+        return [await self.hit(user_id, notification_type, now) for user_id in user_ids]
+
+    @abstractmethod
+    async def refund(self, user_id: str, notification_type: str, reset_at: int) -> None:
+        """Give back a send counted in the window ending at `reset_at`.
+
+        For sends that were allowed but not delivered, so retrying them does
+        not use up the user's budget. Nothing happens once the window closed.
+        """
+
+    async def refund_many(self, user_ids: Sequence[str], notification_type: str, reset_at: int) -> None:
+        """`refund` for several users. Subclasses may batch the calls."""
+        for user_id in user_ids:
+            await self.refund(user_id, notification_type, reset_at)
+
+    async def warmup(self) -> None:
+        """Prepare for the first hit (connections, scripts); nothing by default."""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Limiter shared by all instances, backed by one Redis hash per user.
+
+    Every type's counter for a user lives in the hash `<prefix>:<user_id>`,
+    one field per notification type. Each field is 8 bytes: the window
+    start and the count, both big-endian uint32 (`struct` format `>I4I4`).
+    The key's TTL is refreshed to the longest configured window on every
+    write, so one expiry covers every field.
+    """
+
+    # Check-and-increment in one round trip so concurrent consumers cannot
+    # both take the last slot.
+    _HIT_SCRIPT = """
+local start = tonumber(ARGV[2])
+local count = 0
+local packed = redis.call('HGET', KEYS[1], ARGV[1])
+if packed then
+    local stored_start, stored_count = struct.unpack('>I4I4', packed)
+    if stored_start == start then
+        count = stored_count
+    end
+end
+if count >= tonumber(ARGV[3]) then
+    return {0, count}
+end
+count = count + 1
+redis.call('HSET', KEYS[1], ARGV[1], struct.pack('>I4I4', start, count))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {1, count}
+"""
+
+    # ARGV: ttl, then (type, window_start, count) triples. Counts for the
+    # stored window are added; an older stored window is replaced.
+    _ADD_SCRIPT = """
+for i = 2, #ARGV, 3 do
+    local start = tonumber(ARGV[i + 1])
+    local count = tonumber(ARGV[i + 2])
+    local packed = redis.call('HGET', KEYS[1], ARGV[i])
+    local stored_start, stored_count = start, 0
+    if packed then
+        stored_start, stored_count = struct.unpack('>I4I4', packed)
+    end
+    if stored_start == start then
+        count = count + stored_count
+    end
+    if stored_start <= start then
+        redis.call('HSET', KEYS[1], ARGV[i], struct.pack('>I4I4', start, count))
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+    # ARGV: type, window_start. Takes one send back from that window, if it
+    # is still the stored one.
+    _REFUND_SCRIPT = """
+local packed = redis.call('HGET', KEYS[1], ARGV[1])
+if not packed then
+    return 0
+end
+local start, count = struct.unpack('>I4I4', packed)
+if start ~= tonumber(ARGV[2]) or count == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], struct.pack('>I4I4', start, count - 1))
+return 1
+"""
+
+    # Returns a flat list of (type, window_start, count) triples.
+    _USAGE_SCRIPT = """
+local result = {}
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local start, count = struct.unpack('>I4I4', fields[i + 1])
+    result[#result + 1] = fields[i]
+    result[#result + 1] = start
+    result[#result + 1] = count
+end
+return result
+"""
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        config: RateLimitConfig,
+        key_prefix: str = "ratelimit",
+    ) -> None:
+        super().__init__(config)
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+
+    def key(self, user_id: str) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    @property
+    def ttl_seconds(self) -> int:
+        """Expiry for a user's hash: the longest configured window."""
+        return max(
+            (rule.time_window_seconds for rule in self.config.rules.values()),
+            default=1,
+        )
+
+    async def hit(
+        self,
+        user_id: str,
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> RateLimitDecision:
+        rule = self.config.get_rule(notification_type)
+        if rule is None:
+            return UNLIMITED
+
+        now = time.time() if now is None else now
+        start = window_start(now, rule.time_window_seconds)
+        allowed, count = await self.redis_client.eval_script(
+            self._HIT_SCRIPT,
+            keys=[self.key(user_id)],
+            args=[notification_type, start, rule.max_count, self.ttl_seconds],
+        )
+        return decide(rule, int(count), start, bool(allowed))
+
+    async def hit_many(
+        self,
+        user_ids: Sequence[str],
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> List[RateLimitDecision]:
+        rule = self.config.get_rule(notification_type)
+        if rule is None:
+            return [UNLIMITED] * len(user_ids)
+
+        now = time.time() if now is None else now
+        start = window_start(now, rule.time_window_seconds)
+        args = [notification_type, start, rule.max_count, self.ttl_seconds]
+        results = await self.redis_client.eval_script_many(
+            self._HIT_SCRIPT, [([self.key(user_id)], args) for user_id in user_ids]
+        )
+        return [decide(rule, int(count), start, bool(allowed)) for allowed, count in results]
+
+    async def refund(self, user_id: str, notification_type: str, reset_at: int) -> None:
+        await self.refund_many([user_id], notification_type, reset_at)
+
+    async def refund_many(self, user_ids: Sequence[str], notification_type: str, reset_at: int) -> None:
+        rule = self.config.get_rule(notification_type)
+        if rule is None or not user_ids:
+            return
+        args = [notification_type, reset_at - rule.time_window_seconds]
+        await self.redis_client.eval_script_many(
+            self._REFUND_SCRIPT, [([self.key(user_id)], args) for user_id in user_ids]
+        )
+
+    async def usage(self, user_id: str) -> Dict[str, Tuple[int, int]]:
+        """Stored (window_start, count) per notification type for one user."""
+        flat = await self.redis_client.eval_script(
+            self._USAGE_SCRIPT,
+            keys=[self.key(user_id)],
+            args=[],
+        )
+        return self._parse_usage(flat)
+
+    async def usage_many(self, user_ids: Sequence[str]) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """`usage` for several users in a single pipelined round trip."""
+        results = await self.redis_client.eval_script_many(
+            self._USAGE_SCRIPT, [([self.key(user_id)], []) for user_id in user_ids]
+        )
+        return {
+            user_id: self._parse_usage(flat)
+            for user_id, flat in zip(user_ids, results)
+        }
+
+    @staticmethod
+    def _parse_usage(flat: list) -> Dict[str, Tuple[int, int]]:
+        return {
+            flat[i]: (int(flat[i + 1]), int(flat[i + 2]))
+            for i in range(0, len(flat), 3)
+        }
+
+    async def ping(self) -> bool:
+        return await self.redis_client.ping()
+
+    async def warmup(self) -> None:
+        """Open a connection and load the scripts, so the first hit pays neither."""
+        await self.redis_client.load_scripts(
+            [self._HIT_SCRIPT, self._ADD_SCRIPT, self._REFUND_SCRIPT, self._USAGE_SCRIPT]
+        )
+
+    async def add_counts(self, counts: Dict[CounterKey, int], now: Optional[float] = None) -> None:
+        """Fold counts taken elsewhere (e.g. while degraded) into Redis."""
+        now = time.time() if now is None else now
+        per_user: Dict[str, list] = {}
+        for (user_id, notification_type, start), count in counts.items():
+            rule = self.config.get_rule(notification_type)
+            if rule is None or start + rule.time_window_seconds <= now:
+                continue
+            per_user.setdefault(user_id, []).extend([notification_type, start, count])
+
+        if not per_user:
+            return
+        await self.redis_client.eval_script_many(
+            self._ADD_SCRIPT,
+            [([self.key(user_id)], [self.ttl_seconds, *triples]) for user_id, triples in per_user.items()],
+        )
+
+
+class LocalRateLimiter(RateLimiter):
+    """In-process approximation used while Redis is unavailable.
+
+    Each instance enforces its share (rounded up) of every rule's budget,
+    so the fleet as a whole stays close to the configured limit.
+    """
+
+    def __init__(
+        self,
+        config: RateLimitConfig,
+        instance_count: int = 1,
+        max_entries: int = 100_000,
+    ) -> None:
+        if instance_count <= 0:
+            raise ValueError(f"instance_count must be positive, got {instance_count}")
+        super().__init__(config)
+        self.instance_count = instance_count
+        self.max_entries = max_entries
+        self._counters: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+    def budget(self, rule: RateLimitRule) -> int:
+        return math.ceil(rule.max_count / self.instance_count)
+
+    async def hit(
+        self,
+        user_id: str,
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> RateLimitDecision:
+        rule = self.config.get_rule(notification_type)
+        if rule is None:
+            return UNLIMITED
+
+        now = time.time() if now is None else now
+        start = window_start(now, rule.time_window_seconds)
+        key = (user_id, notification_type)
+        stored_start, count = self._counters.get(key, (start, 0))
+        if stored_start != start:
+            count = 0
+
+        budget = self.budget(rule)
+        if count >= budget:
+            return RateLimitDecision(allowed=False, remaining=0, reset_at=start + rule.time_window_seconds)
+
+        if key not in self._counters and len(self._counters) >= self.max_entries:
+            self._prune(now)
+        self._counters[key] = (start, count + 1)
+        return RateLimitDecision(
+            allowed=True,
+            remaining=budget - count - 1,
+            reset_at=start + rule.time_window_seconds,
+        )
+
+    async def refund(self, user_id: str, notification_type: str, reset_at: int) -> None:
+        rule = self.config.get_rule(notification_type)
+        if rule is None:
+            return
+        key = (user_id, notification_type)
+        stored = self._counters.get(key)
+        if stored is not None and stored[0] == reset_at - rule.time_window_seconds and stored[1] > 0:
+            self._counters[key] = (stored[0], stored[1] - 1)
+
+    def _prune(self, now: float) -> None:
+        """Forget counters whose window has already closed."""
+        for key, (start, _) in list(self._counters.items()):
+            rule = self.config.get_rule(key[1])
+            if rule is None or start + rule.time_window_seconds <= now:
+                del self._counters[key]
+
+    def drain_counts(self) -> Dict[CounterKey, int]:
+        """Return and forget all counts taken so far."""
+        counts = {
+            (user_id, notification_type, start): count
+            for (user_id, notification_type), (start, count) in self._counters.items()
+        }
+        self._counters.clear()
+        return counts
+
+    def restore_counts(self, counts: Dict[CounterKey, int]) -> None:
+        """Put back counts returned by `drain_counts` that could not be reconciled."""
+        for (user_id, notification_type, start), count in counts.items():
+            key = (user_id, notification_type)
+            stored_start, stored = self._counters.get(key, (start, 0))
+            if stored_start == start:
+                self._counters[key] = (start, stored + count)
+            elif stored_start < start:
+                self._counters[key] = (start, count)
+
+
+class FailoverRateLimiter(RateLimiter):
+    """Use Redis while it is healthy and fall back to a local limiter when not.
+
+    A Redis error or a call slower than `latency_budget_seconds` opens the
+    circuit. While open, Redis is probed with PING at most once every
+    `probe_interval_seconds`; on success the local counts are added to Redis
+    and the circuit closes again.
+    """
+
+    BATCH_BUDGET_SIZE = 100
+
+    def __init__(
+        self,
+        primary: RedisRateLimiter,
+        fallback: LocalRateLimiter,
+        latency_budget_seconds: float = 0.05,
+        probe_interval_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(primary.config)
+        self.primary = primary
+        self.fallback = fallback
+        self.latency_budget_seconds = latency_budget_seconds
+        self.probe_interval_seconds = probe_interval_seconds
+        self._clock = clock
+        self._next_probe_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def degraded(self) -> bool:
+        return self._next_probe_at is not None
+
+    async def hit(
+        self,
+        user_id: str,
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> RateLimitDecision:
+        if self.degraded and self._clock() >= self._next_probe_at and not self._probing:
+            await self._probe()
+
+        if self.degraded:
+            return await self.fallback.hit(user_id, notification_type, now)
+
+        try:
+            return await asyncio.wait_for(
+                self.primary.hit(user_id, notification_type, now),
+                timeout=self.latency_budget_seconds,
+            )
+        except Exception as e:
+            self._trip(e)
+            return await self.fallback.hit(user_id, notification_type, now)
+
+    async def hit_many(
+        self,
+        user_ids: Sequence[str],
+        notification_type: str,
+        now: Optional[float] = None,
+    ) -> List[RateLimitDecision]:
+        if self.degraded and self._clock() >= self._next_probe_at and not self._probing:
+            await self._probe()
+
+        if self.degraded:
+            return await self.fallback.hit_many(user_ids, notification_type, now)
+
+        # A pipelined batch is one round trip but more work on the server,
+        # so it gets one latency budget per BATCH_BUDGET_SIZE decisions.
+        budgets = max(math.ceil(len(user_ids) / self.BATCH_BUDGET_SIZE), 1)
+        try:
+            return await asyncio.wait_for(
+                self.primary.hit_many(user_ids, notification_type, now),
+                timeout=self.latency_budget_seconds * budgets,
+            )
+        except Exception as e:
+            self._trip(e)
+            return await self.fallback.hit_many(user_ids, notification_type, now)
+
+    async def warmup(self) -> None:
+        # Unbounded by the latency budget: connecting is what warmup is for.
+        # If Redis is down, start out degraded instead of on the first hit.
+        try:
+            await self.primary.warmup()
+        except Exception as e:
+            self._trip(e)
+            raise
+
+    async def refund(self, user_id: str, notification_type: str, reset_at: int) -> None:
+        await self.refund_many([user_id], notification_type, reset_at)
+
+    async def refund_many(self, user_ids: Sequence[str], notification_type: str, reset_at: int) -> None:
+        if self.degraded:
+            await self.fallback.refund_many(user_ids, notification_type, reset_at)
+            return
+        budgets = max(math.ceil(len(user_ids) / self.BATCH_BUDGET_SIZE), 1)
+        try:
+            await asyncio.wait_for(
+                self.primary.refund_many(user_ids, notification_type, reset_at),
+                timeout=self.latency_budget_seconds * budgets,
+            )
+        except Exception as e:
+            # The sends were counted in Redis; a lost refund only errs strict.
+            self._trip(e)
+
+    def _trip(self, error: Exception) -> None:
+        if not self.degraded:
+            logger.warning(
+                "Redis limiter unavailable, switching to local limiting: %r",
+                error,
+                extra={"event": "ratelimit.degraded"},
+            )
+        self._next_probe_at = self._clock() + self.probe_interval_seconds
+
+    async def _probe(self) -> None:
+        self._probing = True
+        try:
+            await asyncio.wait_for(self.primary.ping(), timeout=self.latency_budget_seconds)
+            counts = self.fallback.drain_counts()
+            try:
+                await self.primary.add_counts(counts)
+            except Exception:
+                self.fallback.restore_counts(counts)
+                raise
+        except Exception as e:
+            self._trip(e)
+        else:
+            self._next_probe_at = None
+            logger.info(
+                "Redis limiter recovered, reconciled %d local counters",
+                len(counts),
+                extra={"event": "ratelimit.recovered"},
+            )
+        finally:
+            self._probing = False
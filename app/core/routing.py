@@ -0,0 +1,131 @@
+"""Route notifications to one or more delivery channels by type."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+from app.core.gateway import DeliveryFailedError, Gateway, GatewayThrottledError, Notification
+from app.core.notification_rules import RateLimitConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChannelResult:
+    """Outcome of sending a notification through one channel."""
+
+    channel: str
+    sent: bool
+    error: Optional[BaseException] = None
+
+    @property
+    def throttled(self) -> bool:
+        return isinstance(self.error, GatewayThrottledError)
+
+
+@dataclass(frozen=True)
+class DispatchResult:
+    """Per-channel outcomes of one notification."""
+
+    results: Tuple[ChannelResult, ...]
+
+    @property
+    def sent(self) -> bool:
+        """Whether every channel delivered."""
+        return all(result.sent for result in self.results)
+
+    @property
+    def delivered(self) -> Tuple[str, ...]:
+        return tuple(result.channel for result in self.results if result.sent)
+
+    @property
+    def failed(self) -> Tuple[ChannelResult, ...]:
+        return tuple(result for result in self.results if not result.sent)
+
+
+class GatewayRegistry(Gateway):
+    """A gateway that fans each notification out to its type's channels.
+
+    `routes` maps a notification type to channel names; types without a
+    route use `default_channels`. A multi-channel notification is sent on
+    all its channels concurrently, so it takes as long as the slowest one.
+
+    As a `Gateway`, `send` returns True once any channel delivered. If
+    no channel delivered, the first error is re-raised (a throttle
+    preferred), or `DeliveryFailedError` if every channel returned False,
+    since retrying cannot duplicate anything. A partial delivery is
+    logged and counts as delivered rather than raising, so the channels
+    that did deliver are not sent to again; `deliver` also reports which
+    channels failed.
+    """
+
+    def __init__(
+        self,
+        channels: Mapping[str, Gateway],
+        routes: Optional[Mapping[str, Sequence[str]]] = None,
+        default_channels: Sequence[str] = (),
+        config: Optional[RateLimitConfig] = None,
+    ) -> None:
+        routes = dict(routes or {})
+        for notification_type, names in {**routes, None: default_channels}.items():
+            unknown = [name for name in names if name not in channels]
+            if unknown:
+                raise ValueError(f"Unknown channel(s) {unknown} for type {notification_type!r}")
+        if config is not None:
+            unknown_types = [t for t in routes if config.get_rule(t) is None]
+            if unknown_types:
+                raise ValueError(f"Routes for unknown notification type(s): {unknown_types}")
+        self.channels = dict(channels)
+        self.routes = {t: tuple(dict.fromkeys(names)) for t, names in routes.items()}
+        self.default_channels = tuple(dict.fromkeys(default_channels))
+
+    def channels_for(self, notification_type: str) -> Tuple[str, ...]:
+        return self.routes.get(notification_type, self.default_channels)
+
+    async def dispatch(self, notification: Notification) -> DispatchResult:
+        """Send on every routed channel concurrently and collect the outcomes."""
+        names = self.channels_for(notification.notification_type)
+        if not names:
+            raise ValueError(f"No channel configured for type {notification.notification_type!r}")
+
+        outcomes = await asyncio.gather(
+            *(self.channels[name].send(notification) for name in names),
+            return_exceptions=True,
+        )
+        return DispatchResult(tuple(
+            ChannelResult(name, sent=False, error=outcome) if isinstance(outcome, BaseException)
+            else ChannelResult(name, sent=bool(outcome))
+            for name, outcome in zip(names, outcomes)
+        ))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(channel.close() for channel in self.channels.values()))
+
+    async def deliver(self, notification: Notification) -> DispatchResult:
+        """Dispatch, raising unless at least one channel delivered."""
+        result = await self.dispatch(notification)
+        if not result.delivered:
+            errors = [r.error for r in result.failed if r.error is not None]
+            if errors:
+                throttles = [e for e in errors if isinstance(e, GatewayThrottledError)]
+                raise (throttles or errors)[0]
+            raise DeliveryFailedError(
+                f"No channel delivered the notification for user {notification.user_id}"
+            )
+
+        for failure in result.failed:
+            logger.warning(
+                "Channel '%s' failed for user_id=%s, type=%s: %s",
+                failure.channel,
+                notification.user_id,
+                notification.notification_type,
+                failure.error or "send returned False",
+                extra={"event": "notification.channel_failed", "channel": failure.channel}
+            )
+        return result
+
+    async def send(self, notification: Notification) -> bool:
+        await self.deliver(notification)
+        return True
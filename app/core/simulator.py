@@ -0,0 +1,423 @@
+"""Offline replay of notification traffic through rate limit rules.
+
+A `Trace` is a column-oriented list of (timestamp, user, type) events:
+recorded (CSV, audit log files) or synthetic. `replay` decides every
+event against a `RateLimitConfig` using the events' own timestamps as
+the clock, so a month of traffic replays in seconds.
+
+Windows are fixed and aligned to the epoch and denied sends are not
+counted (see `app.core.rate_limiter`), so an event is allowed exactly
+when fewer than `max_count` earlier events of the same user fell in its
+window. `replay` computes that rank for all events of a type at once
+with NumPy: sort by (user, window, time), find where each (user, window)
+run starts, and compare each event's offset in its run with the budget.
+`replay_reference` makes the same decisions one event at a time through
+`LocalRateLimiter`, for checking the vectorized path.
+
+Events may belong to tenants. A user is then a (tenant, user id) pair, and
+given `TenantRuleSets` each tenant's events are decided under its own
+rules, as the service does; a plain `RateLimitConfig` applies to all.
+"""
+from __future__ import annotations
+
+import csv
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.core.notification_rules import ON_LIMIT_BEHAVIORS, ON_LIMIT_DIGEST, RateLimitConfig, RateLimitRule
+from app.core.rate_limiter import LocalRateLimiter
+from app.core.tenants import TenantRuleSets
+
+Rules = Union[RateLimitConfig, TenantRuleSets]
+
+_RULE_SPEC = re.compile(
+    r"^(?P<type>[^=]+)=(?:(?P<none>none)|(?P<count>\d+)/(?P<seconds>\d+)s?(?::(?P<on_limit>\w+))?)$"
+)
+
+
+@dataclass
+class Trace:
+    """Events as parallel arrays; users and types are integer codes into the name arrays.
+
+    With tenants, `user_tenants` holds each user's code into `tenant_names`,
+    whose first entry is the default tenant (None); without, both are None.
+    """
+
+    timestamps: np.ndarray
+    users: np.ndarray
+    types: np.ndarray
+    user_names: np.ndarray
+    type_names: np.ndarray
+    user_tenants: Optional[np.ndarray] = None
+    tenant_names: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def from_events(cls, events: Iterable[Tuple]) -> "Trace":
+        """(timestamp, user_id, type) events, optionally with a tenant id as a fourth item."""
+        timestamps, users, types = [], [], []
+        for ts, user_id, notification_type, *tenant in events:
+            timestamps.append(float(ts))
+            users.append((tenant[0] if tenant else None, user_id))
+            types.append(notification_type)
+        user_keys: Dict[Tuple[Optional[str], str], int] = {}
+        user_codes = [user_keys.setdefault(key, len(user_keys)) for key in users]
+        type_names, type_codes = np.unique(np.array(types, dtype=object), return_inverse=True)
+        user_tenants = tenant_names = None
+        tenants = sorted({tenant_id for tenant_id, _ in user_keys if tenant_id is not None})
+        if tenants:
+            tenant_names = np.array([None] + tenants, dtype=object)
+            tenant_codes = {tenant_id: code for code, tenant_id in enumerate(tenant_names)}
+            user_tenants = np.array([tenant_codes[tenant_id] for tenant_id, _ in user_keys], dtype=np.int64)
+        return cls(
+            timestamps=np.array(timestamps, dtype=np.float64),
+            users=np.array(user_codes, dtype=np.int64),
+            types=type_codes.astype(np.int64),
+            user_names=np.array([user_id for _, user_id in user_keys], dtype=object),
+            type_names=type_names,
+            user_tenants=user_tenants,
+            tenant_names=tenant_names,
+        )
+
+    @classmethod
+    def from_csv(cls, path: Union[str, Path]) -> "Trace":
+        """Rows of `timestamp,user_id,type`; a header row is skipped."""
+        def rows():
+            with open(path, newline="") as f:
+                for row in csv.reader(f):
+                    if not row or row[0].strip().lower() in ("ts", "timestamp"):
+                        continue
+                    yield row[0], row[1], row[2]
+        return cls.from_events(rows())
+
+    @classmethod
+    def from_audit_files(cls, paths: Sequence[Union[str, Path]]) -> "Trace":
+        """One event per send requested of the service, from `AuditLog` files.
+
+        Opt-outs never reached the limiter and digest deliveries repeat
+        sends counted when they were buffered, so neither is replayed.
+        FAILED and THROTTLED attempts were refunded and the message was
+        retried; the retry's row stands for the request, so a request
+        whose last retry failed as well is not replayed either.
+        """
+        from app.core.audit import SOURCE_DIGEST, read_records
+        from app.core.notification_service import SendOutcome
+
+        skipped = {SendOutcome.OPTED_OUT.value, SendOutcome.FAILED.value, SendOutcome.THROTTLED.value}
+        return cls.from_events(
+            (record["ts"], record["user_id"], record["type"], record["tenant_id"])
+            for path in sorted(paths)
+            for record in read_records(path)
+            if record["outcome"] not in skipped and record["source"] != SOURCE_DIGEST
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Trace":
+        with np.load(path) as data:
+            user_tenants = tenant_names = None
+            if "tenant_names" in data.files:
+                user_tenants = data["user_tenants"]
+                tenant_names = np.array([None] + data["tenant_names"].tolist()[1:], dtype=object)
+            return cls(
+                timestamps=data["timestamps"],
+                users=data["users"],
+                types=data["types"],
+                user_names=data["user_names"].astype(object),
+                type_names=data["type_names"].astype(object),
+                user_tenants=user_tenants,
+                tenant_names=tenant_names,
+            )
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Store as .npz, which loads far faster than re-parsing the source."""
+        tenants = {}
+        if self.tenant_names is not None:
+            # Tenant ids are never empty, so "" stands for the default tenant.
+            tenants = {
+                "user_tenants": self.user_tenants,
+                "tenant_names": np.array([""] + list(self.tenant_names[1:]), dtype=str),
+            }
+        np.savez_compressed(
+            path,
+            timestamps=self.timestamps,
+            users=self.users,
+            types=self.types,
+            user_names=self.user_names.astype(str),
+            type_names=self.type_names.astype(str),
+            **tenants,
+        )
+
+    def event_tenants(self) -> np.ndarray:
+        """Each event's code into `tenant_names`; all 0 (default) without tenants."""
+        if self.user_tenants is None:
+            return np.zeros(len(self), dtype=np.int64)
+        return self.user_tenants[self.users]
+
+    def tenant_name(self, code: int) -> Optional[str]:
+        return None if self.tenant_names is None else self.tenant_names[code]
+
+    def events(self) -> Iterable[Tuple]:
+        """Events in time order, with the tenant id as a fourth item if the trace has tenants."""
+        tenants = self.event_tenants()
+        for i in np.argsort(self.timestamps, kind="stable"):
+            event = (
+                float(self.timestamps[i]),
+                self.user_names[self.users[i]],
+                self.type_names[self.types[i]],
+            )
+            yield event if self.tenant_names is None else event + (self.tenant_name(tenants[i]),)
+
+
+def synthetic_trace(
+    users: int = 10_000,
+    days: float = 30.0,
+    events_per_user_per_day: float = 2.0,
+    type_weights: Optional[Dict[str, float]] = None,
+    start: float = 1_700_006_400.0,
+    seed: Optional[int] = None,
+) -> Trace:
+    """Random traffic with heavy-tailed activity: a few users get many notifications.
+
+    Per-user rates are log-normal around `events_per_user_per_day` and
+    arrival times are uniform over the period.
+    """
+    rng = np.random.default_rng(seed)
+    type_weights = type_weights or {"status": 0.5, "news": 0.2, "marketing": 0.3}
+    rates = rng.lognormal(mean=0.0, sigma=1.0, size=users)
+    rates *= events_per_user_per_day / rates.mean()
+    counts = rng.poisson(rates * days)
+    user_codes = np.repeat(np.arange(users, dtype=np.int64), counts)
+    n = len(user_codes)
+
+    type_names = np.array(sorted(type_weights), dtype=object)
+    weights = np.array([type_weights[name] for name in type_names], dtype=np.float64)
+    order = np.argsort(rng.random(n), kind="stable")
+    return Trace(
+        timestamps=np.sort(start + rng.random(n) * days * 86400.0),
+        users=user_codes[order],
+        types=rng.choice(len(type_names), size=n, p=weights / weights.sum()).astype(np.int64),
+        user_names=np.array([f"user{i}" for i in range(users)], dtype=object),
+        type_names=type_names,
+    )
+
+
+def parse_rule(spec: str) -> Tuple[str, Optional[RateLimitRule]]:
+    """`type=count/seconds[:digest]`, or `type=none` to remove the limit."""
+    match = _RULE_SPEC.match(spec.strip())
+    if match is None:
+        raise ValueError(f"Invalid rule {spec!r}; expected type=count/seconds[:on_limit] or type=none")
+    notification_type = match["type"].strip()
+    if match["none"]:
+        return notification_type, None
+    on_limit = match["on_limit"] or ON_LIMIT_BEHAVIORS[0]
+    return notification_type, RateLimitRule(
+        type=notification_type,
+        max_count=int(match["count"]),
+        time_window_seconds=int(match["seconds"]),
+        on_limit=on_limit,
+    )
+
+
+def with_overrides(
+    config: RateLimitConfig, overrides: Sequence[Tuple[str, Optional[RateLimitRule]]]
+) -> RateLimitConfig:
+    """A copy of `config` with rules replaced or (for None) removed."""
+    candidate = RateLimitConfig()
+    candidate.rules = dict(config.rules)
+    for notification_type, rule in overrides:
+        if rule is None:
+            candidate.rules.pop(notification_type, None)
+        else:
+            candidate.add_rule(rule, overwrite=True)
+    return candidate
+
+
+def rule_label(rule: Optional[RateLimitRule]) -> str:
+    if rule is None:
+        return "unlimited"
+    label = f"{rule.max_count}/{rule.time_window_seconds}s"
+    return f"{label}:{rule.on_limit}" if rule.on_limit == ON_LIMIT_DIGEST else label
+
+
+@dataclass
+class TypeReport:
+    """Decisions for one notification type (of one tenant)."""
+
+    type: str
+    rule: str
+    events: int
+    allowed: int
+    users: int
+    users_limited: int
+    digests: int
+    peak_per_window: int
+    tenant_id: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        """Key in `ReplayResult.reports`: the type, prefixed by a tenant's id."""
+        return self.type if self.tenant_id is None else f"{self.tenant_id}/{self.type}"
+
+    @property
+    def denied(self) -> int:
+        return self.events - self.allowed
+
+    @property
+    def denied_ratio(self) -> float:
+        return self.denied / self.events if self.events else 0.0
+
+
+@dataclass
+class ReplayResult:
+    allowed: np.ndarray
+    reports: Dict[str, TypeReport]
+
+    @property
+    def events(self) -> int:
+        return len(self.allowed)
+
+    @property
+    def denied(self) -> int:
+        return int(self.events - np.count_nonzero(self.allowed))
+
+
+def _rank_in_windows(users: np.ndarray, windows: np.ndarray, timestamps: np.ndarray):
+    """Sort order, and each sorted event's offset within its (user, window) run."""
+    order = np.lexsort((timestamps, windows, users))
+    u = users[order]
+    w = windows[order]
+    n = len(order)
+    run_start = np.ones(n, dtype=bool)
+    run_start[1:] = (u[1:] != u[:-1]) | (w[1:] != w[:-1])
+    positions = np.arange(n)
+    first = np.maximum.accumulate(np.where(run_start, positions, 0))
+    return order, positions - first, run_start
+
+
+def _config_for(config: Rules, tenant_id: Optional[str]) -> RateLimitConfig:
+    """The tenant's rules; raises ValueError for a tenant the rule sets do not know."""
+    if isinstance(config, TenantRuleSets):
+        return config.config_for(tenant_id)
+    return config
+
+
+def replay(trace: Trace, config: Rules) -> ReplayResult:
+    """Decide every event of `trace` under `config`."""
+    allowed = np.ones(len(trace), dtype=bool)
+    reports: Dict[str, TypeReport] = {}
+    tenants = trace.event_tenants()
+    for code, notification_type in enumerate(trace.type_names):
+        (of_type,) = np.nonzero(trace.types == code)
+        for tenant_code in np.unique(tenants[of_type]):
+            indices = of_type[tenants[of_type] == tenant_code]
+            tenant_id = trace.tenant_name(tenant_code)
+            rule = _config_for(config, tenant_id).get_rule(notification_type)
+            report = _replay_group(trace, indices, notification_type, tenant_id, rule, allowed)
+            reports[report.label] = report
+    return ReplayResult(allowed=allowed, reports=reports)
+
+
+def _replay_group(
+    trace: Trace,
+    indices: np.ndarray,
+    notification_type: str,
+    tenant_id: Optional[str],
+    rule: Optional[RateLimitRule],
+    allowed: np.ndarray,
+) -> TypeReport:
+    """Decide the events at `indices`, all of one type and tenant, into `allowed`."""
+    users = trace.users[indices]
+    if rule is None:
+        return TypeReport(
+            type=notification_type,
+            rule=rule_label(None),
+            events=len(indices),
+            allowed=len(indices),
+            users=len(np.unique(users)),
+            users_limited=0,
+            digests=0,
+            peak_per_window=0,
+            tenant_id=tenant_id,
+        )
+
+    timestamps = trace.timestamps[indices]
+    windows = np.floor(timestamps).astype(np.int64) // rule.time_window_seconds
+    order, rank, run_start = _rank_in_windows(users, windows, timestamps)
+    decided = rank < rule.max_count
+    allowed[indices[order]] = decided
+
+    # A run that reaches the budget has exactly one event at rank max_count.
+    overflowing = rank == rule.max_count
+    run_lengths = np.diff(np.append(np.nonzero(run_start)[0], len(order)))
+    return TypeReport(
+        type=notification_type,
+        rule=rule_label(rule),
+        events=len(indices),
+        allowed=int(np.count_nonzero(decided)),
+        users=len(np.unique(users)),
+        users_limited=len(np.unique(users[order][overflowing])),
+        digests=int(np.count_nonzero(overflowing)) if rule.on_limit == ON_LIMIT_DIGEST else 0,
+        peak_per_window=int(run_lengths.max()),
+        tenant_id=tenant_id,
+    )
+
+
+async def replay_reference(trace: Trace, config: Rules) -> np.ndarray:
+    """Decide events one at a time with `LocalRateLimiter` on the virtual clock."""
+    limiters: Dict[Optional[str], LocalRateLimiter] = {}
+    tenants = trace.event_tenants()
+    allowed = np.ones(len(trace), dtype=bool)
+    for i in np.argsort(trace.timestamps, kind="stable"):
+        tenant_id = trace.tenant_name(tenants[i])
+        limiter = limiters.get(tenant_id)
+        if limiter is None:
+            limiter = limiters[tenant_id] = LocalRateLimiter(
+                _config_for(config, tenant_id), max_entries=len(trace) + 1
+            )
+        decision = await limiter.hit(
+            trace.user_names[trace.users[i]],
+            trace.type_names[trace.types[i]],
+            now=float(trace.timestamps[i]),
+        )
+        allowed[i] = decision.allowed
+    return allowed
+
+
+@dataclass
+class Comparison:
+    """How a candidate rule set would have decided the same traffic."""
+
+    baseline: ReplayResult
+    candidate: ReplayResult
+
+    @property
+    def newly_denied(self) -> int:
+        return int(np.count_nonzero(self.baseline.allowed & ~self.candidate.allowed))
+
+    @property
+    def newly_allowed(self) -> int:
+        return int(np.count_nonzero(~self.baseline.allowed & self.candidate.allowed))
+
+
+def compare(trace: Trace, baseline: Rules, candidate: Rules) -> Comparison:
+    return Comparison(baseline=replay(trace, baseline), candidate=replay(trace, candidate))
+
+
+def format_reports(reports: Dict[str, TypeReport]) -> List[str]:
+    lines = [
+        f"{'type':<14}{'rule':>18}{'events':>12}{'allowed':>12}{'denied':>12}"
+        f"{'denied %':>10}{'users':>10}{'limited':>10}{'digests':>10}{'peak/win':>10}"
+    ]
+    for report in sorted(reports.values(), key=lambda r: r.label):
+        lines.append(
+            f"{report.label:<14}{report.rule:>18}{report.events:>12}{report.allowed:>12}"
+            f"{report.denied:>12}{report.denied_ratio:>10.2%}{report.users:>10}"
+            f"{report.users_limited:>10}{report.digests:>10}{report.peak_per_window:>10}"
+        )
+    return lines
@@ -0,0 +1,86 @@
+"""Startup phases, their timings, and readiness.
+
+The application starts serving as soon as its components are built;
+warming them up (opening connections, loading scripts) and the transport
+reaching CONSUMING happen afterwards, each recorded as a phase. A warmup
+step that fails or times out is recorded but does not hold startup back:
+the component connects on first use as it would without warmup.
+`/health/ready` reports ready once warmup finished and the transport is
+consuming, and serves the timings.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Durations of named startup phases and when the service became ready."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock
+        self.started_at = clock()
+        self.phases: Dict[str, float] = {}
+        self.failed: Dict[str, str] = {}
+        self.warmed_up = False
+        self.ready_after: Optional[float] = None
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - started)
+
+    async def warm(self, name: str, step: Awaitable, timeout: float) -> bool:
+        """Run one warmup step; returns False if it failed or timed out."""
+        started = self.clock()
+        try:
+            await asyncio.wait_for(step, timeout)
+            return True
+        except Exception as e:
+            self.failed[name] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            logger.warning(
+                "Warmup step %s failed: %s",
+                name,
+                self.failed[name],
+                extra={"event": "startup.warmup_failed"}
+            )
+            return False
+        finally:
+            self.record(name, self.clock() - started)
+
+    def mark_ready(self) -> None:
+        """Record the first time the service was seen ready, and log the timings."""
+        if self.ready_after is not None:
+            return
+        self.ready_after = self.clock() - self.started_at
+        logger.info(
+            "Ready after %.3fs (%s)",
+            self.ready_after,
+            ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.phases.items()),
+            extra={"event": "startup.ready", **self.to_dict()}
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "warmed_up": self.warmed_up,
+            "ready_after_ms": None if self.ready_after is None else round(self.ready_after * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "failed": dict(self.failed),
+        }
+
+
+async def wait_until(condition: Callable[[], bool], poll_seconds: float = 0.05) -> None:
+    """Return once `condition()` holds; wrap in a timeout."""
+    while not condition():
+        await asyncio.sleep(poll_seconds)
@@ -0,0 +1,241 @@
+"""Redis Streams consumer: an alternative ingress to RabbitMQ.
+
+Producers XADD entries with a `body` field holding the same JSON payload
+as a RabbitMQ message, trimming the stream with MAXLEN. Each instance
+reads new entries in batches through a consumer group, processes a batch
+concurrently and acknowledges it with one pipelined XACK.
+
+A failed entry is simply left unacknowledged. Entries pending longer
+than `claim_idle_ms` — failed ones, and those held by a crashed instance
+— are taken over with XAUTOCLAIM and retried, so the idle time doubles
+as the retry delay. An entry that fails permanently, or `max_deliveries`
+times, is copied to `<stream>.dead` and acknowledged.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.adapters.redis_client import RedisClient
+from app.core.messages import PERMANENT_ERRORS, MessageProcessor
+from app.core.supervisor import ConsumerState
+from app.core.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+BODY_FIELD = "body"
+
+# Pause after an unexpected error (e.g. Redis unreachable) before reading again.
+ERROR_PAUSE_SECONDS = 1.0
+
+Entry = Tuple[str, Optional[Dict[str, str]]]
+
+
+async def publish(
+    redis_client: RedisClient,
+    body: str,
+    stream: str = "notifications",
+    max_len: Optional[int] = 100_000,
+) -> str:
+    """Add a message to the stream, trimming it to about `max_len` entries."""
+    return await redis_client.xadd(stream, {BODY_FIELD: body}, maxlen=max_len)
+
+
+class StreamConsumer(Transport):
+    """Consume notification messages from a Redis Stream consumer group."""
+
+    name = "redis-streams-consumer"
+
+    def __init__(
+        self,
+        processor: MessageProcessor,
+        redis_client: RedisClient,
+        stream: str = "notifications",
+        group: str = "notification-service",
+        consumer_name: Optional[str] = None,
+        batch_size: int = 100,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 60_000,
+        claim_interval_seconds: float = 5.0,
+        max_deliveries: int = 5,
+        dead_letter_max_len: Optional[int] = 100_000,
+    ) -> None:
+        self.processor = processor
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval_seconds = claim_interval_seconds
+        self.max_deliveries = max_deliveries
+        self.dead_letter_max_len = dead_letter_max_len
+        self.consuming_since: Optional[float] = None
+        self.inflight_count = 0
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self._state = ConsumerState.STARTING
+        self._claim_cursor = "0-0"
+        self._next_claim_at = 0.0
+
+    @property
+    def dead_letter_stream(self) -> str:
+        return f"{self.stream}.dead"
+
+    @property
+    def is_consuming(self) -> bool:
+        return self.consuming_since is not None
+
+    async def ensure_group(self) -> None:
+        if await self.redis_client.xgroup_create(self.stream, self.group, start_id="0"):
+            logger.info("Created consumer group '%s' on stream '%s'", self.group, self.stream)
+
+    async def read_batch(self) -> List[Entry]:
+        """New entries for this consumer, waiting up to `block_ms` for some."""
+        return await self.redis_client.xreadgroup(
+            self.stream, self.group, self.consumer_name, count=self.batch_size, block_ms=self.block_ms
+        )
+
+    async def claim_stale(self) -> Tuple[List[Entry], Dict[str, int]]:
+        """Take over entries idle past `claim_idle_ms`, with their delivery counts.
+
+        The pending list is scanned a batch at a time; a new scan starts
+        every `claim_interval_seconds`.
+        """
+        if self._claim_cursor == "0-0":
+            if time.monotonic() < self._next_claim_at:
+                return [], {}
+            self._next_claim_at = time.monotonic() + self.claim_interval_seconds
+        self._claim_cursor, entries = await self.redis_client.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer_name,
+            self.claim_idle_ms,
+            start_id=self._claim_cursor,
+            count=self.batch_size,
+        )
+        if not entries:
+            return [], {}
+
+        pending = await self.redis_client.xpending_range(
+            self.stream,
+            self.group,
+            min_id=entries[0][0],
+            max_id=entries[-1][0],
+            count=len(entries),
+            consumer=self.consumer_name,
+        )
+        deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+        return entries, deliveries
+
+    async def process_batch(self, entries: Sequence[Entry], deliveries: Dict[str, int]) -> int:
+        """Process entries concurrently; returns how many were acknowledged."""
+        live = [(entry_id, fields) for entry_id, fields in entries if fields is not None]
+        self.inflight_count = len(live)
+        try:
+            results = await asyncio.gather(
+                *(self.processor.process(fields.get(BODY_FIELD, "")) for _, fields in live),
+                return_exceptions=True,
+            )
+        finally:
+            self.inflight_count = 0
+
+        # Entries trimmed away before they could be claimed have nothing to retry.
+        ack = [entry_id for entry_id, fields in entries if fields is None]
+        dead = []
+        for (entry_id, fields), result in zip(live, results):
+            if result is None:
+                ack.append(entry_id)
+            elif isinstance(result, PERMANENT_ERRORS) or deliveries.get(entry_id, 1) >= self.max_deliveries:
+                dead.append((entry_id, fields, result))
+                ack.append(entry_id)
+            else:
+                logger.warning(
+                    "Stream entry %s failed (delivery %d), will be retried: %s",
+                    entry_id,
+                    deliveries.get(entry_id, 1),
+                    result,
+                    extra={"event": "message.retry_pending"}
+                )
+
+        if not ack:
+            return 0
+        pipe = await self.redis_client.pipeline(transaction=False)
+        for entry_id, fields, error in dead:
+            pipe.xadd(
+                self.dead_letter_stream,
+                {
+                    **fields,
+                    "source_id": entry_id,
+                    "deliveries": deliveries.get(entry_id, 1),
+                    "last_error": f"{type(error).__name__}: {error}"[:255],
+                },
+                maxlen=self.dead_letter_max_len,
+                approximate=True,
+            )
+        pipe.xack(self.stream, self.group, *ack)
+        await pipe.execute()
+
+        for entry_id, _, error in dead:
+            logger.warning(
+                "Stream entry %s dead-lettered: %s",
+                entry_id,
+                error,
+                extra={"event": "message.rerouted", "target": self.dead_letter_stream}
+            )
+        return len(ack)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Consume until `stop` is set; the current batch is finished first.
+
+        Entries still unacknowledged at shutdown stay pending and are
+        claimed by another instance once idle.
+        """
+        await self.processor.warmup()
+        while not stop.is_set():
+            try:
+                await self.ensure_group()
+                self._state = ConsumerState.CONSUMING
+                self.consuming_since = time.time()
+                logger.info(
+                    "Started consuming from stream '%s' as '%s' in group '%s'",
+                    self.stream,
+                    self.consumer_name,
+                    self.group
+                )
+                while not stop.is_set():
+                    entries, deliveries = await self.claim_stale()
+                    if not entries:
+                        entries, deliveries = await self.read_batch(), {}
+                    if entries:
+                        await self.process_batch(entries, deliveries)
+            except Exception as e:
+                self.consuming_since = None
+                self._state = ConsumerState.RECONNECTING
+                self.restarts += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error("Stream consumer error: %s", e, extra={"event": "consumer.error"})
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=ERROR_PAUSE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        self.consuming_since = None
+        self._state = ConsumerState.STOPPED
+
+    async def close(self) -> None:
+        await self.processor.close()
+        await self.redis_client.close()
+
+    def status(self) -> dict:
+        return {
+            "state": self._state.value,
+            "consuming_since": self.consuming_since,
+            "inflight": self.inflight_count,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,111 @@
+"""Keep a `NotificationConsumer` running across broker failures."""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from enum import Enum
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    # Annotation only: importing the consumer pulls in pika.
+    from app.core.consumer import NotificationConsumer
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumerState(str, Enum):
+    STARTING = "starting"
+    CONSUMING = "consuming"
+    RECONNECTING = "reconnecting"
+    STOPPED = "stopped"
+
+
+class ConsumerSupervisor:
+    """Restart the consumer whenever it fails, with jittered exponential backoff.
+
+    Each restart reconnects and re-declares the topology through
+    `start_consuming`. The backoff before attempt n is drawn uniformly from
+    [0, min(max_backoff, initial_backoff * 2**n)] ("full jitter"), so a
+    fleet reconnecting after a broker restart spreads out instead of
+    arriving at once. The attempt counter resets once the consumer has
+    managed to start consuming again.
+    """
+
+    def __init__(
+        self,
+        consumer: NotificationConsumer,
+        initial_backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        jitter: Callable[[float, float], float] = random.uniform,
+    ) -> None:
+        self.consumer = consumer
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._jitter = jitter
+        self._stop = threading.Event()
+        self._state = ConsumerState.STARTING
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+    @property
+    def state(self) -> ConsumerState:
+        if self.consumer.is_consuming:
+            return ConsumerState.CONSUMING
+        return self._state
+
+    def backoff(self, attempt: int) -> float:
+        cap = min(self.max_backoff_seconds, self.initial_backoff_seconds * 2 ** attempt)
+        return self._jitter(0, cap)
+
+    def run(self) -> None:
+        """Consume until `stop` is called. Blocks; run it on its own thread."""
+        attempt = 0
+        while not self._stop.is_set():
+            self._state = ConsumerState.STARTING
+            sessions = self.consumer.sessions
+            try:
+                self.consumer.start_consuming()
+                if self.consumer.stop_requested:
+                    break
+                error = "consumer returned without being stopped"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if self.consumer.sessions > sessions:
+                # It got as far as consuming, so this is a fresh failure.
+                attempt = 0
+            self.last_error = error
+            self.last_error_at = time.time()
+            self.restarts += 1
+            delay = self.backoff(attempt)
+            attempt += 1
+
+            self._state = ConsumerState.RECONNECTING
+            logger.warning(
+                "RabbitMQ consumer stopped unexpectedly (%s); reconnecting in %.1fs",
+                error,
+                delay,
+                extra={"event": "consumer.reconnecting"},
+            )
+            self._stop.wait(delay)
+
+        self._state = ConsumerState.STOPPED
+
+    def stop(self) -> None:
+        """Stop reconnecting and ask the consumer to drain. Thread-safe."""
+        self._stop.set()
+        self.consumer.stop_consuming()
+
+    def status(self) -> dict:
+        return {
+            "state": self.state.value,
+            "consuming_since": self.consumer.consuming_since,
+            "inflight": self.consumer.inflight_count,
+            "prefetch": self.consumer.prefetch_count,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
@@ -0,0 +1,242 @@
+"""Message transports feeding the notification service.
+
+A `Transport` delivers messages to a `MessageProcessor` until asked to
+stop. The application runs exactly one, chosen by CONSUMER_TRANSPORT:
+RabbitMQ (`RabbitMQTransport`), Redis Streams (`StreamConsumer`) or the
+embedded `InProcessTransport` below.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional, Sequence, Set
+
+from app.core.messages import (
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RETRY_DELAYS_SECONDS,
+    PERMANENT_ERRORS,
+    MessageProcessor,
+)
+from app.core.supervisor import ConsumerState, ConsumerSupervisor
+
+logger = logging.getLogger(__name__)
+
+
+class Transport(ABC):
+    """Source of notification messages."""
+
+    name: str
+
+    @abstractmethod
+    async def run(self, stop: asyncio.Event) -> None:
+        """Consume until `stop` is set, then drain and return."""
+
+    @abstractmethod
+    def status(self) -> dict:
+        """Health details; `state` is a `ConsumerState` value."""
+
+    async def close(self) -> None:
+        """Release clients once `run` has returned."""
+
+
+class RabbitMQTransport(Transport):
+    """Run the supervised pika consumer on its own thread.
+
+    pika's BlockingConnection is not thread-safe, so the consumer keeps
+    its connection (and its own event loop) on that thread; this class
+    only starts it and waits for it to drain on shutdown.
+    """
+
+    name = "rabbitmq-consumer"
+
+    def __init__(self, supervisor: ConsumerSupervisor, join_timeout_seconds: float = 25.0) -> None:
+        self.supervisor = supervisor
+        self.join_timeout_seconds = join_timeout_seconds
+        self._thread: Optional[threading.Thread] = None
+
+    def _run_supervisor(self) -> None:
+        try:
+            self.supervisor.run()
+        except Exception as e:
+            logger.error(f"Error in consumer thread: {e}")
+
+    async def run(self, stop: asyncio.Event) -> None:
+        thread = self._thread = threading.Thread(target=self._run_supervisor, daemon=True)
+        thread.start()
+        logger.info("RabbitMQ consumer thread started")
+
+        await stop.wait()
+        self.supervisor.stop()
+        await asyncio.to_thread(thread.join, self.join_timeout_seconds)
+        if thread.is_alive():
+            logger.warning("RabbitMQ consumer did not stop within the drain timeout")
+        else:
+            logger.info(
+                "RabbitMQ consumer stopped after draining for %.3fs",
+                self.supervisor.consumer.last_drain_seconds or 0.0
+            )
+
+    async def close(self) -> None:
+        # The consumer's clients are bound to its own loop, which is only
+        # free to run them once the thread has stopped.
+        if self._thread is not None and not self._thread.is_alive():
+            await asyncio.to_thread(self.supervisor.consumer.close)
+
+    def status(self) -> dict:
+        return self.supervisor.status()
+
+
+@dataclass
+class _Item:
+    data: dict
+    attempts: int = 0
+
+
+class InProcessTransport(Transport):
+    """Bounded in-memory queue for producers in the same process.
+
+    `submit` hands the decoded payload straight to the workers: nothing
+    is serialized and no broker is involved. The queue holds at most
+    `max_size` messages; `submit` waits for room (backpressure) and
+    `submit_nowait` raises `asyncio.QueueFull` instead.
+
+    Transient failures are retried after `retry_delays_seconds`, up to
+    `max_retries` times; then, like permanent failures, they are logged
+    and dropped. Nothing survives a restart, so this suits single-node
+    deployments, tests and benchmarks rather than durable delivery.
+    """
+
+    name = "in-process-consumer"
+
+    def __init__(
+        self,
+        processor: MessageProcessor,
+        max_size: int = 10_000,
+        concurrency: int = 100,
+        retry_delays_seconds: Sequence[float] = DEFAULT_RETRY_DELAYS_SECONDS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        drain_timeout_seconds: float = 20.0,
+    ) -> None:
+        if max_size <= 0 or concurrency <= 0:
+            raise ValueError("max_size and concurrency must be positive")
+        if not retry_delays_seconds:
+            raise ValueError("retry_delays_seconds must contain at least one delay")
+        self.processor = processor
+        self.concurrency = concurrency
+        self.retry_delays_seconds = tuple(retry_delays_seconds)
+        self.max_retries = max_retries
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.consuming_since: Optional[float] = None
+        self.inflight_count = 0
+        self.processed = 0
+        self.dropped = 0
+        self._queue: asyncio.Queue[_Item] = asyncio.Queue(maxsize=max_size)
+        self._retries: Set[asyncio.Task] = set()
+        self._accepting = True
+        self._state = ConsumerState.STARTING
+
+    @property
+    def accepting(self) -> bool:
+        return self._accepting
+
+    def _check_accepting(self) -> None:
+        if not self._accepting:
+            raise RuntimeError("The in-process transport is shutting down")
+
+    async def submit(self, data: dict, timeout: Optional[float] = None) -> None:
+        """Queue a message, waiting up to `timeout` for room.
+
+        Raises:
+            asyncio.TimeoutError: if the queue stayed full for `timeout`.
+        """
+        self._check_accepting()
+        await asyncio.wait_for(self._queue.put(_Item(data)), timeout)
+
+    def submit_nowait(self, data: dict) -> None:
+        """Queue a message or raise `asyncio.QueueFull`."""
+        self._check_accepting()
+        self._queue.put_nowait(_Item(data))
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            self.inflight_count += 1
+            try:
+                await self.processor.handle(item.data)
+                self.processed += 1
+            except Exception as e:
+                self._handle_failure(item, e)
+            finally:
+                self.inflight_count -= 1
+                self._queue.task_done()
+
+    def _handle_failure(self, item: _Item, error: Exception) -> None:
+        if isinstance(error, PERMANENT_ERRORS) or item.attempts >= self.max_retries or not self._accepting:
+            self.dropped += 1
+            logger.error(
+                "Dropping message after %d retries: %s",
+                item.attempts,
+                error,
+                extra={"event": "message.dropped"}
+            )
+            return
+
+        delay = self.retry_delays_seconds[min(item.attempts, len(self.retry_delays_seconds) - 1)]
+        item.attempts += 1
+        task = asyncio.create_task(self._retry_later(item, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, item: _Item, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._queue.put(item)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await self.processor.warmup()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._state = ConsumerState.CONSUMING
+        self.consuming_since = time.time()
+        logger.info("In-process consumer started with %d workers", self.concurrency)
+        try:
+            await stop.wait()
+        finally:
+            self._accepting = False
+            self.consuming_since = None
+            self._state = ConsumerState.STOPPED
+            # Retries scheduled for later are dropped; queued work gets until
+            # the deadline to finish.
+            retries = list(self._retries)
+            for task in retries:
+                task.cancel()
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout_seconds)
+            except asyncio.TimeoutError:
+                pass
+            lost = self._queue.qsize() + self.inflight_count + len(retries)
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, *retries, return_exceptions=True)
+
+            logger.info(
+                "In-process consumer stopped, %d message(s) not processed",
+                lost,
+                extra={"event": "consumer.drained"}
+            )
+
+    async def close(self) -> None:
+        await self.processor.close()
+
+    def status(self) -> dict:
+        return {
+            "state": self._state.value,
+            "consuming_since": self.consuming_since,
+            "inflight": self.inflight_count,
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
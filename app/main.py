@@ -1,47 +1,472 @@
-import threading
+import time
+
+# Import time is reported at startup; adapters for unused transports and
+# channels are imported by their builders only.
+_import_started = time.perf_counter()
+
+import asyncio
+import dataclasses
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from typing import TYPE_CHECKING, Dict, List, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 from app.config import settings
+from app.logging_config import configure_logging
 from app.adapters.redis_client import RedisClient
-from app.core.consumer import NotificationConsumer
+from app.core.audit import AuditLog
+from app.core.messages import MessageProcessor
+from app.core.stream_consumer import StreamConsumer
+from app.core.supervisor import ConsumerState, ConsumerSupervisor
+from app.core.transport import InProcessTransport, RabbitMQTransport, Transport
+from app.core.prefetch import PrefetchTuner
 from app.core.notification_service import NotificationService
-from app.core.gateway import MockGateway
+from app.core.notification_rules import ON_LIMIT_DIGEST, RateLimitConfig
+from app.core.rate_limiter import FailoverRateLimiter, LocalRateLimiter, RedisRateLimiter
+from app.core.quota import Quota, QuotaService
+from app.core.limiter_reset import LimiterStateReset
+from app.core.fanout import FanoutProcessor
+from app.core.heavy_hitters import HeavyHitterTracker
+from app.core.preferences import ALL_TYPES, PreferenceListener, PreferenceStore
+from app.core.tenants import TenantRuleSets, tenant_key_prefix
+from app.core.digest import DigestBuffer, DigestFlusher
+from app.core.gateway import Gateway, MockGateway
+from app.core.routing import GatewayRegistry
+from app.core.rate_control import AIMDController, PacedGateway
+from app.core.startup import StartupReport, wait_until
+
+if TYPE_CHECKING:
+    from app.adapters.webhook_gateway import WebhookGateway
+    from app.core.consumer import NotificationConsumer
 
 logger = logging.getLogger(__name__)
 
-consumer_thread: threading.Thread = None
-consumer: NotificationConsumer = None
+transport: Optional[Transport] = None
+startup: Optional[StartupReport] = None
+audit_log: Optional[AuditLog] = None
+heavy_hitters: Optional[HeavyHitterTracker] = None
+preference_stores: Dict[Optional[str], PreferenceStore] = {}
+preference_api_client: Optional[RedisClient] = None
+preference_api_stores: Dict[Optional[str], PreferenceStore] = {}
+limiter_redis_client: Optional[RedisClient] = None
+redis_rate_limiters: Dict[Optional[str], RedisRateLimiter] = {}
+quota_services: Dict[Optional[str], QuotaService] = {}
 
-def run_consumer():
-    """Run the consumer in a separate thread."""
-    global consumer
-    try:
-        logger.info("Starting RabbitMQ consumer...")
-        gateway = MockGateway()
-        service = NotificationService(gateway)
-        consumer = NotificationConsumer(service=service, queue_name="notifications")
-        consumer.start_consuming()
-    except Exception as e:
-        logger.error(f"Error in consumer thread: {e}")
+def build_rate_limit_config() -> RateLimitConfig:
+    """Default rules, with digests enabled for RATE_LIMIT_DIGEST_TYPES."""
+    config = RateLimitConfig()
+    for notification_type in settings.RATE_LIMIT_DIGEST_TYPES:
+        rule = config.get_rule(notification_type)
+        if rule is None:
+            raise ValueError(f"Cannot enable digests for unknown type '{notification_type}'")
+        config.add_rule(dataclasses.replace(rule, on_limit=ON_LIMIT_DIGEST), overwrite=True)
+    return config
+
+
+rate_limit_config = build_rate_limit_config()
+tenant_rule_sets = TenantRuleSets(rate_limit_config, settings.TENANT_RULES)
+
+
+def build_digest_buffer(redis_client: RedisClient) -> DigestBuffer:
+    return DigestBuffer(redis_client, max_messages=settings.DIGEST_MAX_MESSAGES)
+
+
+def build_rate_limiter(
+    config: RateLimitConfig,
+    redis_client: RedisClient,
+    key_prefix: str = "ratelimit"
+) -> FailoverRateLimiter:
+    """Redis-backed limiter that degrades to local limiting when Redis is unhealthy."""
+    return FailoverRateLimiter(
+        primary=RedisRateLimiter(redis_client, config, key_prefix=key_prefix),
+        fallback=LocalRateLimiter(config, instance_count=settings.RATE_LIMIT_INSTANCE_COUNT),
+        latency_budget_seconds=settings.REDIS_LATENCY_BUDGET_MS / 1000,
+        probe_interval_seconds=settings.REDIS_PROBE_INTERVAL_SECONDS
+    )
+
+
+def build_webhook_gateway() -> "WebhookGateway":
+    from app.adapters.webhook_gateway import WebhookGateway
+    
+    if not settings.WEBHOOK_URL:
+        raise ValueError("The webhook channel needs WEBHOOK_URL")
+    return WebhookGateway(
+        url=settings.WEBHOOK_URL,
+        batch_url=settings.WEBHOOK_BATCH_URL,
+        http2=settings.WEBHOOK_HTTP2,
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.WEBHOOK_MAX_KEEPALIVE_CONNECTIONS,
+        max_per_host=settings.WEBHOOK_MAX_PER_HOST,
+        timeout_seconds=settings.WEBHOOK_TIMEOUT_SECONDS,
+        connect_timeout_seconds=settings.WEBHOOK_CONNECT_TIMEOUT_SECONDS
+    )
+
+
+# EmailGateway is left out until it can send: a type routed to it would
+# only fail, be retried and be dead-lettered.
+CHANNEL_GATEWAYS = {
+    "mock": MockGateway,
+    "webhook": build_webhook_gateway,
+}
+
+
+def build_channel(name: str) -> Gateway:
+    """One channel's gateway, paced by its own AIMD controller when GATEWAY_RATE_CONTROL is on."""
+    gateway = CHANNEL_GATEWAYS[name]()
+    if not settings.GATEWAY_RATE_CONTROL:
+        return gateway
+    return PacedGateway(
+        gateway,
+        AIMDController(
+            initial_rate=settings.GATEWAY_INITIAL_RATE,
+            min_rate=settings.GATEWAY_MIN_RATE,
+            max_rate=settings.GATEWAY_MAX_RATE,
+            increase=settings.GATEWAY_RATE_INCREASE,
+            decrease_factor=settings.GATEWAY_RATE_DECREASE_FACTOR
+        )
+    )
+
+
+def build_gateway() -> GatewayRegistry:
+    """Gateway routing each notification type to its configured channels.
+    
+    The consumer and the digest flusher run on different event loops, so
+    each gets its own gateways and controllers.
+    """
+    names = set(settings.DEFAULT_CHANNELS)
+    for channels in settings.NOTIFICATION_ROUTES.values():
+        names.update(channels)
+    unknown = names - set(CHANNEL_GATEWAYS)
+    if unknown:
+        raise ValueError(f"Unknown channel(s) {sorted(unknown)}; available: {sorted(CHANNEL_GATEWAYS)}")
+    
+    return GatewayRegistry(
+        channels={name: build_channel(name) for name in names},
+        routes=settings.NOTIFICATION_ROUTES,
+        default_channels=settings.DEFAULT_CHANNELS,
+        config=rate_limit_config
+    )
+
+
+def build_prefetch_tuner() -> Optional[PrefetchTuner]:
+    """Tuner for PREFETCH_MODE=adaptive, None for a fixed prefetch."""
+    if settings.PREFETCH_MODE == "fixed":
+        return None
+    if settings.PREFETCH_MODE != "adaptive":
+        raise ValueError(
+            f"PREFETCH_MODE must be 'fixed' or 'adaptive', got {settings.PREFETCH_MODE!r}"
+        )
+    return PrefetchTuner(
+        min_prefetch=settings.PREFETCH_MIN,
+        max_prefetch=settings.PREFETCH_MAX,
+        initial_prefetch=settings.PREFETCH_COUNT,
+        interval_seconds=settings.PREFETCH_ADJUST_INTERVAL_SECONDS
+    )
+
+
+def build_audit_log() -> Optional[AuditLog]:
+    """Decision audit log when AUDIT_LOG_DIR is set, else None."""
+    if not settings.AUDIT_LOG_DIR:
+        return None
+    return AuditLog(
+        settings.AUDIT_LOG_DIR,
+        max_buffered=settings.AUDIT_LOG_BUFFER_SIZE,
+        batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+        flush_interval_seconds=settings.AUDIT_LOG_FLUSH_INTERVAL_SECONDS,
+        rotate_bytes=settings.AUDIT_LOG_ROTATE_BYTES,
+        rotate_seconds=settings.AUDIT_LOG_ROTATE_SECONDS,
+        max_files=settings.AUDIT_LOG_MAX_FILES
+    )
+
+
+def build_heavy_hitters() -> Optional[HeavyHitterTracker]:
+    """Heavy-hitter tracker when HEAVY_HITTERS_ENABLED, else None.
+    
+    It syncs from the application's event loop, so it gets its own client.
+    """
+    if not settings.HEAVY_HITTERS_ENABLED:
+        return None
+    return HeavyHitterTracker(
+        rate_limit_config,
+        RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT),
+        width=settings.HEAVY_HITTERS_WIDTH,
+        depth=settings.HEAVY_HITTERS_DEPTH,
+        top_k=settings.HEAVY_HITTERS_TOP_K,
+        window_seconds=settings.HEAVY_HITTERS_WINDOW_SECONDS,
+        reject_factor=settings.HEAVY_HITTERS_REJECT_FACTOR,
+        sync_interval_seconds=settings.HEAVY_HITTERS_SYNC_INTERVAL_SECONDS,
+        tenants=tenant_rule_sets
+    )
+
+
+def build_preference_store(redis_client: RedisClient, tenant_id: Optional[str] = None) -> PreferenceStore:
+    """A tenant's preferences, under its keys and invalidation channel."""
+    return PreferenceStore(
+        redis_client,
+        cache_ttl_seconds=settings.PREFERENCES_CACHE_TTL_SECONDS,
+        max_cache_entries=settings.PREFERENCES_CACHE_MAX_ENTRIES,
+        tenant_id=tenant_id
+    )
+
+
+def build_preference_stores() -> Dict[Optional[str], PreferenceStore]:
+    """Preference stores of the default tenant and every configured one, on one client."""
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    return {
+        tenant_id: build_preference_store(redis_client, tenant_id)
+        for tenant_id in (None, *tenant_rule_sets.tenants)
+    }
+
+
+def build_tenant_processor(
+    gateway: Gateway,
+    redis_client: RedisClient,
+    tenant_id: Optional[str] = None,
+    tenants: Optional[Dict[str, MessageProcessor]] = None
+) -> MessageProcessor:
+    """Sends and fan-outs of one tenant, under its rules and with its Redis keys.
+    
+    Digests are only buffered for the default tenant.
+    """
+    if tenant_id is not None:
+        config = tenant_rule_sets.config_for(tenant_id)
+        digest_types = sorted(t for t, rule in config.rules.items() if rule.on_limit == ON_LIMIT_DIGEST)
+        if digest_types:
+            logger.warning(
+                "Digests are disabled for tenants: over-limit %s notifications of tenant %s are dropped",
+                ", ".join(digest_types),
+                tenant_id,
+                extra={"event": "startup.tenant_digests_disabled"}
+            )
+    service = NotificationService(
+        gateway,
+        rate_limiter=build_rate_limiter(
+            tenant_rule_sets.config_for(tenant_id),
+            redis_client,
+            key_prefix=tenant_key_prefix("ratelimit", tenant_id)
+        ),
+        digest_buffer=build_digest_buffer(redis_client) if tenant_id is None else None,
+        audit_log=audit_log,
+        heavy_hitters=heavy_hitters,
+        preferences=preference_stores.get(tenant_id),
+        tenant_id=tenant_id
+    )
+    fanout_processor = FanoutProcessor(
+        service,
+        redis_client,
+        chunk_size=settings.FANOUT_CHUNK_SIZE,
+        checkpoint_ttl_seconds=settings.FANOUT_CHECKPOINT_TTL_SECONDS,
+        key_prefix=tenant_key_prefix("fanout", tenant_id)
+    )
+    return MessageProcessor(service, fanout_processor, tenant_id=tenant_id, tenants=tenants)
+
+
+def build_message_processor(redis_client: RedisClient) -> MessageProcessor:
+    """Message handling shared by every transport: rate-limited sends and fan-outs.
+    
+    Messages of a tenant in TENANT_RULES are routed to that tenant's
+    processor; all of them share one gateway.
+    """
+    gateway = build_gateway()
+    tenants = {
+        tenant_id: build_tenant_processor(gateway, redis_client, tenant_id)
+        for tenant_id in tenant_rule_sets.tenants
+    }
+    return build_tenant_processor(gateway, redis_client, tenants=tenants)
+
+
+def build_consumer() -> "NotificationConsumer":
+    """RabbitMQ consumer wired to the rate-limited notification service.
+    
+    Async clients are created lazily, so they bind to the consumer's own
+    event loop on its thread.
+    """
+    from app.core.consumer import NotificationConsumer
+    
+    processor = build_message_processor(RedisClient(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT
+    ))
+    return NotificationConsumer(
+        service=processor.service,
+        queue_name="notifications",
+        retry_delays_seconds=settings.RETRY_DELAYS_SECONDS,
+        max_retries=settings.MAX_RETRIES,
+        fanout_processor=processor.fanout_processor,
+        drain_timeout_seconds=settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS,
+        prefetch_count=settings.PREFETCH_COUNT,
+        prefetch_tuner=build_prefetch_tuner(),
+        processor=processor
+    )
+
+
+def build_stream_consumer() -> StreamConsumer:
+    """Redis Streams consumer; runs as a task on the application's event loop."""
+    redis_client = RedisClient(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT
+    )
+    return StreamConsumer(
+        build_message_processor(redis_client),
+        redis_client,
+        stream=settings.STREAM_NAME,
+        group=settings.STREAM_GROUP,
+        batch_size=settings.STREAM_BATCH_SIZE,
+        block_ms=settings.STREAM_BLOCK_MS,
+        claim_idle_ms=settings.STREAM_CLAIM_IDLE_MS,
+        max_deliveries=settings.MAX_RETRIES + 1,
+        dead_letter_max_len=settings.STREAM_MAX_LEN
+    )
+
+
+def build_transport() -> Transport:
+    """The message transport selected by CONSUMER_TRANSPORT."""
+    if settings.CONSUMER_TRANSPORT == "rabbitmq":
+        supervisor = ConsumerSupervisor(
+            build_consumer(),
+            initial_backoff_seconds=settings.CONSUMER_RECONNECT_INITIAL_BACKOFF_SECONDS,
+            max_backoff_seconds=settings.CONSUMER_RECONNECT_MAX_BACKOFF_SECONDS
+        )
+        return RabbitMQTransport(
+            supervisor,
+            join_timeout_seconds=settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS + 5
+        )
+    if settings.CONSUMER_TRANSPORT == "redis-streams":
+        return build_stream_consumer()
+    if settings.CONSUMER_TRANSPORT == "in-process":
+        return InProcessTransport(
+            build_message_processor(RedisClient(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT
+            )),
+            max_size=settings.INPROCESS_QUEUE_SIZE,
+            concurrency=settings.INPROCESS_CONCURRENCY,
+            retry_delays_seconds=settings.RETRY_DELAYS_SECONDS,
+            max_retries=settings.MAX_RETRIES,
+            drain_timeout_seconds=settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS
+        )
+    raise ValueError(
+        "CONSUMER_TRANSPORT must be 'rabbitmq', 'redis-streams' or 'in-process', "
+        f"got {settings.CONSUMER_TRANSPORT!r}"
+    )
+
+
+def is_ready() -> bool:
+    """Warmup has finished and the transport is consuming."""
+    return (
+        startup is not None
+        and startup.warmed_up
+        and transport is not None
+        and transport.status()["state"] == ConsumerState.CONSUMING.value
+    )
+
+
+async def warm_up(report: StartupReport, digest_buffer: Optional[DigestBuffer] = None) -> None:
+    """Connect the application loop's Redis clients and load their scripts.
+    
+    Runs while the transport connects and warms its own clients on its
+    event loop; the transport step ends once it is consuming.
+    """
+    steps = {"limiter": get_redis_rate_limiter().warmup()}
+    if digest_buffer is not None:
+        steps["digest"] = digest_buffer.warmup()
+    if settings.PREFERENCES_ENABLED:
+        steps["preferences"] = get_preference_api_store().redis_client.ping()
+    if heavy_hitters is not None and heavy_hitters.redis_client is not None:
+        steps["heavy_hitters"] = heavy_hitters.redis_client.ping()
+    steps["transport"] = wait_until(
+        lambda: transport.status()["state"] == ConsumerState.CONSUMING.value
+    )
+    await asyncio.gather(*(
+        report.warm(f"warmup.{name}", step, settings.WARMUP_TIMEOUT_SECONDS)
+        for name, step in steps.items()
+    ))
+    report.warmed_up = True
+    if is_ready():
+        report.mark_ready()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
-    global consumer_thread
+    global transport, audit_log, heavy_hitters, preference_stores, startup
+    startup = StartupReport()
+    startup.record("import", IMPORT_SECONDS)
+    with startup.phase("logging"):
+        log_listener = configure_logging(
+            level=settings.LOG_LEVEL,
+            json_output=settings.LOG_JSON,
+            sample_rates=settings.LOG_SAMPLE_RATES
+        )
     logger.info("Starting up notification service...")
     
-    consumer_thread = threading.Thread(target=run_consumer, daemon=True)
-    consumer_thread.start()
-    logger.info("RabbitMQ consumer thread started")
+    with startup.phase("build"):
+        audit_log = build_audit_log()
+        if audit_log is not None:
+            audit_log.start()
+        heavy_hitters = build_heavy_hitters()
+        # Used on the transport's event loop; the HTTP handlers have their own.
+        preference_stores = build_preference_stores() if settings.PREFERENCES_ENABLED else {}
+        transport = build_transport()
+    
+    stop_background = asyncio.Event()
+    transport_task = asyncio.create_task(transport.run(stop_background))
+    
+    background_tasks = []
+    if heavy_hitters is not None:
+        background_tasks.append(asyncio.create_task(heavy_hitters.run(stop_background)))
+    preference_listener = None
+    if preference_stores:
+        api_stores = [get_preference_api_store(tenant_id) for tenant_id in preference_stores]
+        preference_listener = PreferenceListener(
+            RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT),
+            [*preference_stores.values(), *api_stores]
+        )
+        background_tasks.append(asyncio.create_task(preference_listener.run(stop_background)))
+    digest_buffer = flusher = None
+    if settings.RATE_LIMIT_DIGEST_TYPES:
+        limiter = get_redis_rate_limiter()
+        digest_buffer = build_digest_buffer(limiter.redis_client)
+        flusher = DigestFlusher(
+            digest_buffer,
+            NotificationService(
+                build_gateway(),
+                rate_limiter=limiter,
+                audit_log=audit_log,
+                preferences=get_preference_api_store() if settings.PREFERENCES_ENABLED else None
+            ),
+            interval_seconds=settings.DIGEST_FLUSH_INTERVAL_SECONDS,
+            max_attempts=settings.DIGEST_MAX_ATTEMPTS,
+            max_backoff_seconds=settings.DIGEST_MAX_BACKOFF_SECONDS
+        )
+        background_tasks.append(asyncio.create_task(flusher.run(stop_background)))
+    warmup_task = asyncio.create_task(warm_up(startup, digest_buffer))
     
     yield
     
     logger.info("Shutting down notification service...")
-    if consumer:
-        consumer.stop_consuming()
-    logger.info("RabbitMQ consumer stopped")
+    warmup_task.cancel()
+    await asyncio.gather(warmup_task, return_exceptions=True)
+    stop_background.set()
+    await asyncio.gather(*background_tasks)
+    # Each transport drains in-flight work within SHUTDOWN_DRAIN_TIMEOUT_SECONDS.
+    try:
+        await asyncio.wait_for(transport_task, timeout=settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS + 10)
+    except asyncio.TimeoutError:
+        logger.warning("%s did not stop within the drain timeout", transport.name)
+    await transport.close()
+    if flusher is not None:
+        await flusher.service.gateway.close()
+    if limiter_redis_client is not None:
+        await limiter_redis_client.close()
+    if heavy_hitters is not None:
+        await heavy_hitters.close()
+    if preference_listener is not None:
+        await preference_listener.close()
+    if audit_log is not None:
+        await asyncio.to_thread(audit_log.stop)
+    log_listener.stop()
 
 
 app = FastAPI(
@@ -67,6 +492,108 @@ async def health():
     }
 
 
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: 503 until warmup finished and the transport is consuming; startup timings"""
+    if startup is None:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    ready = is_ready()
+    if ready:
+        startup.mark_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", **startup.to_dict()}
+    )
+
+
+@app.get("/health/consumer")
+async def health_consumer():
+    """Health check endpoint for the message consumer; 503 unless it is consuming"""
+    if transport is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": ConsumerState.STOPPED.value, "service": "consumer"}
+        )
+    
+    status = transport.status()
+    state = status.pop("state")
+    return JSONResponse(
+        status_code=200 if state == ConsumerState.CONSUMING.value else 503,
+        content={"status": state, "service": transport.name, **status}
+    )
+
+
+@app.get("/health/audit")
+async def health_audit():
+    """Audit log buffer and writer counters"""
+    if audit_log is None:
+        return {"enabled": False}
+    return {"enabled": True, **audit_log.status()}
+
+
+def get_heavy_hitters() -> HeavyHitterTracker:
+    if heavy_hitters is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Heavy-hitter tracking is disabled (HEAVY_HITTERS_ENABLED=false)"
+        )
+    return heavy_hitters
+
+
+@app.get("/heavy-hitters")
+async def top_heavy_hitters(
+    limit: int = Query(20, ge=1, le=1000),
+    tracker: HeavyHitterTracker = Depends(get_heavy_hitters)
+):
+    """Users sending the most notifications in the current window, across instances"""
+    return {
+        "window_start": tracker.window_start,
+        "window_seconds": tracker.window_seconds,
+        "synced_at": tracker.synced_at,
+        "error_bound": tracker.error_bound,
+        "rejected": tracker.rejected,
+        "top": [dataclasses.asdict(hitter) for hitter in tracker.top(limit)],
+    }
+
+
+def get_in_process_transport() -> InProcessTransport:
+    """The in-process transport, for handlers that submit notifications directly."""
+    if not isinstance(transport, InProcessTransport):
+        raise HTTPException(
+            status_code=503,
+            detail="Submitting notifications requires CONSUMER_TRANSPORT=in-process"
+        )
+    return transport
+
+
+class NotificationRequest(BaseModel):
+    user_id: str = Field(..., min_length=1)
+    type: str = Field(..., min_length=1)
+    message: str
+    tenant_id: Optional[str] = None
+
+
+@app.post("/notifications", status_code=202)
+async def submit_notification(
+    request: NotificationRequest,
+    queue: InProcessTransport = Depends(get_in_process_transport)
+):
+    """Queue a notification for delivery without going through a broker"""
+    if request.tenant_id not in tenant_rule_sets:
+        raise HTTPException(status_code=400, detail=f"Unknown tenant {request.tenant_id!r}")
+    try:
+        await queue.submit(request.model_dump(), timeout=settings.INPROCESS_SUBMIT_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Notification queue is full",
+            headers={"Retry-After": "1"}
+        )
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Notification service is shutting down")
+    return {"status": "accepted"}
+
+
 @app.get("/health/redis")
 async def health_redis():
     """Health check endpoint for Redis connection"""
@@ -100,3 +627,187 @@ async def health_redis():
     finally:
         await redis_client.close()
 
+
+def get_redis_rate_limiter(tenant_id: Optional[str] = None) -> RedisRateLimiter:
+    """Redis limiter view of a tenant's rules and keys, shared by the HTTP handlers.
+    
+    Without a `tenant_id` this is the default tenant's view.
+    """
+    global limiter_redis_client
+    limiter = redis_rate_limiters.get(tenant_id)
+    if limiter is None:
+        if tenant_id not in tenant_rule_sets:
+            raise HTTPException(status_code=404, detail=f"Unknown tenant {tenant_id!r}")
+        if limiter_redis_client is None:
+            limiter_redis_client = RedisClient(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT
+            )
+        limiter = redis_rate_limiters[tenant_id] = RedisRateLimiter(
+            limiter_redis_client,
+            tenant_rule_sets.config_for(tenant_id),
+            key_prefix=tenant_key_prefix("ratelimit", tenant_id)
+        )
+    return limiter
+
+
+def get_quota_service(tenant_id: Optional[str] = None) -> QuotaService:
+    """A tenant's quota service shared by the HTTP handlers (and their cache)."""
+    service = quota_services.get(tenant_id)
+    if service is None:
+        service = quota_services[tenant_id] = QuotaService(
+            get_redis_rate_limiter(tenant_id),
+            cache_ttl_seconds=settings.QUOTA_CACHE_TTL_SECONDS
+        )
+    return service
+
+
+class QuotaBatchRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=settings.QUOTA_BATCH_MAX_USERS)
+
+
+def _serialize_quotas(user_id: str, quotas: Dict[str, Quota]) -> dict:
+    return {
+        "user_id": user_id,
+        "quotas": {
+            notification_type: {
+                "limit": quota.limit,
+                "window_seconds": quota.window_seconds,
+                "remaining": quota.remaining,
+                "reset_at": quota.reset_at
+            }
+            for notification_type, quota in quotas.items()
+        }
+    }
+
+
+async def _get_quotas(service: QuotaService, user_ids: List[str]) -> Dict[str, Dict[str, Quota]]:
+    try:
+        return await service.get_quotas(user_ids)
+    except Exception as e:
+        logger.error("Quota lookup failed: %s", e)
+        raise HTTPException(status_code=503, detail="Rate limit store unavailable")
+
+
+@app.get("/users/{user_id}/quota")
+async def user_quota(user_id: str, service: QuotaService = Depends(get_quota_service)):
+    """Remaining sends and reset time for every notification type, optionally of one tenant"""
+    quotas = await _get_quotas(service, [user_id])
+    return _serialize_quotas(user_id, quotas[user_id])
+
+
+@app.post("/users/quota")
+async def users_quota(request: QuotaBatchRequest, service: QuotaService = Depends(get_quota_service)):
+    """Batch variant of the per-user quota endpoint"""
+    quotas = await _get_quotas(service, request.user_ids)
+    return {
+        "users": [
+            _serialize_quotas(user_id, quotas[user_id])
+            for user_id in dict.fromkeys(request.user_ids)
+        ]
+    }
+
+
+def get_preference_api_store(tenant_id: Optional[str] = None) -> PreferenceStore:
+    """A tenant's preference store shared by the HTTP handlers (and their cache)."""
+    global preference_api_client
+    store = preference_api_stores.get(tenant_id)
+    if store is None:
+        if tenant_id not in tenant_rule_sets:
+            raise HTTPException(status_code=404, detail=f"Unknown tenant {tenant_id!r}")
+        if preference_api_client is None:
+            preference_api_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+        store = preference_api_stores[tenant_id] = build_preference_store(preference_api_client, tenant_id)
+    return store
+
+
+class PreferencesUpdate(BaseModel):
+    types: Dict[str, bool] = {}
+    all: Optional[bool] = None
+
+
+@app.get("/users/{user_id}/preferences")
+async def user_preferences(user_id: str, store: PreferenceStore = Depends(get_preference_api_store)):
+    """Notification types the user opted out of"""
+    try:
+        preferences = await store.get(user_id)
+    except Exception as e:
+        logger.error("Preference lookup failed: %s", e)
+        raise HTTPException(status_code=503, detail="Preference store unavailable")
+    return {"user_id": user_id, **preferences.to_dict()}
+
+
+@app.put("/users/{user_id}/preferences")
+async def update_user_preferences(
+    user_id: str,
+    request: PreferencesUpdate,
+    store: PreferenceStore = Depends(get_preference_api_store)
+):
+    """Opt in or out of notification types (or of everything with `all`)"""
+    changes = dict(request.types)
+    if ALL_TYPES in changes:
+        raise HTTPException(status_code=400, detail=f"Use 'all' instead of the '{ALL_TYPES}' type")
+    if request.all is not None:
+        changes[ALL_TYPES] = request.all
+    try:
+        preferences = await store.update(user_id, changes)
+    except Exception as e:
+        logger.error("Preference update failed: %s", e)
+        raise HTTPException(status_code=503, detail="Preference store unavailable")
+    return {"user_id": user_id, **preferences.to_dict()}
+
+
+class RateLimitResetRequest(BaseModel):
+    user_id: Optional[str] = None
+    notification_type: Optional[str] = None
+    pattern: Optional[str] = None
+
+
+@app.post("/admin/rate-limits/reset")
+async def reset_rate_limits(
+    request: RateLimitResetRequest,
+    limiter: RedisRateLimiter = Depends(get_redis_rate_limiter),
+    service: QuotaService = Depends(get_quota_service)
+):
+    """Clear limiter state for one user, one notification type or a user id pattern
+    
+    With a `tenant_id` query parameter, only that tenant's state is cleared.
+    """
+    targets = [
+        value for value in (request.user_id, request.notification_type, request.pattern)
+        if value is not None
+    ]
+    if len(targets) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="Exactly one of user_id, notification_type or pattern is required"
+        )
+    
+    reset = LimiterStateReset(
+        limiter,
+        batch_size=settings.RATE_LIMIT_RESET_BATCH_SIZE,
+        pause_seconds=settings.RATE_LIMIT_RESET_PAUSE_SECONDS
+    )
+    try:
+        if request.user_id is not None:
+            progress = await reset.reset_user(request.user_id)
+        elif request.notification_type is not None:
+            progress = await reset.reset_type(request.notification_type)
+        else:
+            progress = await reset.reset_pattern(request.pattern)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Rate limit reset failed: %s", e)
+        raise HTTPException(status_code=503, detail="Rate limit store unavailable")
+    finally:
+        service.clear_cache()
+    
+    return {
+        "scanned": progress.scanned,
+        "removed": progress.removed,
+        "batches": progress.batches
+    }
+
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
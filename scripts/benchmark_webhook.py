@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Benchmark WebhookGateway against a local stand-in webhook server.
+
+Compares the gateway's pooled keep-alive client with opening a new client
+(and connection) for every send.
+
+Usage:
+    python -m scripts.benchmark_webhook --requests 2000 --concurrency 50
+    python -m scripts.benchmark_webhook --url https://staging-hooks.example.com/notify
+
+Without --url a local HTTP/1.1 keep-alive server is started. httpx only
+negotiates HTTP/2 over TLS, so multiplexing shows up only against a real
+https:// endpoint.
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, List
+
+import httpx
+
+from app.adapters.webhook_gateway import WebhookGateway
+from app.core.gateway import Notification
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency_seconds = 0.0
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def start_server(latency_seconds: float) -> ThreadingHTTPServer:
+    handler = type("Handler", (StandInHandler,), {"latency_seconds": latency_seconds})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(
+    send: Callable[[Notification], Awaitable[bool]],
+    requests: int,
+    concurrency: int,
+) -> List[float]:
+    latencies: List[float] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with slots:
+            started = time.perf_counter()
+            await send(Notification(user_id=f"user{i}", notification_type="news", message="benchmark"))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], elapsed: float) -> None:
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(
+        f"{name:<12} {len(latencies) / elapsed:>9.0f} req/s   "
+        f"p50 {statistics.median(ordered) * 1000:>7.2f} ms   p99 {p99 * 1000:>7.2f} ms"
+    )
+
+
+async def benchmark(args: argparse.Namespace) -> None:
+    gateway = WebhookGateway(url=args.url, max_per_host=args.concurrency)
+
+    async def per_request(notification: Notification) -> bool:
+        async with httpx.AsyncClient(http2=True) as client:
+            response = await client.post(args.url, json=WebhookGateway.payload(notification))
+            return response.is_success
+
+    try:
+        for name, send in (("pooled", gateway.send), ("per-request", per_request)):
+            started = time.perf_counter()
+            latencies = await run(send, args.requests, args.concurrency)
+            report(name, latencies, time.perf_counter() - started)
+    finally:
+        await gateway.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="webhook to benchmark (default: a local stand-in)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--server-latency-ms", type=float, default=0.0,
+                        help="latency added by the local stand-in server")
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        server = start_server(args.server_latency_ms / 1000)
+        args.url = f"http://127.0.0.1:{server.server_port}/notify"
+    try:
+        asyncio.run(benchmark(args))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,32 @@
 #!/usr/bin/env python3
-"""Helper script to publish test messages to RabbitMQ."""
+"""Helper script to publish test messages to RabbitMQ (or the Redis stream
+when CONSUMER_TRANSPORT=redis-streams).
+
+Usage:
+    python -m scripts.publish_test_message user1 news "Hello"
+    python -m scripts.publish_test_message user1 marketing "$(cat long.txt)" --format msgpack --compress zstd
+"""
+import argparse
+import asyncio
 import json
 import pika
 import sys
+from typing import Optional
+from app.adapters.redis_client import RedisClient
 from app.config import settings
+from app.core import codec
+from app.core.stream_consumer import publish
 
 
-def publish_message(user_id: str, notification_type: str, message: str):
+def publish_message(
+    user_id: str,
+    notification_type: str,
+    message: str,
+    content_type: str = codec.JSON,
+    compression: Optional[str] = None,
+    compression_threshold: int = codec.DEFAULT_COMPRESSION_THRESHOLD,
+    tenant_id: Optional[str] = None
+):
     """Publish a notification message to RabbitMQ."""
     # Connect to RabbitMQ
     credentials = pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS)
@@ -28,18 +48,30 @@ def publish_message(user_id: str, notification_type: str, message: str):
         "type": notification_type,
         "message": message
     }
+    if tenant_id:
+        payload["tenant_id"] = tenant_id
+    
+    body, content_type, content_encoding = codec.encode(
+        payload,
+        content_type=content_type,
+        compression=compression,
+        compression_threshold=compression_threshold
+    )
     
     # Publish message
     channel.basic_publish(
         exchange='notifications',
         routing_key='notification.send',
-        body=json.dumps(payload),
+        body=body,
         properties=pika.BasicProperties(
+            content_type=content_type,
+            content_encoding=content_encoding,
             delivery_mode=2,  # Make message persistent
         )
     )
     
     print(f"✓ Message published successfully!")
+    print(f"  Body: {len(body)} bytes, {content_type}, encoding={content_encoding or 'none'}")
     print(f"  User ID: {user_id}")
     print(f"  Type: {notification_type}")
     print(f"  Message: {message}")
@@ -47,14 +79,67 @@ def publish_message(user_id: str, notification_type: str, message: str):
     connection.close()
 
 
+async def publish_stream_message(
+    user_id: str,
+    notification_type: str,
+    message: str,
+    tenant_id: Optional[str] = None
+):
+    """Add a notification message to the Redis stream."""
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    payload = {
+        "user_id": user_id,
+        "type": notification_type,
+        "message": message
+    }
+    if tenant_id:
+        payload["tenant_id"] = tenant_id
+    try:
+        entry_id = await publish(
+            redis_client,
+            json.dumps(payload),
+            stream=settings.STREAM_NAME,
+            max_len=settings.STREAM_MAX_LEN
+        )
+    finally:
+        await redis_client.close()
+    
+    print(f"✓ Message added to stream '{settings.STREAM_NAME}' as {entry_id}")
+    print(f"  User ID: {user_id}")
+    print(f"  Type: {notification_type}")
+    print(f"  Message: {message}")
+
+
 if __name__ == "__main__":
-    # Default values
-    user_id = sys.argv[1] if len(sys.argv) > 1 else "user1"
-    notification_type = sys.argv[2] if len(sys.argv) > 2 else "news"
-    message = sys.argv[3] if len(sys.argv) > 3 else "Test notification"
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("user_id", nargs="?", default="user1")
+    parser.add_argument("notification_type", nargs="?", default="news")
+    parser.add_argument("message", nargs="?", default="Test notification")
+    parser.add_argument("--format", choices=["json", "msgpack"], default="json",
+                        help="body encoding (RabbitMQ only)")
+    parser.add_argument("--compress", choices=codec.COMPRESSIONS,
+                        help="compress bodies of at least --compress-threshold bytes (RabbitMQ only)")
+    parser.add_argument("--compress-threshold", type=int, default=codec.DEFAULT_COMPRESSION_THRESHOLD)
+    parser.add_argument("--tenant", help="tenant whose rules apply (one of TENANT_RULES)")
+    args = parser.parse_args()
     
     try:
-        publish_message(user_id, notification_type, message)
+        if settings.CONSUMER_TRANSPORT == "redis-streams":
+            if args.format != "json" or args.compress:
+                parser.error("the Redis stream carries JSON text; --format/--compress need RabbitMQ")
+            asyncio.run(publish_stream_message(
+                args.user_id, args.notification_type, args.message, tenant_id=args.tenant
+            ))
+        else:
+            publish_message(
+                args.user_id,
+                args.notification_type,
+                args.message,
+                content_type=codec.MSGPACK if args.format == "msgpack" else codec.JSON,
+                compression=args.compress,
+                compression_threshold=args.compress_threshold,
+                tenant_id=args.tenant
+            )
     except Exception as e:
         print(f"✗ Error publishing message: {e}")
         sys.exit(1)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Reset rate limiter state in Redis without blocking it.
+
+Usage:
+    python -m scripts.reset_rate_limits --user user1
+    python -m scripts.reset_rate_limits --type marketing
+    python -m scripts.reset_rate_limits --pattern 'test-*'
+    python -m scripts.reset_rate_limits --tenant shop --type marketing
+"""
+import argparse
+import asyncio
+import sys
+from app.adapters.redis_client import RedisClient
+from app.config import settings
+from app.core.limiter_reset import LimiterStateReset, ResetProgress
+from app.core.notification_rules import RateLimitConfig
+from app.core.rate_limiter import RedisRateLimiter
+from app.core.tenants import TenantRuleSets, tenant_key_prefix
+
+
+def print_progress(progress: ResetProgress) -> None:
+    print(
+        f"  scanned={progress.scanned} removed={progress.removed} "
+        f"batches={progress.batches}{' (done)' if progress.done else ''}"
+    )
+
+
+async def reset(args: argparse.Namespace) -> ResetProgress:
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    tenants = TenantRuleSets(RateLimitConfig(), settings.TENANT_RULES)
+    limiter = RedisRateLimiter(
+        redis_client,
+        tenants.config_for(args.tenant),
+        key_prefix=tenant_key_prefix("ratelimit", args.tenant)
+    )
+    resetter = LimiterStateReset(
+        limiter,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        on_progress=print_progress
+    )
+    try:
+        if args.user is not None:
+            return await resetter.reset_user(args.user)
+        if args.type is not None:
+            return await resetter.reset_type(args.type)
+        return await resetter.reset_pattern(args.pattern)
+    finally:
+        await redis_client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user", help="user id to reset")
+    target.add_argument("--type", help="notification type to reset for every user")
+    target.add_argument("--pattern", help="glob over user ids ('*' resets everyone)")
+    parser.add_argument("--tenant", help="tenant whose state to reset (default tenant if omitted)")
+    parser.add_argument("--batch-size", type=int, default=settings.RATE_LIMIT_RESET_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=settings.RATE_LIMIT_RESET_PAUSE_SECONDS,
+                        help="seconds to sleep between batches")
+    args = parser.parse_args()
+    
+    try:
+        progress = asyncio.run(reset(args))
+    except Exception as e:
+        print(f"✗ Error resetting rate limits: {e}")
+        sys.exit(1)
+    
+    print(f"✓ Reset complete: {progress.removed} entries removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Replay notification traffic through the rate limit rules offline.
+
+Usage:
+    python -m scripts.simulate_rate_limits --synthetic-users 100000 --days 30
+    python -m scripts.simulate_rate_limits --trace events.csv --rule news=2/86400 --rule marketing=5/3600:digest
+    python -m scripts.simulate_rate_limits --trace /var/log/notifications/audit --rule status=none
+
+A trace is a CSV of `timestamp,user_id,type`, a directory of audit log
+files, or an .npz written with --save. With --rule, the same traffic is
+also replayed with those rules replaced (`type=none` removes one) and
+both results are reported. Each tenant in TENANT_RULES is replayed under
+its own rules, with the candidate rules replacing the defaults they
+derive from.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+from app.core.audit import FILE_PREFIX, FILE_SUFFIX
+from app.core.notification_rules import RateLimitConfig
+from app.core.simulator import (
+    Comparison,
+    Trace,
+    format_reports,
+    parse_rule,
+    replay,
+    replay_reference,
+    synthetic_trace,
+    with_overrides,
+)
+from app.core.tenants import TenantRuleSets
+
+
+def load_trace(args: argparse.Namespace) -> Trace:
+    if args.trace is None:
+        return synthetic_trace(
+            users=args.synthetic_users,
+            days=args.days,
+            events_per_user_per_day=args.rate,
+            seed=args.seed
+        )
+    path = Path(args.trace)
+    if path.is_dir():
+        return Trace.from_audit_files(list(path.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}")))
+    if path.suffix == ".npz":
+        return Trace.load(path)
+    return Trace.from_csv(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="CSV file, audit log directory or .npz (default: synthetic)")
+    parser.add_argument("--synthetic-users", type=int, default=10_000)
+    parser.add_argument("--days", type=float, default=30.0, help="length of the synthetic trace")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="mean notifications per user per day in the synthetic trace")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--rule", action="append", default=[], metavar="TYPE=COUNT/SECONDS[:digest]",
+                        help="candidate rule to compare with the current ones (repeatable)")
+    parser.add_argument("--save", help="write the trace to this .npz for faster re-runs")
+    parser.add_argument("--verify", action="store_true",
+                        help="cross-check decisions against LocalRateLimiter (slow)")
+    args = parser.parse_args()
+
+    try:
+        overrides = [parse_rule(spec) for spec in args.rule]
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    trace = load_trace(args)
+    print(f"Loaded {len(trace)} events in {time.perf_counter() - started:.2f}s")
+    if args.save:
+        trace.save(args.save)
+
+    baseline = TenantRuleSets(RateLimitConfig(), settings.TENANT_RULES)
+    started = time.perf_counter()
+    result = replay(trace, baseline)
+    print(f"\nCurrent rules ({time.perf_counter() - started:.2f}s)")
+    print("\n".join(format_reports(result.reports)))
+
+    if args.verify:
+        reference = asyncio.run(replay_reference(trace, baseline))
+        mismatches = int(np.count_nonzero(reference != result.allowed))
+        print(f"\nLocalRateLimiter cross-check: {mismatches} mismatching decision(s)")
+        if mismatches:
+            sys.exit(1)
+
+    if overrides:
+        candidate = TenantRuleSets(with_overrides(baseline.default, overrides), settings.TENANT_RULES)
+        started = time.perf_counter()
+        comparison = Comparison(baseline=result, candidate=replay(trace, candidate))
+        print(f"\nCandidate rules ({time.perf_counter() - started:.2f}s)")
+        print("\n".join(format_reports(comparison.candidate.reports)))
+        print(f"\nDenied: {result.denied} -> {comparison.candidate.denied} "
+              f"({comparison.newly_denied} newly denied, {comparison.newly_allowed} newly allowed)")
+
+
+if __name__ == "__main__":
+    main()
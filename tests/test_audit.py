@@ -0,0 +1,148 @@
+"""Tests for the decision audit log."""
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.core.audit import AuditLog, read_records
+from app.core.gateway import GatewayThrottledError, MockGateway
+from app.core.notification_rules import RateLimitConfig
+from app.core.notification_service import NotificationService
+from app.core.rate_limiter import LocalRateLimiter
+
+
+def _files(directory):
+    return sorted(directory.glob("audit-*.msgpack.gz"))
+
+
+def _records(directory):
+    return [record for path in _files(directory) for record in read_records(path)]
+
+
+def test_flush_writes_buffered_records(tmp_path):
+    audit = AuditLog(tmp_path, clock=lambda: 1000.0)
+
+    audit.record("u1", "news", "sent", rule="1/86400s", remaining=0, limiter_seconds=0.0012)
+    audit.record("u2", "news", "failed", error="ConnectionError: down")
+
+    assert _files(tmp_path) == []
+    assert audit.flush() == 2
+    records = _records(tmp_path)
+    assert records[0] == {
+        "ts": 1000.0,
+        "user_id": "u1",
+        "type": "news",
+        "rule": "1/86400s",
+        "outcome": "sent",
+        "remaining": 0,
+        "limiter_ms": 1.2,
+        "gateway_ms": None,
+        "error": None,
+        "tenant_id": None,
+        "source": None,
+    }
+    assert records[1]["error"] == "ConnectionError: down"
+    assert audit.status()["written"] == 2
+
+
+def test_batches_append_to_the_same_file(tmp_path):
+    audit = AuditLog(tmp_path)
+
+    for i in range(3):
+        audit.record(f"u{i}", "news", "sent")
+        audit.flush()
+
+    assert len(_files(tmp_path)) == 1
+    assert [r["user_id"] for r in _records(tmp_path)] == ["u0", "u1", "u2"]
+
+
+def test_full_buffer_drops_new_records(tmp_path):
+    audit = AuditLog(tmp_path, max_buffered=2)
+
+    results = [audit.record(f"u{i}", "news", "sent") for i in range(3)]
+
+    assert results == [True, True, False]
+    assert audit.status()["dropped"] == 1
+    audit.flush()
+    assert [r["user_id"] for r in _records(tmp_path)] == ["u0", "u1"]
+
+
+def test_rotates_by_size_and_age_and_prunes_old_files(tmp_path):
+    now = [1000.0]
+    audit = AuditLog(tmp_path, rotate_bytes=1, rotate_seconds=60, max_files=2, clock=lambda: now[0])
+
+    for i in range(4):
+        audit.record(f"u{i}", "news", "sent")
+        audit.flush()
+        now[0] += 1
+
+    assert len(_files(tmp_path)) == 2
+    assert [r["user_id"] for r in _records(tmp_path)] == ["u2", "u3"]
+
+    audit.rotate_bytes = 1 << 20
+    audit.record("u4", "news", "sent")
+    audit.flush()
+    now[0] += 60
+    audit.record("u5", "news", "sent")
+    audit.flush()
+    newest = _files(tmp_path)[-1]
+    assert audit.files_opened == 5
+    assert [r["user_id"] for r in read_records(newest)] == ["u5"]
+
+
+def test_write_failure_is_counted_not_raised(tmp_path):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    audit = AuditLog(blocker)
+
+    audit.record("u1", "news", "sent")
+
+    assert audit.flush() == 0
+    assert audit.status()["lost"] == 1
+    assert audit.status()["write_errors"] == 1
+
+
+def test_writer_thread_flushes_full_batches_and_on_stop(tmp_path):
+    audit = AuditLog(tmp_path, batch_size=2, flush_interval_seconds=60)
+    audit.start()
+    try:
+        audit.record("u1", "news", "sent")
+        audit.record("u2", "news", "sent")
+        deadline = time.monotonic() + 2
+        while audit.written < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert audit.written == 2
+
+        audit.record("u3", "news", "sent")
+    finally:
+        audit.stop()
+
+    assert [r["user_id"] for r in _records(tmp_path)] == ["u1", "u2", "u3"]
+    assert audit.status()["current_file"] is None
+
+
+@pytest.mark.asyncio
+async def test_service_records_each_decision(tmp_path):
+    audit = AuditLog(tmp_path)
+    gateway = MockGateway()
+    service = NotificationService(gateway, rate_limiter=LocalRateLimiter(RateLimitConfig()), audit_log=audit)
+
+    assert await service.send("u1", "news", "first") is True
+    assert await service.send("u1", "news", "second") is False
+    gateway.send = AsyncMock(side_effect=GatewayThrottledError("slow down"))
+    with pytest.raises(GatewayThrottledError):
+        await service.send("u2", "status", "hi")
+    await service.send_many(["u1", "u3"], "news", "bulk")
+
+    audit.flush()
+    records = [(r["user_id"], r["rule"], r["outcome"]) for r in _records(tmp_path)]
+    assert records == [
+        ("u1", "1/86400s", "sent"),
+        ("u1", "1/86400s", "rate_limited"),
+        ("u2", "2/60s", "throttled"),
+        ("u1", "1/86400s", "rate_limited"),
+        ("u3", "1/86400s", "throttled"),
+    ]
+    first = _records(tmp_path)[0]
+    assert first["remaining"] == 0
+    assert first["limiter_ms"] >= 0 and first["gateway_ms"] >= 0
@@ -0,0 +1,77 @@
+"""Tests for message body encoding."""
+import gzip
+import json
+
+import pytest
+
+from app.core import codec
+from app.core.codec import MessageDecodeError
+
+
+PAYLOAD = {"user_id": "user1", "type": "news", "message": "x" * 2000}
+
+
+@pytest.mark.parametrize("content_type", [codec.JSON, codec.MSGPACK])
+@pytest.mark.parametrize("compression", [None, codec.GZIP, codec.ZSTD])
+def test_encode_round_trips(content_type, compression):
+    body, encoded_type, encoding = codec.encode(PAYLOAD, content_type, compression)
+
+    assert encoded_type == content_type
+    assert encoding == compression
+    assert codec.decode(body, encoded_type, encoding) == PAYLOAD
+
+
+def test_compression_shrinks_large_bodies():
+    plain, _, _ = codec.encode(PAYLOAD)
+    packed, _, _ = codec.encode(PAYLOAD, codec.MSGPACK, codec.ZSTD)
+
+    assert len(packed) < len(plain) / 10
+
+
+def test_small_bodies_are_not_compressed():
+    small = {"user_id": "user1", "type": "news", "message": "hi"}
+
+    body, _, encoding = codec.encode(small, compression=codec.ZSTD)
+
+    assert encoding is None
+    assert body == json.dumps(small).encode()
+
+
+def test_missing_content_type_means_json():
+    assert codec.decode(b'{"a": 1}') == {"a": 1}
+
+
+def test_content_type_aliases_and_parameters():
+    body, _, _ = codec.encode({"a": 1}, codec.MSGPACK)
+
+    assert codec.decode(body, "application/x-msgpack") == {"a": 1}
+    assert codec.decode(b'{"a": 1}', "application/json; charset=utf-8") == {"a": 1}
+
+
+def test_gzip_body_from_other_producers():
+    assert codec.decode(gzip.compress(b'{"a": 1}'), codec.JSON, "GZIP") == {"a": 1}
+
+
+@pytest.mark.parametrize(
+    "body, content_type, content_encoding",
+    [
+        (b"not valid json {", None, None),
+        (b"\xff\xfe", None, None),
+        (b'{"a": 1}', "text/plain", None),
+        (b'{"a": 1}', None, "br"),
+        (b"not gzip", None, codec.GZIP),
+        (b"not zstd", None, codec.ZSTD),
+        (b"\xc1", codec.MSGPACK, None),
+        (b"[1, 2]", None, None),
+    ],
+)
+def test_undecodable_bodies_raise(body, content_type, content_encoding):
+    with pytest.raises(MessageDecodeError):
+        codec.decode(body, content_type, content_encoding)
+
+
+def test_encode_rejects_unknown_formats():
+    with pytest.raises(ValueError):
+        codec.encode(PAYLOAD, "text/plain")
+    with pytest.raises(ValueError):
+        codec.encode(PAYLOAD, compression="br")
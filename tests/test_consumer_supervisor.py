@@ -0,0 +1,137 @@
+"""Tests for the self-healing consumer supervisor."""
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pika.exceptions
+
+from app.core.supervisor import ConsumerState, ConsumerSupervisor
+from app.main import app
+
+
+class FlakyConsumer:
+    """Consumer stand-in that fails a given number of times before consuming."""
+
+    def __init__(self, failures, connect_before_failing=False):
+        self.failures = failures
+        self.connect_before_failing = connect_before_failing
+        self.starts = 0
+        self.sessions = 0
+        self.consuming_since = None
+        self.inflight_count = 0
+        self.prefetch_count = 1
+        self._stop = threading.Event()
+
+    @property
+    def is_consuming(self):
+        return self.consuming_since is not None
+
+    @property
+    def stop_requested(self):
+        return self._stop.is_set()
+
+    def start_consuming(self):
+        self.starts += 1
+        if self.starts <= self.failures:
+            if self.connect_before_failing:
+                self.sessions += 1
+            raise pika.exceptions.AMQPConnectionError("broker restarted")
+        self.sessions += 1
+        self.consuming_since = 1.0
+        self._stop.wait()
+        self.consuming_since = None
+
+    def stop_consuming(self):
+        self._stop.set()
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the supervisor"
+        time.sleep(0.001)
+
+
+def _run(supervisor):
+    thread = threading.Thread(target=supervisor.run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_supervisor_reconnects_with_growing_jittered_backoff():
+    """Failures should be retried with backoff caps doubling per attempt."""
+    caps = []
+    consumer = FlakyConsumer(failures=3)
+    supervisor = ConsumerSupervisor(
+        consumer,
+        initial_backoff_seconds=0.01,
+        max_backoff_seconds=0.03,
+        jitter=lambda low, high: caps.append(high) or 0,
+    )
+    thread = _run(supervisor)
+    
+    _wait_until(lambda: consumer.is_consuming)
+    status = supervisor.status()
+    supervisor.stop()
+    thread.join(timeout=1)
+    
+    assert caps == [0.01, 0.02, 0.03]
+    assert status["state"] == "consuming"
+    assert status["restarts"] == 3
+    assert "broker restarted" in status["last_error"]
+    assert supervisor.state == ConsumerState.STOPPED
+
+
+def test_supervisor_resets_backoff_after_a_successful_connection():
+    """A consumer that connected before failing should restart from the smallest delay."""
+    caps = []
+    consumer = FlakyConsumer(failures=2, connect_before_failing=True)
+    supervisor = ConsumerSupervisor(
+        consumer,
+        initial_backoff_seconds=0.01,
+        jitter=lambda low, high: caps.append(high) or 0,
+    )
+    thread = _run(supervisor)
+    
+    _wait_until(lambda: consumer.is_consuming)
+    supervisor.stop()
+    thread.join(timeout=1)
+    
+    assert caps == [0.01, 0.01]
+
+
+def test_supervisor_stops_while_backing_off():
+    """stop() should interrupt a pending reconnect delay."""
+    consumer = FlakyConsumer(failures=100)
+    supervisor = ConsumerSupervisor(consumer, initial_backoff_seconds=60, jitter=lambda low, high: high)
+    thread = _run(supervisor)
+    
+    _wait_until(lambda: supervisor.state == ConsumerState.RECONNECTING)
+    supervisor.stop()
+    thread.join(timeout=1)
+    
+    assert not thread.is_alive()
+    assert supervisor.state == ConsumerState.STOPPED
+    assert consumer.starts == 1
+
+
+def test_consumer_health_endpoint_reports_state(client, monkeypatch):
+    """/health/consumer should be 200 only while the consumer is consuming."""
+    import app.main as main
+    
+    transport = MagicMock(name="transport")
+    transport.name = "rabbitmq-consumer"
+    transport.status.return_value = {
+        "state": "reconnecting", "consuming_since": None, "inflight": 0,
+        "restarts": 2, "last_error": "AMQPConnectionError: down", "last_error_at": 1.0,
+    }
+    monkeypatch.setattr(main, "transport", transport)
+    
+    response = client.get("/health/consumer")
+    
+    assert response.status_code == 503
+    assert response.json()["status"] == "reconnecting"
+    assert response.json()["restarts"] == 2
+    
+    transport.status.return_value = {**transport.status.return_value, "state": "consuming"}
+    assert client.get("/health/consumer").status_code == 200
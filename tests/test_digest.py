@@ -0,0 +1,185 @@
+"""Tests for digest coalescing of over-limit notifications."""
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.adapters.redis_client import RedisClient
+from app.config import settings
+from app.core.audit import SOURCE_DIGEST
+from app.core.digest import DigestBuffer, DigestFlusher, combine
+from app.core.gateway import MockGateway
+from app.core.notification_rules import RateLimitConfig, RateLimitRule
+from app.core.notification_service import NotificationService, SendOutcome
+from app.core.preferences import Preferences, PreferenceStore
+from app.core.rate_limiter import LocalRateLimiter, RateLimitDecision
+
+NOW = 1_700_000_000.0
+
+
+def _digest_config():
+    config = RateLimitConfig()
+    config.add_rule(
+        RateLimitRule(type="marketing", max_count=1, time_window_seconds=3600, on_limit="digest"),
+        overwrite=True,
+    )
+    return config
+
+
+@pytest.mark.asyncio
+async def test_over_limit_digest_notifications_are_buffered():
+    """With a digest rule, over-limit sends go to the buffer instead of being dropped."""
+    gateway = MockGateway()
+    buffer = MagicMock()
+    buffer.add = AsyncMock()
+    service = NotificationService(
+        gateway, rate_limiter=LocalRateLimiter(_digest_config()), digest_buffer=buffer
+    )
+    
+    assert await service.send("u1", "marketing", "First") is True
+    assert await service.send("u1", "marketing", "Second") is False
+    
+    assert len(gateway.sent_notifications) == 1
+    user_id, notification_type, message, due_at = buffer.add.await_args.args
+    assert (user_id, notification_type, message) == ("u1", "marketing", "Second")
+    assert due_at % 3600 == 0
+
+
+@pytest.mark.asyncio
+async def test_reject_rules_are_not_buffered():
+    """Rules without on_limit=digest keep dropping over-limit sends."""
+    buffer = MagicMock()
+    buffer.add_many = AsyncMock()
+    service = NotificationService(
+        MockGateway(), rate_limiter=LocalRateLimiter(_digest_config()), digest_buffer=buffer
+    )
+    await service.send("u1", "news", "First")
+    
+    outcomes = await service.send_many(["u1"], "news", "Second")
+    
+    assert outcomes == {"u1": SendOutcome.RATE_LIMITED}
+    buffer.add_many.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_flusher_sends_one_combined_notification():
+    """A due digest should be delivered as a single combined gateway send."""
+    gateway = MockGateway()
+    buffer = MagicMock()
+    buffer.claim_due = AsyncMock(return_value=[("u1", "marketing", ["A", "B", "C"], 0)])
+    buffer.requeue = AsyncMock()
+    flusher = DigestFlusher(buffer, NotificationService(gateway, rate_limiter=LocalRateLimiter(_digest_config())))
+    
+    sent = await flusher.flush_due(now=NOW)
+    
+    assert sent == 1
+    assert [n.message for n in gateway.sent_notifications] == [combine(["A", "B", "C"])]
+    buffer.requeue.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_flusher_requeues_when_window_is_already_full():
+    """If the new window is already used up, the digest waits for the next one."""
+    gateway = MockGateway()
+    buffer = MagicMock()
+    buffer.claim_due = AsyncMock(return_value=[("u1", "marketing", ["A"], 0)])
+    buffer.requeue = AsyncMock()
+    limiter = MagicMock()
+    limiter.hit = AsyncMock(return_value=RateLimitDecision(allowed=False, remaining=0, reset_at=123))
+    flusher = DigestFlusher(buffer, NotificationService(gateway, rate_limiter=limiter))
+    
+    assert await flusher.flush_due(now=NOW) == 0
+    
+    buffer.requeue.assert_awaited_once_with("u1", "marketing", ["A"], 123, 0)
+    assert gateway.sent_notifications == []
+
+
+@pytest.mark.asyncio
+async def test_flusher_requeues_on_gateway_error():
+    """A failing gateway must not lose the claimed digest."""
+    gateway = MockGateway()
+    gateway.send = AsyncMock(side_effect=ConnectionError("down"))
+    buffer = MagicMock()
+    buffer.claim_due = AsyncMock(return_value=[("u1", "marketing", ["A"], 0)])
+    buffer.requeue = AsyncMock()
+    flusher = DigestFlusher(
+        buffer, NotificationService(gateway, rate_limiter=LocalRateLimiter(_digest_config())), interval_seconds=5
+    )
+    
+    await flusher.flush_due(now=NOW)
+    
+    buffer.requeue.assert_awaited_once_with("u1", "marketing", ["A"], int(NOW + 5), 1)
+
+
+@pytest.mark.asyncio
+async def test_flusher_drops_and_audits_digests_of_opted_out_users():
+    """Digests go through the service, so opt-outs and the audit log apply."""
+    gateway = MockGateway()
+    buffer = MagicMock()
+    buffer.claim_due = AsyncMock(return_value=[("quiet", "marketing", ["A"], 0), ("loud", "marketing", ["B"], 0)])
+    buffer.requeue = AsyncMock()
+    store = MagicMock(spec=PreferenceStore)
+    store.get_many = AsyncMock(side_effect=lambda user_ids: {
+        user_id: Preferences(opted_out=user_id == "quiet") for user_id in user_ids
+    })
+    audit = MagicMock()
+    service = NotificationService(
+        gateway, rate_limiter=LocalRateLimiter(_digest_config()), audit_log=audit, preferences=store
+    )
+    
+    assert await DigestFlusher(buffer, service).flush_due(now=NOW) == 1
+    
+    assert [n.user_id for n in gateway.sent_notifications] == ["loud"]
+    buffer.requeue.assert_not_called()
+    assert [(c.args[0], c.args[2]) for c in audit.record.call_args_list] == [
+        ("quiet", "opted_out"),
+        ("loud", "sent"),
+    ]
+    assert audit.record.call_args.kwargs["source"] == SOURCE_DIGEST
+
+
+@pytest.mark.asyncio
+async def test_claim_due_claims_each_digest_once():
+    """Due digests are claimed in one batch, and only by the first caller."""
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    buffer = DigestBuffer(redis_client, key_prefix=f"test-digest-{uuid.uuid4().hex}")
+    try:
+        await buffer.add_many(["u1", "u2"], "marketing", "A", due_at=int(NOW))
+        await buffer.add("u1", "marketing", "B", due_at=int(NOW))
+        await buffer.add("u3", "marketing", "C", due_at=int(NOW) + 60)
+        
+        claimed = await buffer.claim_due(NOW)
+        
+        assert sorted(claimed) == [("u1", "marketing", ["A", "B"], 0), ("u2", "marketing", ["A"], 0)]
+        assert await buffer.claim_due(NOW) == []
+        await buffer.requeue("u2", "marketing", ["A"], due_at=int(NOW), attempts=2)
+        assert await buffer.claim_due(NOW) == [("u2", "marketing", ["A"], 2)]
+    finally:
+        for key in (buffer.due_key, buffer.attempts_key, buffer.buffer_key("u3", "marketing")):
+            await redis_client.delete(key)
+        await redis_client.close()
+
+
+@pytest.mark.asyncio
+async def test_flusher_backs_off_and_drops_digests_that_keep_failing(caplog):
+    """Failed digests are retried with growing delays, then dropped and logged."""
+    gateway = MockGateway()
+    gateway.send = AsyncMock(return_value=False)
+    buffer = MagicMock()
+    buffer.requeue = AsyncMock()
+    flusher = DigestFlusher(
+        buffer,
+        NotificationService(gateway, rate_limiter=LocalRateLimiter(_digest_config())),
+        interval_seconds=5,
+        max_attempts=3,
+    )
+    
+    buffer.claim_due = AsyncMock(return_value=[("u1", "marketing", ["A"], 1)])
+    await flusher.flush_due(now=NOW)
+    buffer.requeue.assert_awaited_once_with("u1", "marketing", ["A"], int(NOW + 10), 2)
+    
+    buffer.requeue.reset_mock()
+    buffer.claim_due = AsyncMock(return_value=[("u1", "marketing", ["A"], 2)])
+    await flusher.flush_due(now=NOW)
+    buffer.requeue.assert_not_called()
+    assert [r.event for r in caplog.records if r.levelname == "ERROR"] == ["digest.dead_lettered"]
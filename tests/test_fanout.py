@@ -0,0 +1,215 @@
+"""Tests for fan-out expansion and checkpointing."""
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.consumer import NotificationConsumer
+from app.core.fanout import FanoutProcessor
+from app.core.messages import MessageProcessor
+from app.core.gateway import GatewayUnavailableError, MockGateway, Notification
+from app.core.notification_rules import RateLimitConfig, RateLimitRule
+from app.core.notification_service import NotificationService, SendOutcome
+from app.core.rate_limiter import LocalRateLimiter
+
+
+class InMemoryCheckpoints:
+    """Just enough of RedisClient for checkpoints and segment scans."""
+
+    def __init__(self, segments=None):
+        self.hashes = {}
+        self.segments = {key: set(members) for key, members in (segments or {}).items()}
+        self.saves = 0
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hset(self, key, mapping, expire=None):
+        self.saves += 1
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    async def sadd(self, key, members, expire=None):
+        members_set = self.segments.setdefault(key, set())
+        added = set(members) - members_set
+        members_set.update(added)
+        return len(added)
+
+    async def smismember(self, key, members):
+        return [member in self.segments.get(key, ()) for member in members]
+
+    async def srem(self, key, members):
+        members_set = self.segments.get(key, set())
+        removed = members_set & set(members)
+        members_set -= removed
+        return len(removed)
+
+    async def sscan(self, key, cursor=0, count=None):
+        members = sorted(self.segments.get(key, ()))
+        end = cursor + count
+        return (end if end < len(members) else 0), members[cursor:end]
+
+
+class FailingGateway(MockGateway):
+    """Gateway that raises for one user."""
+
+    def __init__(self, failures=None):
+        super().__init__()
+        self.failures = failures
+
+    async def send(self, notification: Notification) -> bool:
+        if notification.user_id == "u3" and self.failures != 0:
+            if self.failures is not None:
+                self.failures -= 1
+            raise ConnectionError("provider down")
+        return await super().send(notification)
+
+
+@pytest.mark.asyncio
+async def test_send_many_batches_limits_and_reports_outcomes():
+    """send_many should classify every user as sent, rate limited or failed."""
+    gateway = FailingGateway()
+    limiter = LocalRateLimiter(RateLimitConfig())
+    service = NotificationService(gateway, rate_limiter=limiter)
+    await limiter.hit("u2", "news")
+    
+    outcomes = await service.send_many(["u1", "u2", "u3"], "news", "Hello")
+    
+    assert outcomes == {
+        "u1": SendOutcome.SENT,
+        "u2": SendOutcome.RATE_LIMITED,
+        "u3": SendOutcome.FAILED,
+    }
+    assert [n.user_id for n in gateway.sent_notifications] == ["u1"]
+
+
+@pytest.mark.asyncio
+async def test_fanout_sends_list_in_chunks_with_checkpoints():
+    """A user_ids fan-out should be processed chunk by chunk, checkpointing each."""
+    gateway = MockGateway()
+    redis = InMemoryCheckpoints()
+    processor = FanoutProcessor(NotificationService(gateway), redis, chunk_size=2)
+    
+    progress = await processor.process(
+        "f1", "news", "Hello", user_ids=["u1", "u2", "u3", "u4", "u5"]
+    )
+    
+    assert progress.sent == 5
+    assert progress.chunks == 3
+    assert progress.done is True
+    assert redis.hashes["fanout:f1"]["position"] == "5"
+    assert len(gateway.sent_notifications) == 5
+
+
+@pytest.mark.asyncio
+async def test_fanout_resumes_from_checkpoint_and_skips_completed():
+    """A redelivered fan-out should continue after the last checkpoint only once."""
+    gateway = MockGateway()
+    redis = InMemoryCheckpoints()
+    redis.hashes["fanout:f1"] = {"position": "2", "chunks": "1", "sent": "2"}
+    processor = FanoutProcessor(NotificationService(gateway), redis, chunk_size=2)
+    user_ids = ["u1", "u2", "u3", "u4"]
+    
+    progress = await processor.process("f1", "news", "Hello", user_ids=user_ids)
+    again = await processor.process("f1", "news", "Hello", user_ids=user_ids)
+    
+    assert [n.user_id for n in gateway.sent_notifications] == ["u3", "u4"]
+    assert progress.sent == 4
+    assert again.done is True
+
+
+@pytest.mark.asyncio
+async def test_fanout_streams_segment_members():
+    """A segment fan-out should expand the Redis set with SSCAN."""
+    gateway = MockGateway()
+    redis = InMemoryCheckpoints(segments={"segment:vip": {"a", "b", "c"}})
+    processor = FanoutProcessor(NotificationService(gateway), redis, chunk_size=2)
+    
+    progress = await processor.process("f2", "marketing", "Sale", segment="vip")
+    
+    assert sorted(n.user_id for n in gateway.sent_notifications) == ["a", "b", "c"]
+    assert progress.chunks == 2
+
+
+@pytest.mark.asyncio
+async def test_fanout_retries_undelivered_recipients_on_redelivery():
+    """Failed sends should keep the fan-out open until a redelivery delivers them."""
+    gateway = FailingGateway(failures=1)
+    redis = InMemoryCheckpoints()
+    processor = FanoutProcessor(NotificationService(gateway), redis, chunk_size=2)
+    user_ids = ["u1", "u2", "u3", "u4"]
+    
+    with pytest.raises(GatewayUnavailableError):
+        await processor.process("f5", "news", "Hello", user_ids=user_ids)
+    assert redis.hashes["fanout:f5"]["pending"] == "1"
+    assert redis.segments["fanout:f5:pending"] == {"u3"}
+    
+    progress = await processor.process("f5", "news", "Hello", user_ids=user_ids)
+    
+    assert [n.user_id for n in gateway.sent_notifications] == ["u1", "u2", "u4", "u3"]
+    assert (progress.sent, progress.pending, progress.done) == (4, 0, True)
+    assert redis.segments["fanout:f5:pending"] == set()
+
+
+@pytest.mark.asyncio
+async def test_fanout_counts_and_checkpoints_digested_sends():
+    """Over-limit sends held for a digest should be counted apart from failures."""
+    config = RateLimitConfig()
+    config.add_rule(
+        RateLimitRule(type="marketing", max_count=1, time_window_seconds=3600, on_limit="digest"),
+        overwrite=True,
+    )
+    limiter = LocalRateLimiter(config)
+    await limiter.hit("u1", "marketing")
+    service = NotificationService(
+        MockGateway(), rate_limiter=limiter, digest_buffer=MagicMock(add_many=AsyncMock())
+    )
+    redis = InMemoryCheckpoints()
+    
+    progress = await FanoutProcessor(service, redis).process("f4", "marketing", "Sale", user_ids=["u1", "u2"])
+    
+    assert (progress.sent, progress.digested, progress.pending) == (1, 1, 0)
+    assert redis.hashes["fanout:f4"]["digested"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_consumer_routes_fanout_messages_to_processor():
+    """Messages with user_ids should go to the fan-out processor, not service.send."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock()
+    processor = FanoutProcessor(service, InMemoryCheckpoints())
+    processor.process = AsyncMock()
+    consumer = NotificationConsumer(service=service, fanout_processor=processor)
+    
+    await consumer._process_message(json.dumps({
+        "fanout_id": "f3", "type": "news", "message": "Hi", "user_ids": ["u1"]
+    }))
+    
+    processor.process.assert_awaited_once_with(
+        fanout_id="f3", notification_type="news", message="Hi",
+        user_ids=["u1"], segment=None
+    )
+    service.send.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_fanout_sends_once_to_members_a_scan_returns_twice():
+    """SSCAN may repeat a member across pages; it must not be sent to twice."""
+    gateway = MockGateway()
+    redis = InMemoryCheckpoints()
+    redis.sscan = AsyncMock(side_effect=[(5, ["a", "b"]), (0, ["b", "c"])])
+    processor = FanoutProcessor(NotificationService(gateway), redis, chunk_size=2)
+    
+    progress = await processor.process("f6", "marketing", "Sale", segment="vip")
+    
+    assert [n.user_id for n in gateway.sent_notifications] == ["a", "b", "c"]
+    assert progress.sent == 3
+
+
+@pytest.mark.asyncio
+async def test_fanout_without_id_is_a_permanent_error():
+    """The id must come from the publisher, not the content, so repeats are not skipped."""
+    service = NotificationService(MockGateway())
+    processor = MessageProcessor(service, FanoutProcessor(service, InMemoryCheckpoints()))
+    
+    with pytest.raises(ValueError, match="fanout_id"):
+        await processor.handle({"type": "news", "message": "Hi", "user_ids": ["u1"]})
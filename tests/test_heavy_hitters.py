@@ -0,0 +1,158 @@
+"""Tests for heavy-hitter detection."""
+import uuid
+from collections import Counter
+
+import pytest
+import pytest_asyncio
+
+from app.adapters.redis_client import RedisClient
+from app.config import settings
+from app.core.gateway import MockGateway
+from app.core.heavy_hitters import CountMinSketch, HeavyHitterTracker, TopK
+from app.core.notification_rules import RateLimitConfig, RateLimitRule, ON_LIMIT_DIGEST
+from app.core.notification_service import NotificationService, SendOutcome
+from app.core.rate_limiter import LocalRateLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_040.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sketch_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=4)
+    truth = Counter(f"user{i % 300}" for i in range(3000))
+    truth.update({"hot": 500})
+    for key, count in truth.items():
+        for _ in range(count):
+            sketch.add(sketch.indexes(key))
+
+    assert all(sketch.estimate(sketch.indexes(key)) >= count for key, count in truth.items())
+    assert sketch.estimate(sketch.indexes("hot")) < 600
+    assert sketch.total == sum(truth.values())
+
+
+def test_top_k_keeps_the_largest_counts():
+    top = TopK(2)
+    for key, count in [("a", 1), ("b", 5), ("c", 3), ("a", 7), ("d", 2)]:
+        top.offer(key, count)
+
+    assert top.items() == [("a", 7), ("b", 5)]
+
+
+def test_tracker_ranks_users_and_reports_rule_limits():
+    tracker = HeavyHitterTracker(RateLimitConfig(), clock=FakeClock())
+    for _ in range(30):
+        tracker.observe("loud", "status")
+    for user in ("u1", "u2"):
+        tracker.observe(user, "news")
+
+    top = tracker.top(2)
+
+    assert (top[0].user_id, top[0].notification_type, top[0].count) == ("loud", "status", 30)
+    # 2 per minute; a 60s tracker window can overlap two rule windows.
+    assert top[0].limit == 4
+    assert len(top) == 2
+
+
+def test_tracker_rejects_only_far_beyond_reject_rules():
+    config = RateLimitConfig()
+    config.add_rule(RateLimitRule("digested", 2, 60, on_limit=ON_LIMIT_DIGEST))
+    tracker = HeavyHitterTracker(config, reject_factor=10, clock=FakeClock())
+
+    decisions = [tracker.observe("loud", "status") for _ in range(60)]
+    digested = [tracker.observe("loud", "digested") for _ in range(60)]
+    unlimited = [tracker.observe("loud", "no-rule") for _ in range(60)]
+
+    # 10 x limit of 4 = 40, plus the sketch's error bound.
+    assert decisions.index(True) == 40 + tracker.error_bound
+    assert not any(digested) and not any(unlimited)
+    assert tracker.rejected == decisions.count(True)
+
+
+def test_tracker_starts_over_each_window():
+    clock = FakeClock()
+    tracker = HeavyHitterTracker(RateLimitConfig(), clock=clock)
+    tracker.observe("u1", "status")
+
+    clock.now += 60
+
+    assert tracker.top() == []
+    assert tracker.window_start == int(clock.now) // 60 * 60
+
+
+@pytest.mark.asyncio
+async def test_service_refuses_heavy_hitters_before_the_limiter():
+    limiter = LocalRateLimiter(RateLimitConfig())
+    tracker = HeavyHitterTracker(RateLimitConfig(), reject_factor=1, clock=FakeClock())
+    service = NotificationService(MockGateway(), rate_limiter=limiter, heavy_hitters=tracker)
+    for _ in range(5):
+        await service.send("loud", "status", "hi")
+
+    assert await service.send("loud", "status", "hi") is False
+    outcomes = await service.send_many(["loud", "quiet"], "status", "hi")
+
+    assert outcomes == {"loud": SendOutcome.RATE_LIMITED, "quiet": SendOutcome.SENT}
+    # The limiter only saw the first five sends plus "quiet".
+    assert sum(count for _, count in limiter._counters.values()) == 3
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_sync_merges_counts_across_instances(redis_client):
+    prefix = f"test-heavy-hitters-{uuid.uuid4().hex}"
+    clock = FakeClock()
+    first, second = (
+        HeavyHitterTracker(RateLimitConfig(), redis_client, width=256, key_prefix=prefix, clock=clock)
+        for _ in range(2)
+    )
+    for _ in range(10):
+        first.observe("spread", "status")
+        second.observe("spread", "status")
+    second.observe("only-second", "news")
+
+    try:
+        await first.sync()
+        await second.sync()
+        await first.sync()
+    finally:
+        cells, keys = first._redis_keys(first._window)
+        await redis_client.delete(cells)
+        await redis_client.delete(keys)
+
+    top = {(h.user_id, h.notification_type): h.count for h in first.top()}
+    assert top == {("spread", "status"): 20, ("only-second", "news"): 1}
+    assert first.error_bound == 1
+    # Counting continues on top of the merged view.
+    first.observe("spread", "status")
+    assert first.top(1)[0].count == 21
+
+
+def test_heavy_hitters_endpoint(client, monkeypatch):
+    """/heavy-hitters lists the top users, or 503 when tracking is off."""
+    import app.main as main
+
+    monkeypatch.setattr(main, "heavy_hitters", None)
+    assert client.get("/heavy-hitters").status_code == 503
+
+    tracker = HeavyHitterTracker(RateLimitConfig(), clock=FakeClock())
+    for _ in range(3):
+        tracker.observe("loud", "status")
+    tracker.observe("quiet", "status")
+    monkeypatch.setattr(main, "heavy_hitters", tracker)
+
+    response = client.get("/heavy-hitters", params={"limit": 1})
+
+    assert response.status_code == 200
+    assert response.json()["top"] == [
+        {"user_id": "loud", "notification_type": "status", "count": 3, "limit": 4, "tenant_id": None}
+    ]
@@ -0,0 +1,112 @@
+"""Tests for non-blocking limiter state resets."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.limiter_reset import LimiterStateReset
+from app.core.notification_rules import RateLimitConfig
+from app.core.rate_limiter import RedisRateLimiter
+from app.core.tenants import TenantRuleSets, tenant_key_prefix
+
+
+def _resetter(scan_pages, pipe_results, limiter_kwargs=None, **kwargs):
+    pipes = []
+    
+    async def make_pipeline(*args, **kw):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=pipe_results.pop(0))
+        pipes.append(pipe)
+        return pipe
+    
+    redis_client = MagicMock()
+    redis_client.scan = AsyncMock(side_effect=scan_pages)
+    redis_client.pipeline = make_pipeline
+    limiter = RedisRateLimiter(redis_client, **(limiter_kwargs or {"config": RateLimitConfig()}))
+    return LimiterStateReset(limiter, pause_seconds=0, **kwargs), redis_client, pipes
+
+
+@pytest.mark.asyncio
+async def test_reset_pattern_scans_incrementally_and_unlinks_in_batches():
+    """Each SCAN page should be unlinked in its own pipeline until the cursor is 0."""
+    reports = []
+    resetter, redis_client, pipes = _resetter(
+        scan_pages=[(42, ["ratelimit:a", "ratelimit:b"]), (0, ["ratelimit:c"])],
+        pipe_results=[[1, 1], [1]],
+        batch_size=2,
+        on_progress=lambda p: reports.append((p.removed, p.done)),
+    )
+    
+    progress = await resetter.reset_pattern("*")
+    
+    assert redis_client.scan.await_args_list[0].kwargs == {"cursor": 0, "match": "ratelimit:*", "count": 2}
+    assert redis_client.scan.await_args_list[1].kwargs["cursor"] == 42
+    pipes[0].unlink.assert_any_call("ratelimit:a")
+    pipes[1].unlink.assert_called_once_with("ratelimit:c")
+    assert progress.removed == 3
+    assert progress.batches == 2
+    assert reports == [(2, False), (3, True)]
+
+
+@pytest.mark.asyncio
+async def test_reset_type_removes_only_that_field():
+    """Resetting a type should HDEL its field from every user hash."""
+    resetter, _, pipes = _resetter(
+        scan_pages=[(0, ["ratelimit:a", "ratelimit:b"])],
+        pipe_results=[[1, 0]],
+    )
+    
+    progress = await resetter.reset_type("marketing")
+    
+    pipes[0].hdel.assert_any_call("ratelimit:a", "marketing")
+    pipes[0].unlink.assert_not_called()
+    assert progress.removed == 1
+
+
+@pytest.mark.asyncio
+async def test_reset_type_rejects_unknown_types():
+    """Unknown types should be rejected rather than scanning the keyspace."""
+    resetter, redis_client, _ = _resetter(scan_pages=[], pipe_results=[])
+    
+    with pytest.raises(ValueError):
+        await resetter.reset_type("nonexistent")
+    redis_client.scan.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reset_type_of_a_tenant_uses_its_rules_and_keys():
+    """A tenant's limiter should reset only that tenant's keys, under its own rules."""
+    tenants = TenantRuleSets(RateLimitConfig(), {"shop": {"orders": {"max_count": 5, "time_window_seconds": 60}}})
+    resetter, redis_client, _ = _resetter(
+        scan_pages=[(0, [])],
+        pipe_results=[],
+        limiter_kwargs={"config": tenants.config_for("shop"), "key_prefix": tenant_key_prefix("ratelimit", "shop")},
+    )
+    
+    await resetter.reset_type("orders")
+    
+    assert redis_client.scan.await_args.kwargs["match"] == "{shop}:ratelimit:*"
+
+
+def test_reset_and_quota_endpoints_select_the_tenant(client, monkeypatch):
+    """tenant_id should pick the tenant's limiter; unknown tenants are a 404."""
+    import app.main as main
+    
+    monkeypatch.setattr(main, "tenant_rule_sets", TenantRuleSets(main.rate_limit_config, {"shop": {}}))
+    monkeypatch.setattr(main, "redis_rate_limiters", {})
+    monkeypatch.setattr(main, "quota_services", {})
+    
+    assert main.get_redis_rate_limiter("shop").key("u1") == "{shop}:ratelimit:u1"
+    assert main.get_quota_service("shop").limiter is main.get_redis_rate_limiter("shop")
+    assert main.get_redis_rate_limiter().key("u1") == "ratelimit:u1"
+    response = client.post("/admin/rate-limits/reset?tenant_id=bank", json={"user_id": "u1"})
+    assert response.status_code == 404
+    assert client.get("/users/u1/quota", params={"tenant_id": "bank"}).status_code == 404
+
+
+def test_reset_endpoint_requires_exactly_one_target(client):
+    """The admin endpoint should refuse ambiguous or empty requests."""
+    assert client.post("/admin/rate-limits/reset", json={}).status_code == 400
+    response = client.post(
+        "/admin/rate-limits/reset", json={"user_id": "u1", "pattern": "*"}
+    )
+    assert response.status_code == 400
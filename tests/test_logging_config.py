@@ -0,0 +1,53 @@
+"""Tests for structured, sampled, queue-based logging."""
+import json
+import logging
+import queue
+
+from app.logging_config import DeferredQueueHandler, JsonFormatter, SamplingFilter
+
+
+def _record(level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_json_formatter_includes_message_and_extra_fields():
+    """JsonFormatter should render the merged message plus any extra fields."""
+    line = JsonFormatter().format(_record(event="notification.sent", user_id="u1"))
+    
+    payload = json.loads(line)
+    assert payload["message"] == "hello world"
+    assert payload["level"] == "INFO"
+    assert payload["event"] == "notification.sent"
+    assert payload["user_id"] == "u1"
+
+
+def test_sampling_filter_drops_unsampled_events():
+    """An event with a zero sampling rate should be dropped at INFO."""
+    sampler = SamplingFilter({"notification.sent": 0.0})
+    
+    assert sampler.filter(_record(event="notification.sent")) is False
+    assert sampler.filter(_record(event="other")) is True
+    assert sampler.filter(_record()) is True
+
+
+def test_sampling_filter_always_keeps_warnings_and_errors():
+    """Warnings and errors must never be sampled away."""
+    sampler = SamplingFilter({"notification.failed": 0.0})
+    
+    assert sampler.filter(_record(level=logging.WARNING, event="notification.failed")) is True
+    assert sampler.filter(_record(level=logging.ERROR, event="notification.failed")) is True
+
+
+def test_deferred_queue_handler_does_not_format_on_caller_thread():
+    """The record should be enqueued with its args intact, formatting deferred."""
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    
+    handler.handle(_record())
+    
+    queued = log_queue.get_nowait()
+    assert queued.msg == "hello %s"
+    assert queued.args == ("world",)
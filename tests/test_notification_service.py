@@ -1,10 +1,14 @@
 """Tests for the NotificationService."""
+from unittest.mock import MagicMock
 
 import pytest
 import pytest_asyncio
 
 from app.core.gateway import Gateway, MockGateway, Notification
-from app.core.notification_service import NotificationService
+from app.core.notification_rules import RateLimitConfig
+from app.core.notification_service import DeliveryFailedError, NotificationService, SendOutcome
+from app.core.rate_limiter import LocalRateLimiter
+from app.core.routing import GatewayRegistry
 
 
 @pytest_asyncio.fixture
@@ -92,3 +96,86 @@ async def test_notification_service_send_multiple_notifications(
     assert mock_gateway.sent_notifications[2].user_id == "user1"
     assert mock_gateway.sent_notifications[2].notification_type == "marketing"
 
+
+
+@pytest.mark.asyncio
+async def test_notification_service_drops_rate_limited_notifications(mock_gateway: MockGateway):
+    """NotificationService should not reach the gateway once the limit is hit."""
+    
+    service = NotificationService(
+        gateway=mock_gateway,
+        rate_limiter=LocalRateLimiter(RateLimitConfig())
+    )
+    
+    first = await service.send(user_id="user1", notification_type="news", message="One")
+    second = await service.send(user_id="user1", notification_type="news", message="Two")
+    
+    assert first is True
+    assert second is False
+    assert len(mock_gateway.sent_notifications) == 1
+
+
+class FlakyGateway(MockGateway):
+    """Gateway whose first sends fail with the given results."""
+
+    def __init__(self, *failures) -> None:
+        super().__init__()
+        self.failures = list(failures)
+
+    async def send(self, notification: Notification) -> bool:
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return failure
+        return await super().send(notification)
+
+
+@pytest.mark.asyncio
+async def test_undelivered_sends_raise_and_are_refunded():
+    """A retried send should not be charged again for an attempt that was never delivered."""
+    gateway = FlakyGateway(ConnectionError("provider down"), False)
+    service = NotificationService(gateway=gateway, rate_limiter=LocalRateLimiter(RateLimitConfig()))
+
+    with pytest.raises(ConnectionError):
+        await service.send(user_id="user1", notification_type="news", message="One")
+    with pytest.raises(DeliveryFailedError):
+        await service.send(user_id="user1", notification_type="news", message="One")
+
+    # news allows one per day: only the delivered attempt used it.
+    assert await service.send(user_id="user1", notification_type="news", message="One") is True
+    assert await service.send(user_id="user1", notification_type="news", message="Two") is False
+    assert len(gateway.sent_notifications) == 1
+
+
+
+@pytest.mark.asyncio
+async def test_partial_channel_delivery_counts_as_sent_and_is_not_refunded():
+    """A send some channels delivered is not retried, so it keeps its charge."""
+    working = MockGateway()
+    registry = GatewayRegistry(
+        channels={"push": working, "email": FlakyGateway(*[False] * 10)},
+        routes={"news": ["push", "email"]},
+    )
+    audit = MagicMock()
+    service = NotificationService(registry, rate_limiter=LocalRateLimiter(RateLimitConfig()), audit_log=audit)
+
+    assert await service.send(user_id="user1", notification_type="news", message="One") is True
+    assert await service.send_many(["user1", "user2"], "news", "Two") == {
+        "user1": SendOutcome.RATE_LIMITED,
+        "user2": SendOutcome.SENT,
+    }
+
+    assert [n.user_id for n in working.sent_notifications] == ["user1", "user2"]
+    sent = [c for c in audit.record.call_args_list if c.args[2] == "sent"]
+    assert [c.kwargs["error"] for c in sent] == ["partial delivery, failed channels: email"] * 2
+
+
+@pytest.mark.asyncio
+async def test_no_channel_delivering_raises_and_refunds():
+    registry = GatewayRegistry(channels={"email": FlakyGateway(False)}, default_channels=["email"])
+    service = NotificationService(registry, rate_limiter=LocalRateLimiter(RateLimitConfig()))
+
+    with pytest.raises(DeliveryFailedError):
+        await service.send(user_id="user1", notification_type="news", message="One")
+    assert await service.send(user_id="user1", notification_type="news", message="One") is True
@@ -0,0 +1,173 @@
+"""Tests for user preferences and opt-outs."""
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+
+from app.adapters.redis_client import RedisClient
+from app.config import settings
+from app.core.gateway import MockGateway
+from app.core.notification_rules import RateLimitConfig
+from app.core.notification_service import NotificationService, SendOutcome
+from app.core.preferences import EVERYTHING, PreferenceListener, Preferences, PreferenceStore
+from app.core.rate_limiter import LocalRateLimiter
+
+
+def test_preferences_from_hash():
+    preferences = Preferences.from_hash({"news": "0", "status": "1"})
+
+    assert not preferences.allows("news")
+    assert preferences.allows("status") and preferences.allows("marketing")
+    assert not Preferences.from_hash({"*": "0", "status": "1"}).allows("status")
+    assert EVERYTHING.allows("news")
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    yield client
+    await client.close()
+
+
+@pytest_asyncio.fixture
+async def namespace(redis_client):
+    prefix = f"test-prefs-{uuid.uuid4().hex}"
+    yield prefix
+    _, keys = await redis_client.scan(match=f"{prefix}:*", count=1000)
+    for key in keys:
+        await redis_client.delete(key)
+
+
+def _store(redis_client, namespace, **kwargs):
+    return PreferenceStore(redis_client, key_prefix=namespace, channel=f"{namespace}:invalidate", **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_store_caches_lookups_and_batches_misses(redis_client, namespace):
+    store = _store(redis_client, namespace)
+    await redis_client.hset(store.key("u1"), {"news": "0"})
+
+    first = await store.get_many(["u1", "u2", "u1"])
+    second = await store.get_many(["u1", "u2"])
+
+    assert first == second == {"u1": Preferences(disabled_types=frozenset({"news"})), "u2": EVERYTHING}
+    assert (store.misses, store.hits) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_a_read_keeps_the_stale_value_out_of_the_cache(redis_client, namespace):
+    store = _store(redis_client, namespace)
+    hgetall = redis_client.hgetall
+
+    async def invalidated_mid_read(key):
+        fields = await hgetall(key)
+        await redis_client.hset(key, {"news": "0"})
+        store.invalidate("u1")
+        return fields
+
+    store.redis_client = MagicMock(hgetall=invalidated_mid_read)
+    assert await store.get_many(["u1"]) == {"u1": EVERYTHING}
+
+    store.redis_client = redis_client
+    assert not await store.allows("u1", "news")
+    assert store.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_tenant_stores_keep_separate_keys_and_invalidations(redis_client, namespace):
+    default = _store(redis_client, namespace)
+    shop = _store(redis_client, namespace, tenant_id="shop")
+    listener = PreferenceListener(redis_client, [default, shop])
+
+    await shop.update("u1", {"news": False})
+    assert await default.allows("u1", "news")
+    assert shop.key("u1") == f"{{shop}}:{namespace}:u1"
+    assert listener.channels == sorted([f"{namespace}:invalidate", f"{{shop}}:{namespace}:invalidate"])
+
+    listener._handle("u1", shop.channel)
+    assert (await default.get_many(["u1"])) and default.misses == 1
+    await redis_client.delete(shop.key("u1"))
+
+
+@pytest.mark.asyncio
+async def test_update_invalidates_other_instances(redis_client, namespace):
+    writer = _store(redis_client, namespace)
+    reader = _store(redis_client, namespace)
+    listener = PreferenceListener(
+        RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT),
+        [reader],
+    )
+    stop = asyncio.Event()
+    task = asyncio.create_task(listener.run(stop))
+    try:
+        raw = await redis_client._get_client()
+        for _ in range(100):
+            if (await raw.pubsub_numsub(reader.channel))[0][1]:
+                break
+            await asyncio.sleep(0.01)
+        # The listener clears the cache right after subscribing.
+        await asyncio.sleep(0.05)
+        assert await reader.allows("u1", "news")
+        assert await reader.allows("u1", "news")
+        assert reader.misses == 1
+
+        updated = await writer.update("u1", {"news": False})
+        assert updated.disabled_types == {"news"}
+        for _ in range(50):
+            if not await reader.allows("u1", "news"):
+                break
+            await asyncio.sleep(0.02)
+        assert not await reader.allows("u1", "news")
+        assert reader.misses == 2
+    finally:
+        stop.set()
+        await task
+        await listener.close()
+
+
+@pytest.mark.asyncio
+async def test_service_skips_opted_out_users_before_the_limiter():
+    store = MagicMock(spec=PreferenceStore)
+    store.get_many = AsyncMock(side_effect=lambda user_ids: {
+        user_id: Preferences(opted_out=user_id == "quiet") for user_id in user_ids
+    })
+    limiter = LocalRateLimiter(RateLimitConfig())
+    limiter.hit_many = AsyncMock(wraps=limiter.hit_many)
+    gateway = MockGateway()
+    service = NotificationService(gateway, rate_limiter=limiter, preferences=store)
+
+    assert await service.send("quiet", "news", "hi") is False
+    outcomes = await service.send_many(["quiet", "loud"], "news", "hi")
+
+    assert outcomes == {"quiet": SendOutcome.OPTED_OUT, "loud": SendOutcome.SENT}
+    limiter.hit_many.assert_awaited_once_with(["loud"], "news")
+    assert [n.user_id for n in gateway.sent_notifications] == ["loud"]
+
+
+@pytest.mark.asyncio
+async def test_service_sends_when_preferences_are_unavailable():
+    store = MagicMock(spec=PreferenceStore)
+    store.get_many = AsyncMock(side_effect=ConnectionError("redis down"))
+    service = NotificationService(MockGateway(), preferences=store)
+
+    assert await service.send("u1", "news", "hi") is True
+
+
+def test_preferences_endpoints(client, monkeypatch):
+    """PUT changes preferences through the store; 'all' maps to the global opt-out."""
+    import app.main as main
+
+    store = MagicMock(spec=PreferenceStore)
+    store.update = AsyncMock(return_value=Preferences(opted_out=True, disabled_types=frozenset({"news"})))
+    store.get = AsyncMock(return_value=EVERYTHING)
+    monkeypatch.setattr(main, "preference_api_stores", {None: store})
+
+    response = client.put("/users/u1/preferences", json={"types": {"news": False}, "all": False})
+
+    assert response.status_code == 200
+    assert response.json() == {"user_id": "u1", "opted_out": True, "disabled_types": ["news"]}
+    store.update.assert_awaited_once_with("u1", {"news": False, "*": False})
+    assert client.get("/users/u2/preferences").json()["disabled_types"] == []
+    assert client.put("/users/u1/preferences", json={"types": {"*": False}}).status_code == 400
@@ -0,0 +1,99 @@
+"""Tests for adaptive prefetch tuning."""
+import pytest
+
+from app.core.prefetch import PrefetchTuner
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def _interval(tuner, clock, inflight, completed, latency=0.1):
+    """Simulate one tuning interval with a steady in-flight count."""
+    tuner.observe(inflight, clock.now)
+    for _ in range(completed):
+        tuner.record(latency)
+    clock.now += tuner.interval_seconds
+    return tuner.adjust()
+
+
+def _saturated_interval(tuner, clock, capacity, latency=0.1):
+    """A consumer whose gateway handles at most `capacity` sends at once."""
+    completed = int(min(tuner.prefetch, capacity) / latency * tuner.interval_seconds)
+    return _interval(tuner, clock, tuner.prefetch, completed, latency)
+
+
+def test_tuner_grows_prefetch_until_throughput_stops_improving():
+    """Prefetch should settle at the gateway's concurrency, not the maximum."""
+    clock = FakeClock()
+    tuner = PrefetchTuner(min_prefetch=1, max_prefetch=64, interval_seconds=1.0, clock=clock)
+    
+    history = [tuner.prefetch]
+    for _ in range(8):
+        _saturated_interval(tuner, clock, capacity=8)
+        history.append(tuner.prefetch)
+    
+    assert history[:6] == [1, 2, 4, 8, 16, 8]
+    assert set(history[6:]) == {8}
+
+
+def test_tuner_probes_again_after_hold():
+    """Once the hold expires, more capacity should be discovered."""
+    clock = FakeClock()
+    tuner = PrefetchTuner(interval_seconds=1.0, hold_intervals=2, clock=clock)
+    for _ in range(5):
+        _saturated_interval(tuner, clock, capacity=8)
+    assert tuner.prefetch == 8
+    
+    for _ in range(5):
+        _saturated_interval(tuner, clock, capacity=32)
+    
+    assert tuner.prefetch == 32
+
+
+def test_tuner_shrinks_when_messages_arrive_slower_than_processed():
+    """Mostly idle in-flight slots should be released to other consumers."""
+    clock = FakeClock()
+    tuner = PrefetchTuner(min_prefetch=2, initial_prefetch=32, interval_seconds=1.0, clock=clock)
+    
+    assert _interval(tuner, clock, inflight=3, completed=30) == 16
+    assert _interval(tuner, clock, inflight=3, completed=30) == 8
+    assert _interval(tuner, clock, inflight=3, completed=30) == 4
+    assert _interval(tuner, clock, inflight=3, completed=30) is None
+    assert tuner.prefetch == 4
+
+
+def test_tuner_respects_bounds_and_interval():
+    """Nothing changes before the interval elapses or beyond the bounds."""
+    clock = FakeClock()
+    tuner = PrefetchTuner(min_prefetch=2, max_prefetch=4, initial_prefetch=4, interval_seconds=1.0, clock=clock)
+    
+    tuner.observe(4)
+    clock.now = 0.5
+    assert tuner.adjust() is None
+    
+    assert _saturated_interval(tuner, clock, capacity=100) is None
+    assert tuner.prefetch == 4
+    for _ in range(3):
+        _interval(tuner, clock, inflight=0, completed=0)
+    assert tuner.prefetch == 2
+
+
+def test_tuner_tracks_smoothed_latency():
+    """Latency is averaged per interval and smoothed across intervals."""
+    clock = FakeClock()
+    tuner = PrefetchTuner(interval_seconds=1.0, clock=clock)
+    
+    _interval(tuner, clock, inflight=1, completed=10, latency=0.1)
+    assert tuner.latency_seconds == pytest.approx(0.1)
+    _interval(tuner, clock, inflight=1, completed=10, latency=0.2)
+    assert tuner.latency_seconds == pytest.approx(0.13)
+
+
+def test_tuner_rejects_invalid_bounds():
+    with pytest.raises(ValueError):
+        PrefetchTuner(min_prefetch=8, max_prefetch=4)
@@ -0,0 +1,95 @@
+"""Tests for quota introspection."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.core.notification_rules import RateLimitConfig
+from app.core.quota import QuotaService
+from app.core.rate_limiter import RedisRateLimiter, window_start
+from app.main import app, get_quota_service
+
+NOW = 1_700_000_000.0
+
+
+def _service(usages):
+    limiter = RedisRateLimiter(MagicMock(), RateLimitConfig())
+    limiter.usage_many = AsyncMock(return_value=usages)
+    return QuotaService(limiter, cache_ttl_seconds=60), limiter
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    """Entries should expire after the TTL and the oldest be evicted when full."""
+    now = [0.0]
+    cache = TTLCache(ttl_seconds=10, max_entries=2, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    
+    now[0] = 11.0
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_quota_reports_every_configured_type():
+    """Quotas should cover all rule types, counting only the current window."""
+    status_start = window_start(NOW, 60)
+    service, _ = _service({
+        "u1": {
+            "status": (status_start, 1),
+            "marketing": (window_start(NOW, 3600) - 3600, 3),
+        }
+    })
+    
+    quotas = (await service.get_quotas(["u1"], now=NOW))["u1"]
+    
+    assert set(quotas) == {"status", "news", "marketing"}
+    assert quotas["status"].remaining == 1
+    assert quotas["status"].reset_at == status_start + 60
+    # A counter from a previous window no longer applies.
+    assert quotas["marketing"].remaining == 3
+    assert quotas["news"].remaining == 1
+
+
+@pytest.mark.asyncio
+async def test_quota_serves_repeat_lookups_from_cache():
+    """Only users missing from the cache should be read from Redis."""
+    service, limiter = _service({"u1": {}, "u2": {}})
+    
+    await service.get_quotas(["u1"], now=NOW)
+    limiter.usage_many.return_value = {"u2": {}}
+    await service.get_quotas(["u1", "u2"], now=NOW)
+    
+    assert limiter.usage_many.await_args_list[1].args == (["u2"],)
+
+
+def test_quota_endpoints(client):
+    """Single and batch endpoints should serialize quotas per user."""
+    service, _ = _service({"u1": {}, "u2": {}})
+    app.dependency_overrides[get_quota_service] = lambda: service
+    try:
+        single = client.get("/users/u1/quota")
+        batch = client.post("/users/quota", json={"user_ids": ["u1", "u2"]})
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert single.status_code == 200
+    assert single.json()["quotas"]["status"]["limit"] == 2
+    assert [u["user_id"] for u in batch.json()["users"]] == ["u1", "u2"]
+
+
+def test_quota_endpoint_reports_unavailable_store(client):
+    """A Redis failure should surface as 503 rather than a stack trace."""
+    service, limiter = _service({})
+    limiter.usage_many.side_effect = ConnectionError("down")
+    app.dependency_overrides[get_quota_service] = lambda: service
+    try:
+        response = client.get("/users/u1/quota")
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 503
@@ -4,9 +4,11 @@ import json
 import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 from app.adapters.rabbitmq_client import RabbitMQClient
+from app.core import codec
 from app.core.consumer import NotificationConsumer
 from app.core.notification_service import NotificationService
 from app.core.gateway import MockGateway
+from app.core.prefetch import PrefetchTuner
 
 
 @pytest.mark.asyncio
@@ -120,3 +122,277 @@ async def test_consumer_handles_missing_fields():
     except (KeyError, ValueError, TypeError):
         pass
 
+
+
+def _handle(consumer, channel, method, properties, body):
+    """Deliver a message and run the consumer until it has been settled."""
+    consumer._on_message(channel, method, properties, body)
+    while consumer._inflight:
+        consumer._settle_completed(timeout=None)
+
+
+def _delivery(headers=None):
+    method = MagicMock()
+    method.delivery_tag = 7
+    properties = MagicMock()
+    properties.headers = headers
+    properties.content_type = "application/json"
+    properties.content_encoding = None
+    properties.message_id = None
+    return method, properties
+
+
+def test_consumer_routes_transient_failure_to_retry_queue():
+    """A transient failure should be republished to the first backoff tier and acked."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(side_effect=ConnectionError("gateway down"))
+    consumer = NotificationConsumer(service=service, retry_delays_seconds=(5, 30))
+    channel = MagicMock()
+    method, properties = _delivery()
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    
+    _handle(consumer, channel, method, properties, body)
+    
+    publish = channel.basic_publish.call_args.kwargs
+    assert publish["routing_key"] == "notifications.retry.5s"
+    assert publish["properties"].headers["x-retry-count"] == 1
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    channel.basic_nack.assert_not_called()
+
+
+def test_consumer_backs_off_through_retry_tiers():
+    """Later retries should use later tiers, repeating the last one."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(side_effect=ConnectionError("gateway down"))
+    consumer = NotificationConsumer(
+        service=service, retry_delays_seconds=(5, 30), max_retries=5
+    )
+    channel = MagicMock()
+    method, properties = _delivery(headers={"x-retry-count": 3})
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    
+    _handle(consumer, channel, method, properties, body)
+    
+    publish = channel.basic_publish.call_args.kwargs
+    assert publish["routing_key"] == "notifications.retry.30s"
+    assert publish["properties"].headers["x-retry-count"] == 4
+
+
+def test_consumer_dead_letters_after_max_retries():
+    """Once retries are exhausted the message should land in the dead-letter queue."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(side_effect=ConnectionError("gateway down"))
+    consumer = NotificationConsumer(service=service, max_retries=2)
+    channel = MagicMock()
+    method, properties = _delivery(headers={"x-retry-count": 2})
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    
+    _handle(consumer, channel, method, properties, body)
+    
+    assert channel.basic_publish.call_args.kwargs["routing_key"] == "notifications.dead"
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_consumer_dead_letters_malformed_message_immediately():
+    """Malformed messages are permanent failures and should skip the retry tiers."""
+    service = NotificationService(MockGateway())
+    consumer = NotificationConsumer(service=service)
+    channel = MagicMock()
+    method, properties = _delivery()
+    
+    _handle(consumer, channel, method, properties, b"not valid json {")
+    
+    assert channel.basic_publish.call_args.kwargs["routing_key"] == "notifications.dead"
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_consumer_decodes_compressed_msgpack_bodies():
+    """content_type and content_encoding select how the body is decoded."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(return_value=True)
+    consumer = NotificationConsumer(service=service)
+    channel = MagicMock()
+    method, properties = _delivery()
+    body, properties.content_type, properties.content_encoding = codec.encode(
+        {"user_id": "u1", "type": "news", "message": "hi" * 1000},
+        codec.MSGPACK,
+        codec.ZSTD
+    )
+    
+    _handle(consumer, channel, method, properties, body)
+    
+    service.send.assert_called_once_with(user_id="u1", notification_type="news", message="hi" * 1000)
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_consumer_dead_letters_undecodable_body():
+    """A body that does not match its content_encoding cannot succeed on retry."""
+    service = NotificationService(MockGateway())
+    consumer = NotificationConsumer(service=service)
+    channel = MagicMock()
+    method, properties = _delivery()
+    properties.content_encoding = "zstd"
+    
+    _handle(consumer, channel, method, properties, b'{"user_id": "u1"}')
+    
+    publish = channel.basic_publish.call_args.kwargs
+    assert publish["routing_key"] == "notifications.dead"
+    assert publish["properties"].content_encoding == "zstd"
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_consumer_requeues_when_retry_publish_fails():
+    """If the message cannot be parked it should be requeued instead of dropped."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(side_effect=ConnectionError("gateway down"))
+    consumer = NotificationConsumer(service=service)
+    channel = MagicMock()
+    channel.basic_publish.side_effect = RuntimeError("channel closed")
+    method, properties = _delivery()
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    
+    _handle(consumer, channel, method, properties, body)
+    
+    channel.basic_nack.assert_called_once_with(delivery_tag=7, requeue=True)
+    channel.basic_ack.assert_not_called()
+
+
+def test_consumer_declares_retry_and_dead_letter_queues():
+    """Topology should include TTL retry queues that dead-letter to the main exchange."""
+    consumer = NotificationConsumer(
+        service=NotificationService(MockGateway()), retry_delays_seconds=(5, 30)
+    )
+    client = MagicMock()
+    
+    consumer._declare_topology(client)
+    
+    declared = {c.args[0]: c.kwargs.get("arguments") for c in client.declare_queue.call_args_list}
+    assert declared["notifications.retry.5s"] == {
+        "x-message-ttl": 5000,
+        "x-dead-letter-exchange": "notifications",
+        "x-dead-letter-routing-key": "notification.send",
+    }
+    assert declared["notifications.retry.30s"]["x-message-ttl"] == 30000
+    assert "notifications.dead" in declared
+
+
+def test_consumer_requeues_deliveries_after_stop_requested():
+    """Once stopping, new deliveries should be handed back without processing."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(return_value=True)
+    consumer = NotificationConsumer(service=service)
+    channel = MagicMock()
+    method, properties = _delivery()
+    
+    consumer.stop_consuming()
+    consumer._on_message(channel, method, properties, b"{}")
+    
+    channel.basic_nack.assert_called_once_with(delivery_tag=7, requeue=True)
+    service.send.assert_not_called()
+
+
+def _draining_consumer(send, drain_timeout_seconds):
+    service = NotificationService(MockGateway())
+    service.send = send
+    rabbitmq_client = MagicMock()
+    consumer = NotificationConsumer(
+        service=service,
+        rabbitmq_client=rabbitmq_client,
+        drain_timeout_seconds=drain_timeout_seconds
+    )
+    consumer._channel = MagicMock()
+    consumer._connection = MagicMock()
+    consumer._consumer_tag = "ctag"
+    return consumer, rabbitmq_client
+
+
+def test_consumer_drain_finishes_inflight_work_before_closing():
+    """Drain should cancel the consumer, let in-flight sends finish, ack and close."""
+    async def slow_send(**kwargs):
+        await asyncio.sleep(0.05)
+        return True
+    
+    consumer, rabbitmq_client = _draining_consumer(slow_send, drain_timeout_seconds=5)
+    channel = MagicMock()
+    method, properties = _delivery()
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    consumer._on_message(channel, method, properties, body)
+    
+    consumer._drain()
+    
+    consumer._channel.basic_cancel.assert_called_once_with("ctag")
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    rabbitmq_client.close.assert_called_once()
+    assert consumer.last_drain_seconds is not None
+
+
+def test_consumer_drain_requeues_work_past_the_deadline():
+    """Sends still running at the deadline should be cancelled and requeued."""
+    async def stuck_send(**kwargs):
+        await asyncio.sleep(60)
+    
+    consumer, rabbitmq_client = _draining_consumer(stuck_send, drain_timeout_seconds=0.05)
+    channel = MagicMock()
+    method, properties = _delivery()
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    consumer._on_message(channel, method, properties, body)
+    
+    consumer._drain()
+    
+    channel.basic_nack.assert_called_once_with(delivery_tag=7, requeue=True)
+    channel.basic_ack.assert_not_called()
+    assert consumer._inflight == {}
+    rabbitmq_client.close.assert_called_once()
+
+
+def test_consumer_loop_processes_deliveries_until_stopped():
+    """The consume loop should dispatch deliveries, ack them, and drain on stop."""
+    service = NotificationService(MockGateway())
+    service.send = AsyncMock(return_value=True)
+    rabbitmq_client = MagicMock()
+    consumer = NotificationConsumer(service=service, rabbitmq_client=rabbitmq_client)
+    channel = rabbitmq_client.get_channel.return_value
+    method, properties = _delivery()
+    body = json.dumps({"user_id": "u1", "type": "news", "message": "hi"}).encode()
+    polls = []
+    
+    def process_data_events(time_limit):
+        polls.append(time_limit)
+        if len(polls) == 1:
+            consumer._on_message(channel, method, properties, body)
+        elif not consumer._inflight:
+            consumer.stop_consuming()
+    
+    rabbitmq_client._connection.process_data_events.side_effect = process_data_events
+    
+    consumer.start_consuming()
+    
+    service.send.assert_awaited_once()
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    channel.basic_cancel.assert_called_once()
+    rabbitmq_client.close.assert_called_once()
+
+
+def test_consumer_applies_tuned_prefetch_on_its_channel():
+    """Adaptive mode should re-issue basic_qos with the tuner's prefetch."""
+    service = NotificationService(MockGateway())
+    rabbitmq_client = MagicMock()
+    ticks = iter(range(100))
+    tuner = PrefetchTuner(initial_prefetch=4, interval_seconds=1.0, clock=lambda: next(ticks))
+    consumer = NotificationConsumer(service=service, rabbitmq_client=rabbitmq_client, prefetch_tuner=tuner)
+    channel = rabbitmq_client.get_channel.return_value
+    
+    def process_data_events(time_limit):
+        if channel.basic_qos.call_count == 2:
+            consumer.stop_consuming()
+    
+    rabbitmq_client._connection.process_data_events.side_effect = process_data_events
+    
+    consumer.start_consuming()
+    
+    # Nothing was in flight, so the idle consumer gives half its prefetch back.
+    assert [c.kwargs for c in channel.basic_qos.call_args_list][:2] == [
+        {"prefetch_count": 4},
+        {"prefetch_count": 2},
+    ]
+    assert consumer.prefetch_count == tuner.prefetch
@@ -0,0 +1,154 @@
+"""Tests for AIMD send-rate control."""
+import pytest
+
+from app.core.gateway import Gateway, GatewayThrottledError, MockGateway, Notification
+from app.core.notification_service import NotificationService, SendOutcome
+from app.core.rate_control import AIMDController, PacedGateway
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+    
+    def __call__(self):
+        return self.now
+    
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ThrottlingGateway(Gateway):
+    """Accepts `capacity` sends, then throttles every send after that."""
+    
+    def __init__(self, capacity, retry_after=None):
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.sent = 0
+    
+    async def send(self, notification):
+        if self.sent >= self.capacity:
+            raise GatewayThrottledError(retry_after=self.retry_after)
+        self.sent += 1
+        return True
+
+
+def _notification(user_id="u1"):
+    return Notification(user_id=user_id, notification_type="news", message="hi")
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.mark.asyncio
+async def test_controller_spaces_sends_at_its_rate(clock):
+    """Consecutive acquires should be 1/rate apart."""
+    controller = AIMDController(initial_rate=4, clock=clock, sleep=clock.sleep)
+    
+    starts = [await controller.acquire() for _ in range(3)]
+    
+    assert starts == [0.0, 0.25, 0.5]
+
+
+def test_controller_increases_additively_and_decreases_multiplicatively(clock):
+    controller = AIMDController(initial_rate=10, increase=1.0, decrease_factor=0.5, clock=clock)
+    
+    for _ in range(10):
+        controller.on_success()
+    assert controller.rate == pytest.approx(11, rel=0.01)
+    
+    controller.on_throttle(started_at=clock.now)
+    assert controller.rate == pytest.approx(5.5, rel=0.01)
+
+
+def test_controller_cuts_once_per_congestion_event(clock):
+    """Sends already in flight when the rate was cut should not cut it again."""
+    controller = AIMDController(initial_rate=16, clock=clock)
+    clock.now = 10.0
+    
+    controller.on_throttle(started_at=9.9)
+    controller.on_throttle(started_at=9.95)
+    assert controller.rate == 8
+    
+    clock.now = 11.0
+    controller.on_throttle(started_at=10.5)
+    assert controller.rate == 4
+    assert controller.throttles == 3
+
+
+def test_controller_stays_within_bounds(clock):
+    controller = AIMDController(initial_rate=2, min_rate=1, max_rate=2.5, clock=clock)
+    
+    for _ in range(100):
+        controller.on_success()
+    assert controller.rate == 2.5
+    
+    for i in range(5):
+        clock.now = i
+        controller.on_throttle(started_at=clock.now)
+    assert controller.rate == 1
+
+
+@pytest.mark.asyncio
+async def test_controller_honours_retry_after(clock):
+    """A provider's Retry-After should hold back the next send."""
+    controller = AIMDController(initial_rate=100, clock=clock, sleep=clock.sleep)
+    
+    controller.on_throttle(started_at=0.0, retry_after=3.0)
+    
+    assert await controller.acquire() == 3.0
+
+
+@pytest.mark.asyncio
+async def test_paced_gateway_feeds_controller_and_reraises_throttles(clock):
+    """Throttles lower the rate and still reach the caller as errors."""
+    controller = AIMDController(initial_rate=10, clock=clock, sleep=clock.sleep)
+    gateway = PacedGateway(ThrottlingGateway(capacity=1), controller)
+    
+    assert await gateway.send(_notification()) is True
+    assert controller.rate > 10
+    
+    with pytest.raises(GatewayThrottledError):
+        await gateway.send(_notification())
+    assert controller.rate < 10
+
+
+@pytest.mark.asyncio
+async def test_paced_gateway_converges_below_provider_capacity(clock):
+    """Against a provider allowing 20 sends/s, the rate should hover around 20/s."""
+    provider = MockGateway()
+    window_sends = {}
+    
+    class RateLimitedProvider(Gateway):
+        async def send(self, notification):
+            window = int(clock.now)
+            if window_sends.get(window, 0) >= 20:
+                raise GatewayThrottledError()
+            window_sends[window] = window_sends.get(window, 0) + 1
+            return await provider.send(notification)
+    
+    controller = AIMDController(initial_rate=5, increase=5, clock=clock, sleep=clock.sleep)
+    gateway = PacedGateway(RateLimitedProvider(), controller)
+    
+    while clock.now < 60:
+        try:
+            await gateway.send(_notification())
+        except GatewayThrottledError:
+            pass
+    
+    sent_last_30s = sum(count for window, count in window_sends.items() if window >= 30)
+    assert 10 * 30 <= sent_last_30s <= 20 * 30
+    assert controller.throttles < 60
+
+
+@pytest.mark.asyncio
+async def test_send_many_reports_throttled_sends(clock):
+    """Throttled sends should be distinguishable from failed ones."""
+    service = NotificationService(ThrottlingGateway(capacity=1))
+    
+    outcomes = await service.send_many(["u1", "u2"], "news", "hi")
+    
+    assert sorted(outcomes.values()) == [SendOutcome.SENT, SendOutcome.THROTTLED]
@@ -156,3 +156,17 @@ def test_rate_limit_config_add_rule_prevents_accidental_overwrite():
     
     with pytest.raises(ValueError, match="already exists"):
         config.add_rule(duplicate_rule)  # overwrite defaults to False
+
+
+def test_rate_limit_rule_on_limit_behavior():
+    """Rules default to rejecting and only accept known over-limit behaviors."""
+    rule = RateLimitRule(type="marketing", max_count=3, time_window_seconds=3600)
+    assert rule.on_limit == "reject"
+    
+    digest_rule = RateLimitRule(
+        type="marketing", max_count=3, time_window_seconds=3600, on_limit="digest"
+    )
+    assert digest_rule.on_limit == "digest"
+    
+    with pytest.raises(ValueError):
+        RateLimitRule(type="marketing", max_count=3, time_window_seconds=3600, on_limit="queue")
@@ -0,0 +1,242 @@
+"""Tests for the rate limiters and Redis failover."""
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.adapters.redis_client import RedisClient, script_sha
+from app.config import settings
+from app.core.notification_rules import RateLimitConfig
+from app.core.rate_limiter import (
+    FailoverRateLimiter,
+    LocalRateLimiter,
+    RedisRateLimiter,
+    window_start,
+)
+
+NOW = 1_700_000_000.0
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_window_start_is_aligned_to_the_epoch():
+    """Windows should start on multiples of their length."""
+    assert window_start(125.7, 60) == 120
+    assert window_start(120, 60) == 120
+
+
+@pytest.mark.asyncio
+async def test_local_limiter_enforces_per_instance_share():
+    """Each instance should allow its rounded-up share of the rule's budget."""
+    limiter = LocalRateLimiter(RateLimitConfig(), instance_count=2)
+    
+    # marketing: 3 per hour -> ceil(3 / 2) = 2 per instance
+    results = [await limiter.hit("u1", "marketing", now=NOW) for _ in range(3)]
+    
+    assert [r.allowed for r in results] == [True, True, False]
+    assert results[1].remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_local_limiter_resets_in_next_window():
+    """Budget should be restored once the window rolls over."""
+    limiter = LocalRateLimiter(RateLimitConfig())
+    
+    assert (await limiter.hit("u1", "news", now=NOW)).allowed is True
+    assert (await limiter.hit("u1", "news", now=NOW)).allowed is False
+    assert (await limiter.hit("u1", "news", now=NOW + 86400)).allowed is True
+
+
+@pytest.mark.asyncio
+async def test_limiters_do_not_limit_types_without_rules():
+    """Types without a rule should always be allowed."""
+    limiter = LocalRateLimiter(RateLimitConfig())
+    
+    decision = await limiter.hit("u1", "unknown", now=NOW)
+    
+    assert decision.allowed is True
+    assert decision.remaining is None
+
+
+@pytest.mark.asyncio
+async def test_redis_limiter_keeps_all_types_in_one_user_hash():
+    """Every type should be counted in the same per-user hash, keyed by field."""
+    redis_client = MagicMock()
+    redis_client.eval_script = AsyncMock(return_value=[1, 1])
+    limiter = RedisRateLimiter(redis_client, RateLimitConfig())
+    
+    decision = await limiter.hit("u1", "status", now=NOW)
+    await limiter.hit("u1", "news", now=NOW)
+    
+    status_call, news_call = redis_client.eval_script.call_args_list
+    start = window_start(NOW, 60)
+    assert status_call.kwargs["keys"] == ["ratelimit:u1"]
+    assert news_call.kwargs["keys"] == ["ratelimit:u1"]
+    # field, window start, limit, TTL of the longest window (news: 1 day)
+    assert status_call.kwargs["args"] == ["status", start, 2, 86400]
+    assert decision.allowed is True
+    assert decision.remaining == 1
+    assert decision.reset_at == start + 60
+
+
+@pytest.mark.asyncio
+async def test_redis_limiter_usage_unpacks_script_result():
+    """usage() should map each type to its stored window and count."""
+    redis_client = MagicMock()
+    redis_client.eval_script = AsyncMock(return_value=["status", 120, 2, "news", 0, 1])
+    limiter = RedisRateLimiter(redis_client, RateLimitConfig())
+    
+    usage = await limiter.usage("u1")
+    
+    assert usage == {"status": (120, 2), "news": (0, 1)}
+
+
+@pytest.mark.asyncio
+async def test_redis_limiter_reconciles_one_script_call_per_user():
+    """add_counts should group counters by user and skip closed windows."""
+    redis_client = MagicMock()
+    redis_client.eval_script_many = AsyncMock()
+    limiter = RedisRateLimiter(redis_client, RateLimitConfig())
+    status_start = window_start(NOW, 60)
+    news_start = window_start(NOW, 86400)
+    
+    await limiter.add_counts(
+        {
+            ("u1", "status", status_start): 1,
+            ("u1", "news", news_start): 1,
+            ("u2", "status", status_start - 60): 2,
+        },
+        now=NOW,
+    )
+    
+    redis_client.eval_script_many.assert_awaited_once()
+    script, calls = redis_client.eval_script_many.await_args.args
+    assert script == limiter._ADD_SCRIPT
+    assert calls == [(["ratelimit:u1"], [86400, "status", status_start, 1, "news", news_start, 1])]
+
+
+def _failover(primary_hit, clock):
+    config = RateLimitConfig()
+    primary = RedisRateLimiter(MagicMock(), config)
+    primary.hit = primary_hit
+    primary.ping = AsyncMock(return_value=True)
+    primary.add_counts = AsyncMock()
+    limiter = FailoverRateLimiter(
+        primary,
+        LocalRateLimiter(config),
+        latency_budget_seconds=0.01,
+        probe_interval_seconds=5.0,
+        clock=clock,
+    )
+    return limiter, primary
+
+
+@pytest.mark.asyncio
+async def test_failover_switches_to_local_limiter_on_redis_error():
+    """A Redis error should be absorbed and the local limiter take over."""
+    clock = FakeClock()
+    limiter, primary = _failover(AsyncMock(side_effect=ConnectionError("down")), clock)
+    
+    first = await limiter.hit("u1", "news", now=NOW)
+    second = await limiter.hit("u1", "news", now=NOW)
+    
+    assert limiter.degraded is True
+    assert first.allowed is True
+    assert second.allowed is False
+    # Only the first call reached Redis; the open circuit skips it afterwards.
+    assert primary.hit.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_failover_trips_when_redis_exceeds_latency_budget():
+    """A Redis call slower than the latency budget should open the circuit."""
+    async def slow_hit(*args, **kwargs):
+        await asyncio.sleep(1)
+    
+    limiter, _ = _failover(slow_hit, FakeClock())
+    
+    decision = await limiter.hit("u1", "status", now=NOW)
+    
+    assert limiter.degraded is True
+    assert decision.allowed is True
+
+
+@pytest.mark.asyncio
+async def test_failover_probes_and_reconciles_on_recovery():
+    """After the probe interval a healthy Redis should receive the local counts."""
+    clock = FakeClock()
+    limiter, primary = _failover(AsyncMock(side_effect=ConnectionError("down")), clock)
+    await limiter.hit("u1", "marketing", now=NOW)
+    await limiter.hit("u1", "marketing", now=NOW)
+    
+    primary.hit = AsyncMock(return_value=MagicMock(allowed=True))
+    clock.now = 10.0
+    await limiter.hit("u1", "marketing", now=NOW)
+    
+    assert limiter.degraded is False
+    start = window_start(NOW, 3600)
+    primary.add_counts.assert_awaited_once_with({("u1", "marketing", start): 2})
+    primary.hit.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failover_stays_degraded_when_probe_fails():
+    """A failed probe should keep the local limiter in charge and keep its counts."""
+    clock = FakeClock()
+    limiter, primary = _failover(AsyncMock(side_effect=ConnectionError("down")), clock)
+    await limiter.hit("u1", "news", now=NOW)
+    
+    primary.ping = AsyncMock(side_effect=ConnectionError("still down"))
+    clock.now = 10.0
+    decision = await limiter.hit("u1", "news", now=NOW)
+    
+    assert limiter.degraded is True
+    assert decision.allowed is False
+    primary.add_counts.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_refund_gives_back_a_send_in_the_same_window_only():
+    """Refunds should restore budget in the counted window and never below zero."""
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    redis_limiter = RedisRateLimiter(redis_client, RateLimitConfig(), key_prefix=f"test-{uuid.uuid4().hex}")
+    try:
+        for limiter in (LocalRateLimiter(RateLimitConfig()), redis_limiter):
+            decision = await limiter.hit("u1", "news", now=NOW)
+            assert (await limiter.hit("u1", "news", now=NOW)).allowed is False
+
+            await limiter.refund("u1", "news", decision.reset_at - 86400)
+            assert (await limiter.hit("u1", "news", now=NOW)).allowed is False
+            await limiter.refund_many(["u1", "u2"], "news", decision.reset_at)
+            await limiter.refund("u1", "news", decision.reset_at)
+            assert [(await limiter.hit("u1", "news", now=NOW)).allowed for _ in range(2)] == [True, False]
+    finally:
+        await redis_client.delete(redis_limiter.key("u1"))
+        await redis_client.close()
+
+
+
+@pytest.mark.asyncio
+async def test_batched_hits_reload_scripts_missing_from_the_server():
+    """Batches should send script SHAs and reload the source once on NOSCRIPT."""
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    limiter = RedisRateLimiter(redis_client, RateLimitConfig(), key_prefix=f"test-{uuid.uuid4().hex}")
+    try:
+        client = await redis_client._get_client()
+        await client.script_flush()
+
+        decisions = await limiter.hit_many(["u1", "u2", "u1"], "news", now=NOW)
+
+        assert [d.allowed for d in decisions] == [True, True, False]
+        assert (await client.script_exists(script_sha(limiter._HIT_SCRIPT))) == [True]
+    finally:
+        for user_id in ("u1", "u2"):
+            await redis_client.delete(limiter.key(user_id))
+        await redis_client.close()
@@ -0,0 +1,131 @@
+"""Tests for per-type channel routing."""
+import asyncio
+
+import pytest
+
+from app.core.gateway import DeliveryFailedError, Gateway, GatewayThrottledError, MockGateway, Notification
+from app.core.notification_rules import RateLimitConfig
+from app.core.notification_service import NotificationService
+from app.core.routing import GatewayRegistry
+
+
+class FailingGateway(Gateway):
+    def __init__(self, error):
+        self.error = error
+    
+    async def send(self, notification):
+        raise self.error
+
+
+class RejectingGateway(Gateway):
+    async def send(self, notification):
+        return False
+
+
+def _notification(notification_type="news"):
+    return Notification(user_id="u1", notification_type=notification_type, message="hi")
+
+
+@pytest.mark.asyncio
+async def test_registry_routes_each_type_to_its_channels():
+    push, email = MockGateway(), MockGateway()
+    registry = GatewayRegistry(
+        channels={"push": push, "email": email},
+        routes={"status": ["push"], "news": ["email", "push"]},
+        default_channels=["email"],
+    )
+    service = NotificationService(registry)
+    
+    await service.send("u1", "status", "s")
+    await service.send("u1", "news", "n")
+    await service.send("u1", "marketing", "m")
+    
+    assert [n.message for n in push.sent_notifications] == ["s", "n"]
+    assert [n.message for n in email.sent_notifications] == ["n", "m"]
+
+
+@pytest.mark.asyncio
+async def test_registry_dispatches_channels_concurrently():
+    """Each channel waits for the other, which only completes if both run at once."""
+    started = {"push": asyncio.Event(), "email": asyncio.Event()}
+    
+    class WaitingGateway(Gateway):
+        def __init__(self, name, other):
+            self.name, self.other = name, other
+        
+        async def send(self, notification):
+            started[self.name].set()
+            await asyncio.wait_for(started[self.other].wait(), timeout=1)
+            return True
+    
+    registry = GatewayRegistry(
+        channels={"push": WaitingGateway("push", "email"), "email": WaitingGateway("email", "push")},
+        routes={"news": ["push", "email"]},
+    )
+    
+    result = await registry.dispatch(_notification())
+    
+    assert result.sent
+    assert result.delivered == ("push", "email")
+
+
+@pytest.mark.asyncio
+async def test_registry_reports_partial_delivery_without_raising():
+    """Channels that delivered must not be retried, so a partial send counts as delivered."""
+    registry = GatewayRegistry(
+        channels={"push": MockGateway(), "email": FailingGateway(RuntimeError("smtp down"))},
+        routes={"news": ["push", "email"]},
+    )
+    
+    result = await registry.dispatch(_notification())
+    
+    assert not result.sent
+    assert result.delivered == ("push",)
+    assert [(r.channel, str(r.error)) for r in result.failed] == [("email", "smtp down")]
+    assert await registry.send(_notification()) is True
+    assert [r.channel for r in (await registry.deliver(_notification())).failed] == ["email"]
+
+
+@pytest.mark.asyncio
+async def test_registry_reraises_when_nothing_was_delivered():
+    """With no delivery, retrying is safe, so throttles surface to the caller."""
+    registry = GatewayRegistry(
+        channels={
+            "push": FailingGateway(RuntimeError("boom")),
+            "email": FailingGateway(GatewayThrottledError(retry_after=2)),
+        },
+        routes={"news": ["push", "email"]},
+    )
+    
+    with pytest.raises(GatewayThrottledError):
+        await registry.send(_notification())
+    quiet = GatewayRegistry(channels={"push": RejectingGateway()}, routes={"news": ["push"]})
+    with pytest.raises(DeliveryFailedError):
+        await quiet.send(_notification())
+
+
+def test_registry_rejects_unknown_channels_and_types():
+    with pytest.raises(ValueError, match="Unknown channel"):
+        GatewayRegistry(channels={"push": MockGateway()}, routes={"news": ["sms"]})
+    with pytest.raises(ValueError, match="unknown notification type"):
+        GatewayRegistry(
+            channels={"push": MockGateway()},
+            routes={"newz": ["push"]},
+            config=RateLimitConfig(),
+        )
+
+
+@pytest.mark.asyncio
+async def test_registry_without_route_or_default_raises():
+    registry = GatewayRegistry(channels={"push": MockGateway()}, routes={"status": ["push"]})
+    
+    with pytest.raises(ValueError, match="No channel"):
+        await registry.send(_notification("news"))
+
+
+def test_unimplemented_channels_cannot_be_configured(monkeypatch):
+    import app.main as main
+    
+    monkeypatch.setattr(main.settings, "DEFAULT_CHANNELS", ["email"])
+    with pytest.raises(ValueError, match="Unknown channel"):
+        main.build_gateway()
@@ -0,0 +1,132 @@
+"""Tests for the offline rate limit simulator."""
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.core.audit import SOURCE_DIGEST, AuditLog
+from app.core.notification_rules import RateLimitConfig, RateLimitRule
+from app.core.simulator import (
+    Trace,
+    compare,
+    parse_rule,
+    replay,
+    replay_reference,
+    synthetic_trace,
+    with_overrides,
+)
+from app.core.tenants import TenantRuleSets
+
+DAY = 86400
+START = 1_700_006_400  # aligned to a day
+
+
+def test_replay_allows_budget_per_window_and_ignores_denied_sends():
+    trace = Trace.from_events([
+        (START + 10, "u1", "status"),
+        (START + 20, "u1", "status"),
+        (START + 30, "u1", "status"),  # third in the minute: denied
+        (START + 70, "u1", "status"),  # next window
+        (START + 15, "u2", "status"),
+        (START + 5, "u1", "news"),
+        (START + DAY - 1, "u1", "news"),
+        (START + DAY, "u1", "news"),
+        (START + 1, "u1", "digest-free"),
+    ])
+
+    result = replay(trace, RateLimitConfig())
+
+    assert result.allowed.tolist() == [True, True, False, True, True, True, False, True, True]
+    status = result.reports["status"]
+    assert (status.events, status.allowed, status.denied) == (5, 4, 1)
+    assert status.users_limited == 1
+    assert status.peak_per_window == 3
+    assert result.reports["digest-free"].rule == "unlimited"
+
+
+def test_events_out_of_order_are_decided_in_time_order():
+    trace = Trace.from_events([
+        (START + 30, "u1", "news"),
+        (START + 10, "u1", "news"),
+    ])
+
+    assert replay(trace, RateLimitConfig()).allowed.tolist() == [False, True]
+
+
+def test_vectorized_replay_matches_local_rate_limiter():
+    trace = synthetic_trace(users=200, days=2, events_per_user_per_day=30, seed=7)
+    config = with_overrides(RateLimitConfig(), [parse_rule("marketing=4/600")])
+
+    reference = asyncio.run(replay_reference(trace, config))
+
+    assert np.array_equal(replay(trace, config).allowed, reference)
+
+
+def test_compare_reports_changed_decisions():
+    trace = Trace.from_events([(START + i, "u1", "news") for i in range(3)])
+    candidate = with_overrides(RateLimitConfig(), [parse_rule("news=2/86400s:digest")])
+
+    comparison = compare(trace, RateLimitConfig(), candidate)
+
+    assert comparison.newly_allowed == 1
+    assert comparison.newly_denied == 0
+    report = comparison.candidate.reports["news"]
+    assert report.rule == "2/86400s:digest"
+    assert report.digests == 1
+
+
+def test_parse_rule():
+    assert parse_rule("news=2/3600") == ("news", RateLimitRule("news", 2, 3600))
+    assert parse_rule("news=none") == ("news", None)
+    assert "news" not in with_overrides(RateLimitConfig(), [parse_rule("news=none")]).rules
+    with pytest.raises(ValueError):
+        parse_rule("news=2 per hour")
+    with pytest.raises(ValueError):
+        parse_rule("news=2/3600:bounce")
+
+
+def test_trace_sources_round_trip(tmp_path):
+    csv_path = tmp_path / "trace.csv"
+    csv_path.write_text(f"timestamp,user_id,type\n{START},u1,news\n{START + 1},u2,status\n")
+    trace = Trace.from_csv(csv_path)
+    assert list(trace.events()) == [(START, "u1", "news"), (START + 1, "u2", "status")]
+
+    trace.save(tmp_path / "trace.npz")
+    assert list(Trace.load(tmp_path / "trace.npz").events()) == list(trace.events())
+
+    audit = AuditLog(tmp_path / "audit", clock=lambda: float(START))
+    audit.record("u1", "news", "sent")
+    audit.record("u1", "news", "rate_limited")
+    audit.flush()
+    from_audit = Trace.from_audit_files(list((tmp_path / "audit").iterdir()))
+    assert replay(from_audit, RateLimitConfig()).allowed.tolist() == [True, False]
+
+
+def test_audit_replay_counts_requests_once_per_tenant(tmp_path):
+    audit = AuditLog(tmp_path, clock=lambda: float(START))
+    audit.record("u1", "news", "failed")  # retried below
+    audit.record("u1", "news", "sent")
+    audit.record("u1", "news", "opted_out")
+    audit.record("u1", "news", "sent", source=SOURCE_DIGEST)
+    audit.record("u1", "news", "sent", tenant_id="shop")
+    audit.record("u1", "news", "sent", tenant_id="shop")
+    audit.flush()
+    trace = Trace.from_audit_files(list(tmp_path.iterdir()))
+    assert list(trace.events()) == [
+        (START, "u1", "news", None),
+        (START, "u1", "news", "shop"),
+        (START, "u1", "news", "shop"),
+    ]
+
+    rule_sets = TenantRuleSets(
+        RateLimitConfig(), {"shop": {"news": {"max_count": 2, "time_window_seconds": DAY}}}
+    )
+    result = replay(trace, rule_sets)
+
+    assert result.allowed.tolist() == [True, True, True]
+    assert (result.reports["news"].users, result.reports["shop/news"].rule) == (1, "2/86400s")
+    assert np.array_equal(result.allowed, asyncio.run(replay_reference(trace, rule_sets)))
+    assert replay(trace, RateLimitConfig()).allowed.tolist() == [True, True, False]
+
+    trace.save(tmp_path / "trace.npz")
+    assert list(Trace.load(tmp_path / "trace.npz").events()) == list(trace.events())
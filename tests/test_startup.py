@@ -0,0 +1,97 @@
+"""Tests for startup warmup, readiness and timings."""
+import hashlib
+import subprocess
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.adapters.redis_client import RedisClient
+from app.config import settings
+from app.core.messages import MessageProcessor
+from app.core.notification_rules import RateLimitConfig
+from app.core.rate_limiter import FailoverRateLimiter, LocalRateLimiter, RedisRateLimiter
+from app.core.startup import StartupReport, wait_until
+
+
+def test_importing_the_app_skips_unused_adapters():
+    code = "import sys, app.main; print(sorted({'pika', 'httpx'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
+@pytest.mark.asyncio
+async def test_report_records_phases_and_failed_steps():
+    ticks = iter(range(0, 100, 2))
+    report = StartupReport(clock=lambda: next(ticks))
+
+    with report.phase("build"):
+        pass
+    ok = await report.warm("warmup.redis", AsyncMock(side_effect=ConnectionError("refused"))(), timeout=1)
+    timed_out = await report.warm("warmup.transport", wait_until(lambda: False), timeout=0.01)
+    report.mark_ready()
+
+    assert not ok and not timed_out
+    assert report.phases == {"build": 2, "warmup.redis": 2, "warmup.transport": 2}
+    assert report.failed == {"warmup.redis": "ConnectionError: refused", "warmup.transport": "TimeoutError"}
+    assert report.to_dict()["ready_after_ms"] == 14000
+
+
+@pytest.mark.asyncio
+async def test_processor_warmup_covers_tenants_and_survives_failures():
+    tenant = MessageProcessor(MagicMock(warmup=AsyncMock(side_effect=ConnectionError("down"))), tenant_id="shop")
+    processor = MessageProcessor(MagicMock(warmup=AsyncMock()), tenants={"shop": tenant})
+
+    assert await processor.warmup() is False
+    processor.service.warmup.assert_awaited_once()
+    tenant.service.warmup.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_limiter_warmup_loads_scripts():
+    redis_client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    limiter = RedisRateLimiter(redis_client, RateLimitConfig())
+    try:
+        await limiter.warmup()
+
+        scripts = [limiter._HIT_SCRIPT, limiter._ADD_SCRIPT, limiter._USAGE_SCRIPT]
+        shas = [hashlib.sha1(script.encode()).hexdigest() for script in scripts]
+        client = await redis_client._get_client()
+        assert await client.script_exists(*shas) == [True, True, True]
+    finally:
+        await redis_client.close()
+
+
+@pytest.mark.asyncio
+async def test_failover_warmup_starts_degraded_when_redis_is_down():
+    primary = MagicMock(config=RateLimitConfig(), warmup=AsyncMock(side_effect=ConnectionError("refused")))
+    limiter = FailoverRateLimiter(primary, LocalRateLimiter(RateLimitConfig()))
+
+    with pytest.raises(ConnectionError):
+        await limiter.warmup()
+    assert limiter.degraded
+
+
+def test_ready_endpoint_waits_for_warmup_and_transport(client, monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "startup", None)
+    assert client.get("/health/ready").status_code == 503
+
+    report = StartupReport()
+    report.record("import", 0.5)
+    transport = MagicMock()
+    transport.status.return_value = {"state": "starting"}
+    monkeypatch.setattr(main, "startup", report)
+    monkeypatch.setattr(main, "transport", transport)
+    assert client.get("/health/ready").status_code == 503
+
+    report.warmed_up = True
+    assert client.get("/health/ready").json()["status"] == "not_ready"
+
+    transport.status.return_value = {"state": "consuming"}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["phases_ms"] == {"import": 500.0}
+    assert response.json()["ready_after_ms"] is not None
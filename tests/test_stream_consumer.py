@@ -0,0 +1,159 @@
+"""Tests for the Redis Streams consumer."""
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.messages import MessageProcessor
+from app.core.stream_consumer import StreamConsumer
+
+
+def _entry(entry_id, user_id="u1", **payload):
+    body = json.dumps({"user_id": user_id, "type": "news", "message": "hi", **payload})
+    return entry_id, {"body": body}
+
+
+@pytest.fixture
+def redis_client():
+    client = MagicMock()
+    client.pipeline = AsyncMock(return_value=MagicMock(execute=AsyncMock()))
+    client.xgroup_create = AsyncMock(return_value=False)
+    client.xreadgroup = AsyncMock(return_value=[])
+    client.xautoclaim = AsyncMock(return_value=("0-0", []))
+    client.xpending_range = AsyncMock(return_value=[])
+    return client
+
+
+@pytest.fixture
+def service():
+    service = MagicMock()
+    service.send = AsyncMock(return_value=True)
+    service.warmup = AsyncMock()
+    return service
+
+
+def _consumer(service, redis_client, **kwargs):
+    return StreamConsumer(MessageProcessor(service), redis_client, consumer_name="c1", **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_batch_is_acked_in_one_pipelined_call(service, redis_client):
+    """Every processed entry should be acknowledged by a single XACK."""
+    consumer = _consumer(service, redis_client)
+    
+    acked = await consumer.process_batch([_entry("1-0", "u1"), _entry("1-1", "u2")], {})
+    
+    assert acked == 2
+    assert service.send.await_count == 2
+    pipe = redis_client.pipeline.return_value
+    pipe.xack.assert_called_once_with("notifications", "notification-service", "1-0", "1-1")
+    pipe.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_transient_failure_is_left_pending_for_retry(service, redis_client):
+    """A failed entry stays unacknowledged so XAUTOCLAIM can retry it later."""
+    service.send = AsyncMock(side_effect=[True, RuntimeError("gateway down")])
+    consumer = _consumer(service, redis_client)
+    
+    await consumer.process_batch([_entry("1-0", "u1"), _entry("1-1", "u2")], {})
+    
+    pipe = redis_client.pipeline.return_value
+    pipe.xack.assert_called_once_with("notifications", "notification-service", "1-0")
+    pipe.xadd.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_entry_is_dead_lettered_after_max_deliveries(service, redis_client):
+    service.send = AsyncMock(side_effect=RuntimeError("gateway down"))
+    consumer = _consumer(service, redis_client, max_deliveries=3)
+    
+    await consumer.process_batch([_entry("1-0")], {"1-0": 3})
+    
+    pipe = redis_client.pipeline.return_value
+    stream, fields = pipe.xadd.call_args.args
+    assert stream == "notifications.dead"
+    assert fields["source_id"] == "1-0"
+    assert fields["last_error"] == "RuntimeError: gateway down"
+    pipe.xack.assert_called_once_with("notifications", "notification-service", "1-0")
+
+
+@pytest.mark.asyncio
+async def test_malformed_entry_is_dead_lettered_immediately(service, redis_client):
+    consumer = _consumer(service, redis_client)
+    
+    await consumer.process_batch([("1-0", {"body": "not json"})], {})
+    
+    pipe = redis_client.pipeline.return_value
+    assert pipe.xadd.call_args.args[0] == "notifications.dead"
+    pipe.xack.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_claim_returns_stale_entries_with_delivery_counts(service, redis_client):
+    redis_client.xautoclaim = AsyncMock(return_value=("0-0", [_entry("1-0"), _entry("1-4")]))
+    redis_client.xpending_range = AsyncMock(return_value=[
+        {"message_id": "1-0", "times_delivered": 2},
+        {"message_id": "1-4", "times_delivered": 5},
+    ])
+    consumer = _consumer(service, redis_client, claim_idle_ms=30_000)
+    
+    entries, deliveries = await consumer.claim_stale()
+    
+    assert [entry_id for entry_id, _ in entries] == ["1-0", "1-4"]
+    assert deliveries == {"1-0": 2, "1-4": 5}
+    assert redis_client.xautoclaim.call_args.args == ("notifications", "notification-service", "c1", 30_000)
+    
+    # The scan finished, so the next claim waits for the interval.
+    assert await consumer.claim_stale() == ([], {})
+    assert redis_client.xautoclaim.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_trimmed_entries_are_acked_without_processing(service, redis_client):
+    """XAUTOCLAIM returns no fields for entries MAXLEN already removed."""
+    consumer = _consumer(service, redis_client)
+    
+    await consumer.process_batch([("1-0", None)], {"1-0": 2})
+    
+    service.send.assert_not_called()
+    redis_client.pipeline.return_value.xack.assert_called_once_with("notifications", "notification-service", "1-0")
+
+
+@pytest.mark.asyncio
+async def test_run_reads_batches_until_stopped(service, redis_client):
+    stop = asyncio.Event()
+    consumer = _consumer(service, redis_client, batch_size=50)
+    
+    async def read(*args, **kwargs):
+        if redis_client.xreadgroup.await_count > 1:
+            stop.set()
+            return []
+        return [_entry("1-0")]
+    
+    redis_client.xreadgroup = AsyncMock(side_effect=read)
+    
+    await consumer.run(stop)
+    
+    assert redis_client.xreadgroup.call_args.kwargs["count"] == 50
+    service.send.assert_awaited_once()
+    assert consumer.status()["state"] == "stopped"
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_going_after_redis_errors(service, redis_client):
+    stop = asyncio.Event()
+    consumer = _consumer(service, redis_client)
+    redis_client.xgroup_create = AsyncMock(side_effect=[ConnectionError("redis down"), True])
+    
+    async def read(*args, **kwargs):
+        stop.set()
+        return []
+    
+    redis_client.xreadgroup = AsyncMock(side_effect=read)
+    
+    await asyncio.wait_for(consumer.run(stop), timeout=5)
+    
+    assert consumer.restarts == 1
+    assert consumer.last_error == "ConnectionError: redis down"
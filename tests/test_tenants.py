@@ -0,0 +1,139 @@
+"""Tests for per-tenant rule sets and key isolation."""
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+
+from app.adapters.redis_client import RedisClient
+from app.config import settings
+from app.core.heavy_hitters import HeavyHitterTracker
+from app.core.messages import MessageProcessor
+from app.core.notification_rules import RateLimitConfig, RateLimitRule
+from app.core.rate_limiter import RedisRateLimiter
+from app.core.tenants import TenantRuleSets, tenant_key_prefix
+
+
+def test_tenant_rule_sets_apply_overrides_to_default_rules():
+    default = RateLimitConfig()
+    tenants = TenantRuleSets(default, {
+        "shop": {"marketing": {"max_count": 10, "time_window_seconds": 60}, "news": None},
+        "bank": {"alerts": {"max_count": 5, "time_window_seconds": 1, "on_limit": "reject"}},
+    })
+
+    assert tenants.tenants == ("shop", "bank")
+    assert tenants.config_for(None) is default
+    assert tenants.get_rule("shop", "marketing").max_count == 10
+    assert tenants.get_rule("shop", "news") is None
+    assert tenants.get_rule("shop", "status") == default.get_rule("status")
+    assert tenants.get_rule("bank", "alerts").time_window_seconds == 1
+    assert tenants.get_rule(None, "alerts") is None
+    # Overrides never leak into the default rules.
+    assert default.get_rule("marketing").max_count == 3
+    assert default.get_rule("news") is not None
+
+
+def test_tenant_rule_sets_reject_unknown_and_invalid_tenants():
+    tenants = TenantRuleSets(RateLimitConfig(), {"shop": {}})
+
+    assert "shop" in tenants and None in tenants and "bank" not in tenants
+    with pytest.raises(ValueError, match="Unknown tenant"):
+        tenants.config_for("bank")
+    with pytest.raises(ValueError, match="Invalid tenant id"):
+        TenantRuleSets(RateLimitConfig(), {"a b": {}})
+    with pytest.raises(ValueError, match="max_count"):
+        TenantRuleSets(RateLimitConfig(), {"shop": {"news": {"max_count": 0, "time_window_seconds": 1}}})
+
+
+def test_tenant_key_prefix_hash_tags_tenant_keys():
+    assert tenant_key_prefix("ratelimit", None) == "ratelimit"
+    assert tenant_key_prefix("ratelimit", "shop") == "{shop}:ratelimit"
+
+
+def _processor(tenant_id=None, tenants=None):
+    service = MagicMock()
+    service.send = AsyncMock(return_value=True)
+    return MessageProcessor(service, tenant_id=tenant_id, tenants=tenants)
+
+
+@pytest.mark.asyncio
+async def test_messages_are_routed_to_their_tenant():
+    shop = _processor("shop")
+    default = _processor(tenants={"shop": shop})
+
+    await default.handle({"user_id": "u1", "type": "news", "message": "hi", "tenant_id": "shop"})
+    await default.handle({"user_id": "u2", "type": "news", "message": "hi"})
+
+    shop.service.send.assert_awaited_once_with(user_id="u1", notification_type="news", message="hi")
+    default.service.send.assert_awaited_once_with(user_id="u2", notification_type="news", message="hi")
+
+
+@pytest.mark.asyncio
+async def test_unknown_tenant_is_a_permanent_error():
+    default = _processor()
+
+    with pytest.raises(ValueError, match="Unknown tenant"):
+        await default.handle({"user_id": "u1", "type": "news", "message": "hi", "tenant_id": "bank"})
+    default.service.send.assert_not_awaited()
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    client = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_tenant_limiters_use_their_rules_and_keys(redis_client):
+    prefix = f"test-tenants-{uuid.uuid4().hex}"
+    tenants = TenantRuleSets(RateLimitConfig(), {"shop": {"news": {"max_count": 2, "time_window_seconds": 60}}})
+    default = RedisRateLimiter(redis_client, tenants.config_for(None), key_prefix=prefix)
+    shop = RedisRateLimiter(
+        redis_client, tenants.config_for("shop"), key_prefix=tenant_key_prefix(prefix, "shop")
+    )
+    try:
+        default_decisions = [await default.hit("u1", "news") for _ in range(2)]
+        shop_decisions = [await shop.hit("u1", "news") for _ in range(3)]
+
+        assert [d.allowed for d in default_decisions] == [True, False]
+        assert [d.allowed for d in shop_decisions] == [True, True, False]
+        assert shop.key("u1") == f"{{shop}}:{prefix}:u1"
+        _, default_keys = await redis_client.scan(match=f"{prefix}:*", count=1000)
+        assert default_keys and all(not key.startswith("{") for key in default_keys)
+    finally:
+        for limiter in (default, shop):
+            await redis_client.delete(limiter.key("u1"))
+
+
+def test_heavy_hitters_count_tenants_separately():
+    tenants = TenantRuleSets(RateLimitConfig(), {"shop": {"status": {"max_count": 10, "time_window_seconds": 60}}})
+    tracker = HeavyHitterTracker(tenants.default, window_seconds=60, clock=lambda: 120.0, tenants=tenants)
+
+    for _ in range(3):
+        tracker.observe("u1", "status", "shop")
+    tracker.observe("u1", "status")
+
+    top = tracker.top()
+    assert [(h.tenant_id, h.user_id, h.count, h.limit) for h in top] == [
+        ("shop", "u1", 3, 20),
+        (None, "u1", 1, 4),
+    ]
+
+
+def test_tenant_digest_rules_are_reported_as_disabled(monkeypatch, caplog):
+    import app.main as main
+
+    default = RateLimitConfig()
+    default.add_rule(
+        RateLimitRule(type="marketing", max_count=1, time_window_seconds=3600, on_limit="digest"),
+        overwrite=True,
+    )
+    monkeypatch.setattr(main, "tenant_rule_sets", TenantRuleSets(default, {"shop": {}}))
+
+    with caplog.at_level("WARNING", logger="app.main"):
+        processor = main.build_tenant_processor(MagicMock(), MagicMock(), "shop")
+
+    assert processor.service.digest_buffer is None
+    assert [r.event for r in caplog.records] == ["startup.tenant_digests_disabled"]
+    assert "marketing" in caplog.records[0].getMessage()
@@ -0,0 +1,170 @@
+"""Tests for the transport abstraction and the in-process transport."""
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.messages import MessageProcessor
+from app.core.transport import InProcessTransport, RabbitMQTransport
+from app.main import app, get_in_process_transport
+
+
+def _processor(handle=None):
+    processor = MagicMock()
+    processor.handle = handle or AsyncMock()
+    processor.warmup = AsyncMock(return_value=True)
+    return processor
+
+
+async def _run_until_idle(transport):
+    """Start the transport, wait for its queue to empty, then stop it."""
+    stop = asyncio.Event()
+    task = asyncio.create_task(transport.run(stop))
+    await asyncio.wait_for(transport._queue.join(), timeout=1)
+    stop.set()
+    await asyncio.wait_for(task, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_in_process_hands_payload_over_without_serializing():
+    processor = _processor()
+    transport = InProcessTransport(processor, concurrency=2)
+    payload = {"user_id": "u1", "type": "news", "message": "hi"}
+    
+    await transport.submit(payload)
+    await _run_until_idle(transport)
+    
+    assert processor.handle.await_args.args[0] is payload
+    assert transport.status()["processed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_in_process_queue_applies_backpressure():
+    transport = InProcessTransport(_processor(), max_size=1)
+    
+    transport.submit_nowait({"user_id": "u1"})
+    
+    with pytest.raises(asyncio.QueueFull):
+        transport.submit_nowait({"user_id": "u2"})
+    with pytest.raises(asyncio.TimeoutError):
+        await transport.submit({"user_id": "u2"}, timeout=0.01)
+    assert transport.status()["queued"] == 1
+
+
+@pytest.mark.asyncio
+async def test_in_process_retries_transient_failures():
+    processor = _processor(AsyncMock(side_effect=[RuntimeError("gateway down"), None]))
+    transport = InProcessTransport(processor, retry_delays_seconds=(0,))
+    stop = asyncio.Event()
+    task = asyncio.create_task(transport.run(stop))
+    
+    await transport.submit({"user_id": "u1"})
+    while transport.processed == 0:
+        await asyncio.sleep(0.001)
+    stop.set()
+    await task
+    
+    assert processor.handle.await_count == 2
+    assert transport.dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_in_process_drops_permanent_failures_and_exhausted_retries():
+    processor = _processor(AsyncMock(side_effect=[KeyError("user_id"), RuntimeError("down"), RuntimeError("down")]))
+    transport = InProcessTransport(processor, retry_delays_seconds=(0,), max_retries=1)
+    stop = asyncio.Event()
+    task = asyncio.create_task(transport.run(stop))
+    
+    await transport.submit({"bad": True})
+    await transport.submit({"user_id": "u1"})
+    while transport.dropped < 2:
+        await asyncio.sleep(0.001)
+    stop.set()
+    await task
+    
+    assert processor.handle.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_in_process_drains_queue_and_refuses_new_work_on_stop():
+    processor = _processor()
+    transport = InProcessTransport(processor, concurrency=1)
+    for i in range(5):
+        transport.submit_nowait({"user_id": f"u{i}"})
+    stop = asyncio.Event()
+    stop.set()
+    
+    await transport.run(stop)
+    
+    assert processor.handle.await_count == 5
+    assert transport.status()["state"] == "stopped"
+    with pytest.raises(RuntimeError):
+        transport.submit_nowait({"user_id": "late"})
+
+
+@pytest.mark.asyncio
+async def test_rabbitmq_transport_stops_supervisor_on_its_thread():
+    supervisor = MagicMock()
+    stopped = threading.Event()
+    supervisor.run.side_effect = stopped.wait
+    supervisor.stop.side_effect = stopped.set
+    supervisor.consumer.last_drain_seconds = 0.1
+    transport = RabbitMQTransport(supervisor, join_timeout_seconds=1)
+    stop = asyncio.Event()
+    
+    task = asyncio.create_task(transport.run(stop))
+    await asyncio.sleep(0.01)
+    stop.set()
+    await asyncio.wait_for(task, timeout=2)
+    
+    supervisor.run.assert_called_once()
+    supervisor.stop.assert_called_once()
+    
+    await transport.close()
+    supervisor.consumer.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_in_process_close_closes_each_shared_gateway_once():
+    gateway = MagicMock(close=AsyncMock())
+    tenant = MessageProcessor(MagicMock(gateway=gateway), tenant_id="shop")
+    processor = MessageProcessor(MagicMock(gateway=gateway), tenants={"shop": tenant})
+    
+    await InProcessTransport(processor).close()
+    
+    gateway.close.assert_awaited_once()
+
+
+def test_submit_endpoint_queues_notification(client):
+    transport = InProcessTransport(_processor())
+    app.dependency_overrides[get_in_process_transport] = lambda: transport
+    try:
+        response = client.post("/notifications", json={"user_id": "u1", "type": "news", "message": "hi"})
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 202
+    assert transport.status()["queued"] == 1
+
+
+def test_submit_endpoint_rejects_when_queue_is_full(client, monkeypatch):
+    from app.config import settings
+    
+    monkeypatch.setattr(settings, "INPROCESS_SUBMIT_TIMEOUT_SECONDS", 0.01)
+    transport = InProcessTransport(_processor(), max_size=1)
+    transport.submit_nowait({"user_id": "u0"})
+    app.dependency_overrides[get_in_process_transport] = lambda: transport
+    try:
+        response = client.post("/notifications", json={"user_id": "u1", "type": "news", "message": "hi"})
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_submit_endpoint_requires_in_process_transport(client):
+    response = client.post("/notifications", json={"user_id": "u1", "type": "news", "message": "hi"})
+    
+    assert response.status_code == 503
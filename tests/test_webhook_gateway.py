@@ -0,0 +1,132 @@
+"""Tests for the HTTP webhook gateway."""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.adapters.webhook_gateway import WebhookGateway, parse_retry_after
+from app.core.gateway import GatewayThrottledError, GatewayUnavailableError, Notification
+from app.core.rate_control import PacedGateway
+from app.core.routing import GatewayRegistry
+
+
+def _notification(user_id="u1"):
+    return Notification(user_id=user_id, notification_type="news", message="hi")
+
+
+def _gateway(handler, **kwargs):
+    kwargs.setdefault("url", "https://hooks.example.com/{notification_type}")
+    return WebhookGateway(transport=httpx.MockTransport(handler), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_webhook_posts_notification_as_json():
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(204)
+    
+    gateway = _gateway(handler)
+    
+    assert await gateway.send(_notification()) is True
+    assert str(requests[0].url) == "https://hooks.example.com/news"
+    assert json.loads(requests[0].content) == {"user_id": "u1", "type": "news", "message": "hi"}
+    await gateway.close()
+
+
+@pytest.mark.asyncio
+async def test_webhook_escapes_url_values_and_closes_through_the_registry():
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(204)
+    
+    gateway = _gateway(handler, url="https://hooks.example.com/{notification_type}/{user_id}")
+    registry = GatewayRegistry({"webhook": PacedGateway(gateway)}, default_channels=["webhook"])
+    
+    assert await registry.send(_notification("../admin?x=1#")) is True
+    assert requests[0].url.raw_path == b"/news/..%2Fadmin%3Fx%3D1%23"
+    client = gateway.client
+    await registry.close()
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, headers, error, retry_after", [
+    (429, {"Retry-After": "7"}, GatewayThrottledError, 7.0),
+    (503, {}, GatewayThrottledError, None),
+    (502, {}, GatewayUnavailableError, None),
+    (408, {}, GatewayUnavailableError, None),
+])
+async def test_webhook_classifies_retryable_responses(status, headers, error, retry_after):
+    gateway = _gateway(lambda request: httpx.Response(status, headers=headers))
+    
+    with pytest.raises(error) as raised:
+        await gateway.send(_notification())
+    
+    if error is GatewayThrottledError:
+        assert raised.value.retry_after == retry_after
+
+
+@pytest.mark.asyncio
+async def test_webhook_returns_false_for_rejected_payload():
+    gateway = _gateway(lambda request: httpx.Response(400, text="bad user"))
+    
+    assert await gateway.send(_notification()) is False
+
+
+@pytest.mark.asyncio
+async def test_webhook_wraps_transport_errors_as_unavailable():
+    def handler(request):
+        raise httpx.ConnectTimeout("timed out", request=request)
+    
+    with pytest.raises(GatewayUnavailableError):
+        await _gateway(handler).send(_notification())
+
+
+@pytest.mark.asyncio
+async def test_webhook_caps_concurrent_requests_per_host():
+    active = 0
+    peak = 0
+    
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200)
+    
+    gateway = _gateway(handler, max_per_host=3)
+    
+    results = await asyncio.gather(*(gateway.send(_notification(str(i))) for i in range(10)))
+    
+    assert all(results)
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_webhook_batch_posts_one_request_with_per_item_results():
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"results": [True, False]})
+    
+    gateway = _gateway(handler, batch_url="https://hooks.example.com/batch")
+    
+    results = await gateway.send_batch([_notification("u1"), _notification("u2")])
+    
+    assert results == [True, False]
+    assert len(requests) == 1
+    assert [item["user_id"] for item in json.loads(requests[0].content)] == ["u1", "u2"]
+
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None